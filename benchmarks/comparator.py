@@ -0,0 +1,83 @@
+"""
+Comparing many supplier snapshots with `ViaComComparator`.
+
+    AVIASALES_EXECUTOR_PROCESSES=4 PYTHONPATH=src python -m benchmarks.comparator --files 12 --itineraries 2000
+
+"sequential" is the previous path: every file is parsed in turn, each
+processor is asked for its routes, and the routes unique to a file are
+found with `set.difference` against every other file. "parallel" reads
+the files in `AVIASALES_EXECUTOR_PROCESSES` worker processes, in the
+calling thread without them, and counts routes once; "cached" runs the
+same comparison again, with the facts of every file memoized.
+"""
+
+import argparse
+import tempfile
+import time
+from collections import deque
+from contextlib import ExitStack
+from itertools import islice
+from pathlib import Path
+
+from fastapi import UploadFile
+
+from api.caches import diff_facts, parsers
+from api.executors import start_processes
+from api.processors import ViaComDiffProcessor, ViaComParser
+from api.services import ViaComComparator
+from benchmarks.synthetic import RS_VIA_3, RS_VIA_OW, enlarge
+
+
+def sequential(files: list[UploadFile]) -> list[set[tuple[str, ...]]]:
+    processors = [ViaComDiffProcessor(ViaComParser(file)) for file in files]
+    return_itineraries = all(processor.is_roundtrip() is not False for processor in processors)
+    itineraries = deque([processor.unique_itineraries(return_itineraries) for processor in processors])
+
+    unique = []
+    for processor in processors:
+        processor.ticket_types()
+        unique.append(itineraries[0].difference(*list(islice(itineraries, 1, None))))
+        itineraries.rotate(-1)
+    return unique
+
+
+def parallel(files: list[UploadFile]) -> list[set[tuple[str, ...]]]:
+    compared = ViaComComparator(*files)
+    return list(compared._get_diff_itineraries())
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--files", type=int, default=12)
+    arguments.add_argument("--itineraries", type=int, default=2_000)
+    options = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        files = []
+        for number in range(options.files):
+            # Different sizes, so that every snapshot has its own content
+            source = RS_VIA_3 if number % 2 else RS_VIA_OW
+            path = enlarge(source, Path(directory) / f"{number}.xml", options.itineraries + number)
+            files.append(UploadFile(file=stack.enter_context(open(path, "rb")), filename=path.name))
+
+        def reset() -> None:
+            for file in files:
+                file.file.seek(0)
+
+        expected = sequential(files)
+        reset()
+        start_processes()
+
+        print(f"{'path':<12} {'files':>6} {'time, s':>8}")
+        for name, run in (("sequential", sequential), ("parallel", parallel), ("cached", parallel)):
+            if name != "cached":
+                parsers.clear()
+                diff_facts.clear()
+            started = time.perf_counter()
+            assert run(files) == expected
+            print(f"{name:<12} {len(files):>6} {time.perf_counter() - started:>8.2f}")
+            reset()
+
+
+if __name__ == "__main__":
+    main()
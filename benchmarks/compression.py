@@ -0,0 +1,97 @@
+"""
+Raw and compressed uploads and responses of `/itineraries/all`.
+
+    PYTHONPATH=src python -m benchmarks.compression --itineraries 5000 --bandwidth 100
+
+"decode" is the decompression of the request body alone, as
+`DecompressionMiddleware` does it while the body is received. The
+requests upload RS_Via-3.xml scaled to `--itineraries`, raw, gzipped
+and with zstd when `zstandard` is installed, and ask for a response
+as is or gzipped. Throughput is of the uncompressed XML; "wire" adds
+the time to send the request and response bodies over a link of
+`--bandwidth` Mbit/s to the server time. Scaled responses repeat the
+same itineraries, so they compress far better than real ones: the
+multipart upload of RS_Via-3.xml itself shrinks 65 times with gzip.
+"""
+
+import argparse
+import gzip
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import httpx
+from fastapi.testclient import TestClient
+from main import app
+
+from api.caches import parsers
+from benchmarks.synthetic import RS_VIA_3, enlarge
+from core.uploads import DECODERS
+
+
+URL = "/api/v1/via/itineraries/all"
+
+
+def compressors() -> dict[str, Callable[[bytes], bytes]]:
+    found: dict[str, Callable[[bytes], bytes]] = {"identity": lambda body: body, "gzip": gzip.compress}
+    if "zstd" in DECODERS:
+        import zstandard
+
+        found["zstd"] = zstandard.ZstdCompressor().compress
+    return found
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=5_000)
+    arguments.add_argument("--bandwidth", type=float, default=100.0, help="Mbit/s")
+    options = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        xml = enlarge(RS_VIA_3, Path(directory) / "RS_Via-3.xml", options.itineraries).read_bytes()
+    request = httpx.Request("POST", URL, files={"xml_file": ("RS_Via-3.xml", xml, "text/xml")})
+    body, content_type = request.read(), request.headers["content-type"]
+    megabytes = len(xml) / 2**20
+    print(f"{options.itineraries} itineraries, {megabytes:.1f} MiB of XML")
+
+    bodies = {}
+    print(f"\n{'encoding':<10} {'size, MiB':>10} {'ratio':>6} {'decode, s':>10} {'MiB/s':>7}")
+    for encoding, compress in compressors().items():
+        bodies[encoding] = compress(body)
+        elapsed = 0.0
+        if encoding != "identity":
+            decoder = DECODERS[encoding]()
+            started = time.perf_counter()
+            for _ in decoder.decode(bodies[encoding]):
+                pass
+            decoder.finish()
+            elapsed = time.perf_counter() - started
+        throughput = f"{megabytes / elapsed:>7.0f}" if elapsed else f"{'':>7}"
+        size = len(bodies[encoding])
+        print(f"{encoding:<10} {size / 2**20:>10.2f} {len(body) / size:>6.1f} {elapsed:>10.3f} {throughput}")
+
+    client = TestClient(app)
+    print(
+        f"\n{'upload':<10} {'response':<10} {'server, s':>10} {'MiB/s':>7} {'sent, MiB':>10}"
+        f" {'received, MiB':>14} {'wire, s':>8}"
+    )
+    for encoding, content in bodies.items():
+        for accept in ("identity", "gzip"):
+            parsers.clear()  # every request parses its upload
+            headers = {"content-type": content_type, "content-encoding": encoding, "accept-encoding": accept}
+            started = time.perf_counter()
+            with client.stream("POST", URL, content=content, headers=headers) as response:
+                received = sum(len(chunk) for chunk in response.iter_raw())
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+
+            wire = elapsed + (len(content) + received) * 8 / (options.bandwidth * 10**6)
+            print(
+                f"{encoding:<10} {accept:<10} {elapsed:>10.3f} {megabytes / elapsed:>7.1f}"
+                f" {len(content) / 2**20:>10.2f} {received / 2**20:>14.2f} {wire:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
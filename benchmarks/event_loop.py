@@ -0,0 +1,90 @@
+"""
+Latency of small requests while large uploads are being processed.
+
+    PYTHONPATH=src python -m benchmarks.event_loop --itineraries 10000 --uploads 2
+
+The same load runs twice in fresh processes: with parsing on the event
+loop (`AVIASALES_EXECUTOR_WORKERS=0`) and dispatched to the thread pool.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import RS_VIA_OW, enlarge
+
+
+INTERVAL = 0.005  # seconds between small requests
+
+
+def percentile(values: list[float], percent: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[int(percent) - 1]
+
+
+async def load(large: bytes, uploads: int) -> tuple[list[float], float]:
+    import httpx
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        small = RS_VIA_OW.read_bytes()
+        handle = await client.post("/api/v1/via/responses", files={"xml_file": ("small.xml", small, "text/xml")})
+        small_url = f"/api/v1/via/responses/{handle.json()['id']}"
+
+        async def upload(number: int) -> None:
+            files = {"xml_file": (f"large-{number}.xml", large, "text/xml")}
+            response = await client.post("/api/v1/via/itineraries/cheapest", files=files)
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        jobs = asyncio.gather(*(upload(number) for number in range(uploads)))
+        latencies = []
+
+        # Requests follow a fixed schedule and latency counts from the planned send
+        # time, so the time a blocked event loop delays them is not hidden
+        while not jobs.done():
+            scheduled = started + len(latencies) * INTERVAL
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            (await client.get(small_url)).raise_for_status()
+            latencies.append(time.perf_counter() - scheduled)
+
+        await jobs
+        return latencies, time.perf_counter() - started
+
+
+def measure(path: Path, uploads: int, workers: int) -> tuple[list[float], float]:
+    os.environ["AVIASALES_EXECUTOR_WORKERS"] = str(workers)
+    os.environ["AVIASALES_PARSE_CACHE_MAX_BYTES"] = "0"  # every upload is parsed
+    return asyncio.run(load(path.read_bytes(), uploads))
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=10_000)
+    arguments.add_argument("--uploads", type=int, default=2)
+    arguments.add_argument("--workers", type=int, default=4)
+    options = arguments.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        path = enlarge(RS_VIA_OW, Path(directory) / "RS_ViaOW.xml", options.itineraries)
+        print(f"{options.uploads} concurrent uploads of {path.stat().st_size / 2**20:.1f} MiB")
+        print(f"{'mode':<14} {'requests':>8} {'p50, ms':>8} {'p99, ms':>8} {'max, ms':>8} {'uploads, s':>10}")
+
+        for mode, workers in (("event loop", 0), ("thread pool", options.workers)):
+            with context.Pool(1) as pool:
+                latencies, elapsed = pool.apply(measure, (path, options.uploads, workers))
+            milliseconds = [latency * 1000 for latency in latencies]
+            print(
+                f"{mode:<14} {len(milliseconds):>8} {percentile(milliseconds, 50):>8.1f} "
+                f"{percentile(milliseconds, 99):>8.1f} {max(milliseconds):>8.1f} {elapsed:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Peak RSS of the tree parser versus the streaming parser.
+
+    PYTHONPATH=src python -m benchmarks.memory --itineraries 50000
+
+Every measurement runs in a fresh process, because `ru_maxrss` never goes down.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi import UploadFile
+
+from benchmarks.synthetic import RS_VIA_3, enlarge
+
+
+OPERATIONS = {
+    "all_itineraries": lambda processor: sum(1 for _ in processor.all_itineraries()),
+    "cheapest_itinerary": lambda processor: processor.cheapest_itinerary(),
+    "unique_itineraries": lambda processor: processor.unique_itineraries(return_itineraries=True),
+}
+
+
+def measure(path: Path, mode: str, operation: str) -> tuple[float, float]:
+    from api.processors import (
+        ViaComDataProcessor,
+        ViaComDiffProcessor,
+        ViaComParser,
+        ViaComStreamDataProcessor,
+        ViaComStreamDiffProcessor,
+        ViaComStreamParser,
+    )
+
+    diff = operation == "unique_itineraries"
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+
+    with open(path, "rb") as f:
+        xml_file = UploadFile(file=f, filename=path.name)
+        if mode == "tree":
+            parser = ViaComParser(xml_file)
+            processor = ViaComDiffProcessor(parser) if diff else ViaComDataProcessor(parser)
+        else:
+            stream = ViaComStreamParser(xml_file)
+            processor = ViaComStreamDiffProcessor(stream) if diff else ViaComStreamDataProcessor(stream)
+        OPERATIONS[operation](processor)
+
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return peak / 1024, elapsed  # ru_maxrss is in KiB on Linux
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=20_000)
+    options = arguments.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        path = enlarge(RS_VIA_3, Path(directory) / "RS_Via-3.xml", options.itineraries)
+        print(f"{path.stat().st_size / 2**20:.1f} MiB, {options.itineraries} itineraries")
+        print(f"{'operation':<20} {'mode':<8} {'peak RSS, MiB':>14} {'time, s':>9}")
+
+        for operation in OPERATIONS:
+            for mode in ("tree", "stream"):
+                with context.Pool(1) as pool:
+                    peak, elapsed = pool.apply(measure, (path, mode, operation))
+                print(f"{operation:<20} {mode:<8} {peak:>14.1f} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
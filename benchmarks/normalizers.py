@@ -0,0 +1,78 @@
+"""
+Normalizers fed one value at a time and in batches.
+
+    PYTHONPATH=src python -m benchmarks.normalizers --values 100000
+
+`ExponentialMovingAverage` is the normalizer optimal scoring used
+before: Decimal arithmetic, one value at a time. The running
+normalizers take floats, either one by one (`update`) or as arrays
+of `--batch` values (`update_many`), and normalize whole arrays.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from decimal import Decimal
+
+import numpy as np
+import numpy.typing as npt
+
+from core.normalizers import ExponentialMovingAverage, RunningMeanVariance, RunningMinMax, SlidingWindowQuantile
+
+
+def ema(values: npt.NDArray[np.float64], batch: int) -> None:
+    normalizer = ExponentialMovingAverage(alpha=Decimal("0.1"))
+    for value in values.tolist():
+        decimal = Decimal(str(value))
+        normalizer.update(decimal)
+        normalizer.normalize(decimal)
+
+
+def one_by_one(factory: Callable[[], RunningMinMax | RunningMeanVariance | SlidingWindowQuantile]):
+    def run(values: npt.NDArray[np.float64], batch: int) -> None:
+        normalizer = factory()
+        for value in values.tolist():
+            normalizer.update(value)
+        normalizer.normalize(values)
+
+    return run
+
+
+def batched(factory: Callable[[], RunningMinMax | RunningMeanVariance | SlidingWindowQuantile]):
+    def run(values: npt.NDArray[np.float64], batch: int) -> None:
+        normalizer = factory()
+        for start in range(0, len(values), batch):
+            normalizer.update_many(values[start : start + batch])
+        normalizer.normalize(values)
+
+    return run
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--values", type=int, default=100_000)
+    arguments.add_argument("--batch", type=int, default=1_000)
+    arguments.add_argument("--window", type=int, default=10_000)
+    options = arguments.parse_args()
+
+    values = np.random.default_rng(0).lognormal(10, 0.5, size=options.values)
+    cases = {
+        "ema": ema,
+        "minmax": one_by_one(RunningMinMax),
+        "minmax batch": batched(RunningMinMax),
+        "welford": one_by_one(RunningMeanVariance),
+        "welford batch": batched(RunningMeanVariance),
+        "quantile": one_by_one(lambda: SlidingWindowQuantile(options.window)),
+        "quantile batch": batched(lambda: SlidingWindowQuantile(options.window)),
+    }
+
+    print(f"{'normalizer':<16} {'time, s':>8} {'values/s':>12}")
+    for name, run in cases.items():
+        started = time.perf_counter()
+        run(values, options.batch)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<16} {elapsed:>8.3f} {len(values) / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Building a `ListItineraries` response from parsed elements.
+
+    PYTHONPATH=src python -m benchmarks.responses --itineraries 10000
+
+"roundtrip" is the first path: the elements are copied into a new
+tree, serialized with `ET.tostring`, parsed back by pydantic-xml, then
+dumped, re-validated and encoded by FastAPI. "records" reads the
+elements into slotted records and builds the models from them without
+validation, then serializes the model once.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections.abc import Callable
+from copy import deepcopy
+from pathlib import Path
+
+import lxml.etree as ET
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from api.processors import ViaComDataProcessor, ViaComParser
+from api.serializers import PydanticJSONResponse, itineraries_to_schema
+from benchmarks.synthetic import RS_VIA_3, enlarge
+from core.schemas.itineraries import ListItineraries
+
+
+def roundtrip(itineraries: list[ET._Element]) -> bytes:
+    tree = ListItineraries().to_xml_tree()
+    for itinerary in itineraries:
+        tree.append(deepcopy(itinerary))  # type: ignore
+    model = ListItineraries.from_xml(ET.tostring(tree))  # type: ignore
+
+    field = create_response_field(name="response", type_=ListItineraries)
+    content = asyncio.run(serialize_response(field=field, response_content=model, is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def records(itineraries: list[ET._Element]) -> bytes:
+    return PydanticJSONResponse(itineraries_to_schema(itineraries)).body
+
+
+def timeit(func: Callable[[list[ET._Element]], bytes], itineraries: list[ET._Element], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(itineraries)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=10_000)
+    arguments.add_argument("--repeat", type=int, default=3)
+    options = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = enlarge(RS_VIA_3, Path(directory) / "RS_Via-3.xml", options.itineraries)
+        with open(path, "rb") as f:
+            itineraries = ViaComDataProcessor(ViaComParser(UploadFile(file=f))).all_itineraries()
+
+    assert roundtrip(itineraries[:50]) == records(itineraries[:50])
+
+    print(f"{'path':<10} {'time, s':>8} {'itineraries/s':>14}")
+    for func in (roundtrip, records):
+        elapsed = timeit(func, itineraries, options.repeat)
+        print(f"{func.__name__:<10} {elapsed:>8.2f} {len(itineraries) / elapsed:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
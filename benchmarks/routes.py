@@ -0,0 +1,79 @@
+"""
+Route queries of `/itineraries/specified` over many source/destination pairs.
+
+    PYTHONPATH=src python -m benchmarks.routes --itineraries 2000
+
+"xpath" is the previous path: an XPath built per request and evaluated
+over every itinerary. "index" intersects the position sets of the route
+index built while parsing. Every pair of airports in the response is
+queried with each combination of the `direct` and `transit` flags.
+"""
+
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from itertools import product
+from pathlib import Path
+
+import lxml.etree as ET
+from fastapi import UploadFile
+
+from api.processors import ViaComParser
+from benchmarks.synthetic import RS_VIA_3, RS_VIA_OW, enlarge
+
+
+Query = tuple[str, str, bool, bool]
+
+
+def xpath(parser: ViaComParser, query: Query) -> list[ET._Element]:
+    source, destination, direct, transit = query
+    if transit:
+        request = 'PricedItineraries/Flights[.//Source="{0}" and .//Destination="{1}" {2}]'
+    else:
+        request = 'PricedItineraries/Flights[.//Flight[1]/Source="{0}" and .//Flight[last()]/Destination="{1}" {2}]'
+    direct_flights_filter = """
+        and ((./ReturnPricedItinerary and count(./OnwardPricedItinerary/Flights/Flight) = 1
+              and count(./ReturnPricedItinerary/Flights/Flight) = 1)
+             or count(./OnwardPricedItinerary/Flights/Flight) = 1)
+    """
+    return parser.XML.xpath(request.format(source, destination, direct_flights_filter if direct else ""))
+
+
+def index(parser: ViaComParser, query: Query) -> list[ET._Element]:
+    return [parser.index.elements[position] for position in parser.index.search(*query)]
+
+
+def timeit(
+    func: Callable[[ViaComParser, Query], list[ET._Element]], parser: ViaComParser, queries: list[Query]
+) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        func(parser, query)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=2_000)
+    options = arguments.parse_args()
+
+    print(f"{'response':<12} {'path':<8} {'queries':>8} {'time, s':>8} {'queries/s':>10}")
+    for source in (RS_VIA_3, RS_VIA_OW):
+        with tempfile.TemporaryDirectory() as directory:
+            path = enlarge(source, Path(directory) / source.name, options.itineraries)
+            with open(path, "rb") as f:
+                parser = ViaComParser(UploadFile(file=f))
+
+        airports = parser.index.airports.values
+        queries = list(product(airports, airports, (False, True), (False, True)))
+        assert all(xpath(parser, query) == index(parser, query) for query in queries[:: len(queries) // 20 or 1])
+
+        for func in (xpath, index):
+            elapsed = timeit(func, parser, queries)
+            rate = len(queries) / elapsed
+            print(f"{source.name:<12} {func.__name__:<8} {len(queries):>8} {elapsed:>8.2f} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
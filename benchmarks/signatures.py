@@ -0,0 +1,69 @@
+"""
+Reading the routes of `/itineraries/difference` from a parsed response.
+
+    PYTHONPATH=src python -m benchmarks.signatures --itineraries 5000
+
+"xpath" is the previous path: `//Flights`, which matches segment lists
+as well as itineraries, then four XPath queries per match building
+"SRC-DST" strings. "signatures" reads the interned route signatures
+of the index, so only the distinct routes are turned into strings.
+"index" is the time to build the index itself, signatures included.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+from fastapi import UploadFile
+
+from api.indexes import ViaComItineraryIndex
+from api.processors import ViaComDiffProcessor, ViaComParser
+from benchmarks.synthetic import RS_VIA_3, RS_VIA_OW, enlarge
+
+
+def xpath(parser: ViaComParser) -> set[tuple[str, ...]]:
+    routes = set()
+    for itinerary in parser.XML.xpath("//Flights"):
+        for leg in ("OnwardPricedItinerary", "ReturnPricedItinerary"):
+            sources = itinerary.xpath(f".//{leg}/Flights/Flight/Source/text()")
+            destinations = itinerary.xpath(f".//{leg}/Flights/Flight/Destination/text()")
+            pairs = zip(sources, destinations, strict=True)
+            routes.add(tuple(f"{source}-{destination}" for source, destination in pairs))
+    routes.discard(tuple())
+    return routes
+
+
+def signatures(parser: ViaComParser) -> set[tuple[str, ...]]:
+    return ViaComDiffProcessor(parser).unique_itineraries(return_itineraries=True)
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--itineraries", type=int, default=5_000)
+    options = arguments.parse_args()
+
+    print(f"{'response':<12} {'path':<12} {'routes':>8} {'time, s':>8}")
+    for source in (RS_VIA_3, RS_VIA_OW):
+        with tempfile.TemporaryDirectory() as directory:
+            path = enlarge(source, Path(directory) / source.name, options.itineraries)
+            with open(path, "rb") as f:
+                parser = ViaComParser(UploadFile(file=f))
+
+        root: ET._Element = parser.XML
+        started = time.perf_counter()
+        ViaComItineraryIndex.from_xml(root)
+        print(f"{source.name:<12} {'index':<12} {'':>8} {time.perf_counter() - started:>8.3f}")
+
+        expected = xpath(parser)
+        for func in (xpath, signatures):
+            started = time.perf_counter()
+            routes = func(parser)
+            elapsed = time.perf_counter() - started
+            assert routes == expected
+            print(f"{source.name:<12} {func.__name__:<12} {len(routes):>8} {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Time and peak memory of parsing, every processor query, comparisons
+and endpoints, compared with a stored baseline.
+
+    PYTHONPATH=src python -m benchmarks.suite --itineraries 10000 100000
+    PYTHONPATH=src python -m benchmarks.suite --save  # updates the baseline
+    PYTHONPATH=src python -m benchmarks.suite --check  # exits with 1 on a regression
+
+Responses are `src/RS_Via-3.xml` and `src/RS_ViaOW.xml` scaled to the
+requested numbers of itineraries. Every case runs once in a fresh
+process: parsing and other setup happen first, then the case alone is
+timed and its peak RSS is measured over what the setup used.
+
+Results are compared with `benchmarks/baseline.json`, by case and
+number of itineraries; a case slower or bigger than the baseline by
+more than `--tolerance` is a regression. Baselines are only comparable
+on the machine they were recorded on.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from fastapi import UploadFile
+
+from benchmarks.synthetic import RS_VIA_3, RS_VIA_OW, enlarge
+
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+MIN_PEAK = 8.0  # MiB, smaller peaks are noise of the allocator
+
+Paths = dict[str, Path]
+Setup = Callable[[Paths], Callable[[], Any]]  # prepares a case, returns what is measured
+
+
+def upload(path: Path) -> UploadFile:
+    return UploadFile(file=open(path, "rb"), filename=path.name)  # noqa: SIM115, closed with the process
+
+
+def parse(paths: Paths, name: str = "roundtrip") -> Callable[[], Any]:
+    from api.processors import ViaComParser
+
+    return lambda: ViaComParser(upload(paths[name]))
+
+
+def query(method: str, *args: Any, **kwargs: Any) -> Setup:
+    def setup(paths: Paths) -> Callable[[], Any]:
+        from api.processors import ViaComDataProcessor, ViaComParser
+
+        processor = ViaComDataProcessor(ViaComParser(upload(paths["roundtrip"])))
+        return lambda: getattr(processor, method)(*args, **kwargs)
+
+    return setup
+
+
+def paginate(paths: Paths) -> Callable[[], Any]:
+    from api.processors import ViaComDataProcessor, ViaComParser
+
+    processor = ViaComDataProcessor(ViaComParser(upload(paths["roundtrip"])))
+    itineraries = processor.all_itineraries()
+    return lambda: processor.paginate(itineraries, sort_by="price", order="asc", limit=10, offset=0)
+
+
+def unique_itineraries(paths: Paths) -> Callable[[], Any]:
+    from api.processors import ViaComDiffProcessor, ViaComParser
+
+    processor = ViaComDiffProcessor(ViaComParser(upload(paths["roundtrip"])))
+    return lambda: processor.unique_itineraries(return_itineraries=True)
+
+
+def comparator(paths: Paths) -> Callable[[], Any]:
+    from api.services import ViaComComparator
+
+    return lambda: ViaComComparator(upload(paths["roundtrip"]), upload(paths["one_way"]))()
+
+
+def endpoint(url: str, *names: str) -> Setup:
+    def setup(paths: Paths) -> Callable[[], Any]:
+        from fastapi.testclient import TestClient
+        from main import app
+
+        client = TestClient(app)
+        fields = ["xml_file"] if len(names) == 1 else ["first_xml_file", "second_xml_file"]
+        files = {
+            field: (paths[name].name, paths[name].read_bytes(), "text/xml")
+            for field, name in zip(fields, names, strict=True)
+        }
+
+        def run() -> None:
+            response = client.post(url, files=files)
+            assert response.status_code == 200, response.text
+
+        return run
+
+    return setup
+
+
+CASES: dict[str, Setup] = {
+    "parse RS_Via-3": parse,
+    "parse RS_ViaOW": lambda paths: parse(paths, "one_way"),
+    "all_itineraries": query("all_itineraries"),
+    "specified_itineraries": query("specified_itineraries", "DXB", "BKK"),
+    "specified_itineraries transit": query("specified_itineraries", "DXB", "BKK", transit=True),
+    "optimal_itinerary": query("optimal_itinerary"),
+    "most_expensive_itinerary": query("most_expensive_itinerary"),
+    "cheapest_itinerary": query("cheapest_itinerary"),
+    "longest_itinerary": query("longest_itinerary"),
+    "shortest_itinerary": query("shortest_itinerary"),
+    "summary": query("summary"),
+    "paginate price top 10": paginate,
+    "unique_itineraries": unique_itineraries,
+    "comparator": comparator,
+    "POST /itineraries/all": endpoint("/api/v1/via/itineraries/all", "roundtrip"),
+    "POST /itineraries/specified": endpoint(
+        "/api/v1/via/itineraries/specified?source=DXB&destination=BKK", "roundtrip"
+    ),
+    "POST /itineraries/optimal": endpoint("/api/v1/via/itineraries/optimal", "roundtrip"),
+    "POST /itineraries/summary": endpoint("/api/v1/via/itineraries/summary", "roundtrip"),
+    "POST /itineraries/difference": endpoint("/api/v1/via/itineraries/difference", "roundtrip", "one_way"),
+}
+
+
+def measure(case: str, paths: Paths) -> tuple[float, float]:
+    run = CASES[case](paths)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return elapsed, peak / 1024  # ru_maxrss is in KiB on Linux
+
+
+def regressions(result: dict[str, float], baseline: dict[str, float] | None, tolerance: float) -> list[str]:
+    if baseline is None:
+        return []
+    found = []
+    if result["time"] > baseline["time"] * (1 + tolerance):
+        found.append("time")
+    if max(result["peak"], baseline["peak"]) > MIN_PEAK and result["peak"] > baseline["peak"] * (1 + tolerance):
+        found.append("peak")
+    return found
+
+
+def change(value: float, baseline: float | None) -> str:
+    return f"{(value / baseline - 1) * 100:+.0f}%" if baseline else ""
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument("--itineraries", type=int, nargs="+", default=[10_000])
+    arguments.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    arguments.add_argument("--baseline", type=Path, default=BASELINE)
+    arguments.add_argument("--tolerance", type=float, default=0.25)
+    arguments.add_argument("--save", action="store_true", help="write the results to the baseline")
+    arguments.add_argument("--check", action="store_true", help="exit with 1 if any case regressed")
+    options = arguments.parse_args()
+
+    stored = json.loads(options.baseline.read_text()) if options.baseline.exists() else {"results": {}}
+    context = multiprocessing.get_context("spawn")
+    failed = False
+
+    for itineraries in options.itineraries:
+        results = stored["results"].setdefault(str(itineraries), {}) if options.save else {}
+        baselines = stored["results"].get(str(itineraries), {})
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {
+                "roundtrip": enlarge(RS_VIA_3, Path(directory) / "RS_Via-3.xml", itineraries),
+                "one_way": enlarge(RS_VIA_OW, Path(directory) / "RS_ViaOW.xml", itineraries),
+            }
+            print(f"\n{itineraries} itineraries, {paths['roundtrip'].stat().st_size / 2**20:.1f} MiB RS_Via-3")
+            print(f"{'case':<32} {'time, s':>8} {'change':>7} {'peak, MiB':>10} {'change':>7}")
+
+            for case in options.cases:
+                with context.Pool(1) as pool:
+                    elapsed, peak = pool.apply(measure, (case, paths))
+
+                result = {"time": round(elapsed, 4), "peak": round(peak, 1)}
+                baseline = baselines.get(case)
+                regressed = regressions(result, baseline, options.tolerance)
+                failed = failed or bool(regressed)
+                print(
+                    f"{case:<32} {elapsed:>8.3f} {change(elapsed, baseline and baseline['time']):>7}"
+                    f" {peak:>10.1f} {change(peak, baseline and baseline['peak']):>7}"
+                    + (f"  regression: {', '.join(regressed)}" if regressed else "")
+                )
+                if options.save:
+                    results[case] = result
+
+    if options.save:
+        machine = f"{platform.machine()}, {multiprocessing.cpu_count()} CPU, Python {platform.python_version()}"
+        stored["machine"] = machine
+        options.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to {options.baseline}")
+    if options.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
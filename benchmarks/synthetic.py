@@ -0,0 +1,28 @@
+"""
+Synthetic supplier responses: the sample files repeated until they reach
+the requested number of itineraries, so benchmarks run on realistic
+structure at production sizes.
+"""
+
+import re
+from pathlib import Path
+
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+RS_VIA_3 = SRC_DIR / "RS_Via-3.xml"
+RS_VIA_OW = SRC_DIR / "RS_ViaOW.xml"
+
+_PRICED_ITINERARIES = re.compile(rb"(.*<PricedItineraries>)(.*)(</PricedItineraries>.*)", re.DOTALL)
+
+
+def enlarge(source: Path, target: Path, itineraries: int) -> Path:
+    head, body, tail = _PRICED_ITINERARIES.match(source.read_bytes()).groups()  # type: ignore
+    blocks = re.findall(rb"\s*<Flights>\s*<OnwardPricedItinerary>.*?</Pricing>\s*</Flights>", body, re.DOTALL)
+
+    with open(target, "wb") as f:
+        f.write(head)
+        for number in range(itineraries):
+            f.write(blocks[number % len(blocks)])
+        f.write(b"\n    " + tail)
+
+    return target
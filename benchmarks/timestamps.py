@@ -0,0 +1,61 @@
+"""
+Parsing the DepartureTimeStamp and ArrivalTimeStamp of every itinerary.
+
+    PYTHONPATH=src python -m benchmarks.timestamps --repeat 50
+
+Runs over the itineraries of `src/RS_Via-3.xml`, `--repeat` times.
+"strptime" is the previous path, `datetime.strptime` for every value.
+"fixed_width" is `parse_timestamp` with its memo cleared before every
+value, "memoized" keeps the memo, as the index and responses do.
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import lxml.etree as ET
+
+from benchmarks.synthetic import RS_VIA_3
+from core.types import TIMESTAMP_FORMAT, parse_timestamp
+
+
+def strptime(value: str) -> datetime:
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def fixed_width(value: str) -> datetime:
+    parse_timestamp.cache_clear()
+    return parse_timestamp(value)
+
+
+def memoized(value: str) -> datetime:
+    return parse_timestamp(value)
+
+
+def main() -> None:
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--repeat", type=int, default=50)
+    options = arguments.parse_args()
+
+    itineraries = [
+        [node.text for node in itinerary.iter("DepartureTimeStamp", "ArrivalTimeStamp")]
+        for itinerary in ET.parse(RS_VIA_3).getroot().iterfind("PricedItineraries/Flights")
+    ]
+    values = sum(len(timestamps) for timestamps in itineraries)
+    print(f"{len(itineraries)} itineraries, {values / len(itineraries):.1f} timestamps per itinerary")
+
+    print(f"{'path':<12} {'time, s':>8} {'us/itinerary':>13}")
+    for parse in (strptime, fixed_width, memoized):
+        parse_timestamp.cache_clear()
+        started = time.perf_counter()
+        for _ in range(options.repeat):
+            for timestamps in itineraries:
+                for value in timestamps:
+                    parse(value)
+        elapsed = time.perf_counter() - started
+        per_itinerary = elapsed / (options.repeat * len(itineraries)) * 1e6
+        print(f"{parse.__name__:<12} {elapsed:>8.3f} {per_itinerary:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
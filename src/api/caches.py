@@ -0,0 +1,139 @@
+import hashlib
+from collections.abc import Sequence
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import BinaryIO
+from uuid import uuid4
+
+from fastapi import UploadFile
+
+from api.executors import processes
+from api.processors import DiffFacts, ViaComDiffProcessor, ViaComParser, read_diff_facts, stream_diff_facts
+from api.snapshots import Snapshot, snapshots
+from core.caches import LRUCache
+from core.metrics import registry
+from core.settings import settings
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResponse:
+    id_: str
+    filename: str | None
+    size: int
+    digest: str
+    parser: ViaComParser
+
+
+parsers: LRUCache[str, ViaComParser] = LRUCache(max_bytes=settings.parse_cache_max_bytes, ttl=settings.parse_cache_ttl)
+responses: LRUCache[str, StoredResponse] = LRUCache(
+    max_bytes=settings.response_store_max_bytes, ttl=settings.response_store_ttl
+)
+diff_facts: LRUCache[str, DiffFacts] = LRUCache(max_bytes=settings.diff_cache_max_bytes, ttl=settings.diff_cache_ttl)
+
+cache_lookups = registry.counter("aviasales_cache_lookups_total", "Lookups of the in-process caches, by result.")
+cache_evictions = registry.counter("aviasales_cache_evictions_total", "Entries evicted to stay under the size limit.")
+cache_entries = registry.gauge("aviasales_cache_entries", "Entries held by the in-process caches.")
+cache_bytes = registry.gauge("aviasales_cache_bytes", "Size of the entries held by the in-process caches.")
+
+
+@registry.on_collect
+def collect_cache_stats() -> None:
+    caches: dict[str, LRUCache] = {"parsers": parsers, "responses": responses, "diff_facts": diff_facts}
+    for name, cache in caches.items():
+        cache_lookups.set(cache.hits, cache=name, result="hit")
+        cache_lookups.set(cache.misses, cache=name, result="miss")
+        cache_evictions.set(cache.evictions, cache=name)
+        cache_entries.set(len(cache), cache=name)
+        cache_bytes.set(cache.current_bytes, cache=name)
+
+
+def file_digest(file: BinaryIO, chunk_size: int = 2**16) -> tuple[str, int]:
+    digest = hashlib.blake2b(digest_size=32)
+    size = 0
+
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+
+    return digest.hexdigest(), size
+
+
+def parsed_size(size: int) -> int:
+    """Estimated memory of the tree and index parsed from `size` bytes of XML."""
+    return int(size * settings.parsed_size_factor)
+
+
+def cached_parser(xml_file: UploadFile) -> ViaComParser:
+    """
+    Identical uploads share one parsed tree and index. The cached
+    parser is read-only: callers must copy elements before moving
+    them into another tree.
+    """
+    key, size = file_digest(xml_file.file)
+
+    parser = parsers.get(key)
+    if parser is None:
+        parser = ViaComParser(xml_file)
+        parsers.set(key, parser, size=parsed_size(size))
+
+    return parser
+
+
+def store_response(xml_file: UploadFile) -> StoredResponse | None:
+    """`None` when the parsed response is larger than the whole store, it is not parsed then."""
+    digest, size = file_digest(xml_file.file)
+    if parsed_size(size) > responses.max_bytes:
+        return None
+    stored = StoredResponse(
+        id_=uuid4().hex, filename=xml_file.filename, size=size, digest=digest, parser=cached_parser(xml_file)
+    )
+    return stored if responses.set(stored.id_, stored, size=parsed_size(size)) else None
+
+
+def store_snapshot(search_key: str, xml_file: UploadFile) -> tuple[Snapshot | None, Snapshot]:
+    digest, _ = file_digest(xml_file.file)
+    parser = cached_parser(xml_file)
+    facts = ViaComDiffProcessor(parser).facts()
+    return snapshots.push(search_key, filename=xml_file.filename, digest=digest, facts=facts, index=parser.index)
+
+
+def cached_diff_facts(files: Sequence[UploadFile | StoredResponse | Snapshot]) -> list[DiffFacts]:
+    """
+    Facts of every file, by content. Uploads missing from the cache are
+    streamed, in parallel in worker processes when there are some, so no
+    tree is built or cached for them; stored responses are already
+    parsed, their facts are read in place. Snapshots keep their facts.
+    """
+    keys = [file.digest if isinstance(file, StoredResponse | Snapshot) else file_digest(file.file)[0] for file in files]
+    found: dict[str, DiffFacts] = {}
+    pending: dict[str, Future[DiffFacts]] = {}
+
+    for key, file in zip(keys, files, strict=True):
+        if key in found or key in pending:
+            continue
+        if isinstance(file, Snapshot):
+            found[key] = file.facts
+            continue
+
+        cached = diff_facts.get(key)
+        if cached is not None:
+            found[key] = cached
+            continue
+
+        if isinstance(file, StoredResponse):
+            found[key] = ViaComDiffProcessor(file.parser).facts()
+        elif processes is None:
+            found[key] = stream_diff_facts(file.file)
+        else:
+            pending[key] = processes.submit(read_diff_facts, file.file.read())
+            file.file.seek(0)
+            continue
+        diff_facts.set(key, found[key], size=found[key].size)
+
+    for key, future in pending.items():
+        found[key] = future.result()
+        diff_facts.set(key, found[key], size=found[key].size)
+
+    return [found[key] for key in keys]
@@ -1,102 +1,325 @@
+import time
+from collections.abc import AsyncIterator, Callable, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from fnmatch import fnmatch
-from typing import Literal
+from io import BytesIO
+from itertools import islice
+from typing import Annotated, Any, BinaryIO, Literal
 
 import lxml.etree as ET
-from fastapi import APIRouter, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Query, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 
-from api.processors import ViaComDataProcessor, ViaComParser
-from api.services import ViaComComparator
-from core.schemas.differences import ListItinerariesDiff
-from core.schemas.itineraries import ListItineraries
+from api.caches import StoredResponse, cached_parser, responses, store_response, store_snapshot
+from api.executors import threads
+from api.processors import ViaComDataProcessor, ViaComParser, ViaComStreamDataProcessor, ViaComStreamParser
+from api.serializers import NDJSON, PydanticJSONResponse, batch_to_schema, itineraries_to_schema, ndjson_lines
+from api.services import ViaComComparator, ViaComPriceComparator, ViaComSnapshotComparator
+from api.snapshots import snapshots
+from core.metrics import current_timings, record, registry, timed, timer
+from core.schemas.differences import ItinerariesPriceDiff, ListItinerariesDiff, SnapshotDiff
+from core.schemas.itineraries import BatchItineraries, ItinerariesSummary, ItineraryQuery, ListItineraries
+from core.schemas.responses import ResponseHandle
+from core.settings import settings
+from core.types import Normalization, SortKey, SortOrder
+from core.uploads import check_well_formed, sniff_root
 
 
-router = APIRouter()
+upload_bytes = registry.gauge("aviasales_upload_bytes", "Size of the files of the last multipart request.")
+parsed_itineraries = registry.gauge("aviasales_parsed_itineraries", "Itineraries of the last parsed upload.")
+
+
+async def record_upload(request: Request) -> None:
+    """
+    Multipart bodies are read and spooled before dependencies run, so
+    the time since the request started is spent receiving the upload.
+    """
+    timings = current_timings()
+    if timings is None or not request.headers.get("content-type", "").startswith("multipart/"):
+        return
+    record("upload", time.perf_counter() - timings.started)
+    form = await request.form()  # already parsed, starlette keeps it on the request
+    upload_bytes.set(sum(value.size or 0 for value in form.values() if not isinstance(value, str)))
+
+
+router = APIRouter(dependencies=[Depends(record_upload)])
+
+queries_adapter = TypeAdapter(list[ItineraryQuery])
+
+
+@dataclass
+class Pagination:
+    sort_by: SortKey | None = None
+    order: SortOrder = "asc"
+    limit: int | None = Query(None, ge=1)
+    offset: int = Query(0, ge=0)
+
+    @property
+    def end(self) -> int | None:
+        return None if self.limit is None else self.offset + self.limit
+
+
+@dataclass
+class Scoring:
+    price_weight: float = Query(0.7, ge=0)
+    duration_weight: float = Query(0.3, ge=0)
+    normalization: Normalization = "min_max"
 
 
 async def xml_file_validator(xml_file):
     if not fnmatch(xml_file.filename, "*.xml"):
         raise HTTPException(status_code=400, detail="Only XML files are allowed.")
+    if sniff_root(xml_file.file) != ViaComParser.ROOT:
+        raise HTTPException(status_code=400, detail=f"Only {ViaComParser.ROOT} documents are allowed.")
+
+
+def read_queries(queries: str) -> dict[str, ItineraryQuery]:
+    """
+    The JSON list of a batch by the `id` of every query, or its position
+    without one. Invalid lists, too many queries and repeated keys get
+    422 like any other invalid field.
+    """
+    try:
+        read = queries_adapter.validate_json(queries)
+    except ValidationError as error:
+        raise RequestValidationError(
+            [{**detail, "loc": ("body", "queries", *detail["loc"])} for detail in error.errors(include_url=False)]
+        ) from None
+    keyed = {str(position) if query.id is None else query.id: query for position, query in enumerate(read)}
+    if not read or len(read) > settings.batch_max_queries:
+        detail = f"A batch has from 1 to {settings.batch_max_queries} queries."
+    elif len(keyed) < len(read):
+        detail = "Query ids must be unique, including the positions of queries without one."
+    else:
+        return keyed
+    raise RequestValidationError([{"type": "value_error", "loc": ("body", "queries"), "msg": detail, "input": None}])
 
 
 async def get_pydantic_model_from_xml(answer: ET._Element | list[ET._Element]) -> ListItineraries:
-    response = ListItineraries().to_xml_tree()
+    return await threads.run(_get_pydantic_model_from_xml, answer)
 
-    if isinstance(answer, list):
-        for itinerary in answer:
-            response.append(itinerary)  # type: ignore
-    else:
-        response.append(answer)  # type: ignore
 
-    response = ListItineraries.from_xml(ET.tostring(response))  # type: ignore
-    return response  # type: ignore
+def _get_pydantic_model_from_xml(answer: ET._Element | list[ET._Element]) -> ListItineraries:
+    with timer("serialize"):
+        return itineraries_to_schema(answer if isinstance(answer, list) else [answer])
 
 
-@router.post("/itineraries/all")
-async def all_itineraries(xml_file: UploadFile) -> ListItineraries:
-    await xml_file_validator(xml_file)
-    print(xml_file.content_type)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).all_itineraries()
+def _get_batch_model_from_xml(keys: Iterable[str], answers: list[list[ET._Element]]) -> BatchItineraries:
+    with timer("serialize"):
+        return batch_to_schema(dict(zip(keys, answers, strict=True)))
+
+
+def parse_upload(xml_file: UploadFile) -> ViaComParser:
+    with timer("parse"):
+        parser = cached_parser(xml_file)
+    parsed_itineraries.set(len(parser.index))
+    return parser
+
+
+async def upload_processor(xml_file: UploadFile) -> ViaComDataProcessor:
+    parser = await threads.run(parse_upload, xml_file)
+    return ViaComDataProcessor(parser=parser)
+
+
+async def query_itineraries(
+    processor: ViaComDataProcessor,
+    query: Callable[..., Any],
+    *args: Any,
+    pagination: Pagination | None = None,
+    **kwargs: Any,
+) -> ET._Element | list[ET._Element]:
+    """Runs an unbound `ViaComDataProcessor` method on `processor`, then pages its answer."""
+    answer = await threads.run(timed("query", query), processor, *args, **kwargs)
+    if pagination is not None:
+        answer = await threads.run(timed("paginate", processor.paginate), answer, **asdict(pagination))
+    return answer
+
+
+async def list_response(
+    processor: ViaComDataProcessor,
+    query: Callable[..., Any],
+    *args: Any,
+    pagination: Pagination | None = None,
+    **kwargs: Any,
+) -> PydanticJSONResponse:
+    answer = await query_itineraries(processor, query, *args, pagination=pagination, **kwargs)
     response = await get_pydantic_model_from_xml(answer)
-    return response
+    return PydanticJSONResponse(response)
+
+
+async def summary_response(processor: ViaComDataProcessor) -> PydanticJSONResponse:
+    answer = await threads.run(timed("query", processor.summary))
+    response = ItinerariesSummary.model_validate(
+        {metric: await get_pydantic_model_from_xml(itineraries) for metric, itineraries in answer.items()}
+    )
+    return PydanticJSONResponse(response)
+
+
+def wants_ndjson(stream: bool, accept: str | None) -> bool:
+    return stream or NDJSON in (accept or "")
+
+
+def detach_upload(xml_file: UploadFile) -> UploadFile:
+    """
+    FastAPI closes uploaded files as soon as the endpoint returns, before
+    a streamed body is sent. The returned copy owns the spooled file,
+    the stream closes it when done.
+    """
+    file, xml_file.file = xml_file.file, BytesIO()
+    return UploadFile(file=file, filename=xml_file.filename, headers=xml_file.headers)
+
+
+async def stream_ndjson(
+    lines: Generator[bytes, None, None], file: BinaryIO | None = None, batch: int = 64
+) -> AsyncIterator[bytes]:
+    # An lxml parser must not change threads between reads, so every stream is pulled by its own worker
+    worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="via-stream") if threads.executor else None
+    try:
+        while chunk := await threads.run_on(worker, lambda: b"".join(islice(lines, batch))):
+            yield chunk
+    finally:
+        if worker is None:
+            lines.close()
+        else:
+            worker.submit(lines.close)
+            worker.shutdown(wait=False)
+        if file is not None:
+            file.close()
+
+
+def get_stored_response(response_id: str) -> StoredResponse:
+    stored = responses.get(response_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Response not found or expired.")
+    return stored
+
+
+def stored_processor(response_id: str) -> ViaComDataProcessor:
+    return ViaComDataProcessor(parser=get_stored_response(response_id).parser)
+
+
+StoredProcessor = Annotated[ViaComDataProcessor, Depends(stored_processor)]
 
 
-@router.post("/itineraries/specified")
+def get_response_handle(stored: StoredResponse) -> ResponseHandle:
+    return ResponseHandle(
+        id=stored.id_,
+        filename=stored.filename,
+        size=stored.size,
+        itineraries=len(stored.parser.index),
+        roundtrip=stored.parser.index.roundtrip,
+    )
+
+
+@router.post("/itineraries/all", response_model=ListItineraries, responses={200: {"content": {NDJSON: {}}}})
+async def all_itineraries(
+    xml_file: UploadFile,
+    pagination: Annotated[Pagination, Depends()],
+    stream: bool = False,
+    accept: str | None = Header(None),
+) -> PydanticJSONResponse | StreamingResponse:
+    await xml_file_validator(xml_file)
+    if wants_ndjson(stream, accept) and pagination.sort_by is None:
+        await threads.run(timed("parse", check_well_formed), xml_file.file)
+        upload = detach_upload(xml_file)
+        itineraries = ViaComStreamDataProcessor(ViaComStreamParser(upload)).all_itineraries()
+        itineraries = islice(itineraries, pagination.offset, pagination.end)
+        return StreamingResponse(stream_ndjson(ndjson_lines(itineraries), upload.file), media_type=NDJSON)
+    processor = await upload_processor(xml_file)
+    if wants_ndjson(stream, accept):
+        answer = await query_itineraries(processor, ViaComDataProcessor.all_itineraries, pagination=pagination)
+        return StreamingResponse(stream_ndjson(ndjson_lines(answer)), media_type=NDJSON)
+    return await list_response(processor, ViaComDataProcessor.all_itineraries, pagination=pagination)
+
+
+@router.post("/itineraries/specified", response_model=ListItineraries, responses={200: {"content": {NDJSON: {}}}})
 async def specified_itineraries(
-    xml_file: UploadFile, source: str, destination: str, direct: bool = False, transit: bool = False
-) -> ListItineraries:
+    xml_file: UploadFile,
+    source: str,
+    destination: str,
+    pagination: Annotated[Pagination, Depends()],
+    direct: bool = False,
+    transit: bool = False,
+    stream: bool = False,
+    accept: str | None = Header(None),
+) -> PydanticJSONResponse | StreamingResponse:
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).specified_itineraries(
-        source, destination, direct=direct, transit=transit
-    )
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    if wants_ndjson(stream, accept) and pagination.sort_by is None:
+        await threads.run(timed("parse", check_well_formed), xml_file.file)
+        upload = detach_upload(xml_file)
+        itineraries = ViaComStreamDataProcessor(ViaComStreamParser(upload)).specified_itineraries(
+            source, destination, direct=direct, transit=transit
+        )
+        itineraries = islice(itineraries, pagination.offset, pagination.end)
+        return StreamingResponse(stream_ndjson(ndjson_lines(itineraries), upload.file), media_type=NDJSON)
+    processor = await upload_processor(xml_file)
+    query = ViaComDataProcessor.specified_itineraries
+    arguments = {"source": source, "destination": destination, "direct": direct, "transit": transit}
+    if wants_ndjson(stream, accept):
+        answer = await query_itineraries(processor, query, **arguments, pagination=pagination)
+        return StreamingResponse(stream_ndjson(ndjson_lines(answer)), media_type=NDJSON)
+    return await list_response(processor, query, **arguments, pagination=pagination)
 
 
-@router.post("/itineraries/optimal")
-async def optimal_itinerary(xml_file: UploadFile) -> ListItineraries:
+@router.post("/itineraries/specified/batch", response_model=BatchItineraries)
+async def batch_specified_itineraries(xml_file: UploadFile, queries: Annotated[str, Form()]) -> PydanticJSONResponse:
+    """
+    Answers every query of the `queries` JSON list against one upload,
+    keyed by their `id` or position. Each query takes the parameters of
+    `/itineraries/specified`; the upload is parsed once and itineraries
+    in several answers are serialized once.
+    """
+    keyed = read_queries(queries)
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).optimal_itinerary()
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    processor = await upload_processor(xml_file)
+    answers = await threads.run(timed("query", processor.batch_specified_itineraries), list(keyed.values()))
+    response = await threads.run(_get_batch_model_from_xml, keyed, answers)
+    return PydanticJSONResponse(response)
 
 
-@router.post("/itineraries/most_expensive")
-async def most_expensive_itinerary(xml_file: UploadFile) -> ListItineraries:
+@router.post("/itineraries/optimal", response_model=ListItineraries)
+async def optimal_itinerary(xml_file: UploadFile, scoring: Annotated[Scoring, Depends()]) -> PydanticJSONResponse:
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).most_expensive_itinerary()
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    processor = await upload_processor(xml_file)
+    return await list_response(processor, ViaComDataProcessor.optimal_itinerary, **asdict(scoring))
 
 
-@router.post("/itineraries/cheapest")
-async def cheapest_itinerary(xml_file: UploadFile) -> ListItineraries:
+@router.post("/itineraries/most_expensive", response_model=ListItineraries)
+async def most_expensive_itinerary(xml_file: UploadFile) -> PydanticJSONResponse:
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).cheapest_itinerary()
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    processor = await upload_processor(xml_file)
+    return await list_response(processor, ViaComDataProcessor.most_expensive_itinerary)
 
 
-@router.post("/itineraries/longest")
-async def longest_itinerary(xml_file: UploadFile) -> ListItineraries:
+@router.post("/itineraries/cheapest", response_model=ListItineraries)
+async def cheapest_itinerary(xml_file: UploadFile) -> PydanticJSONResponse:
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).longest_itinerary()
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    processor = await upload_processor(xml_file)
+    return await list_response(processor, ViaComDataProcessor.cheapest_itinerary)
 
 
-@router.post("/itineraries/shortest")
-async def shortest_itinerary(xml_file: UploadFile) -> ListItineraries:
+@router.post("/itineraries/longest", response_model=ListItineraries)
+async def longest_itinerary(xml_file: UploadFile) -> PydanticJSONResponse:
     await xml_file_validator(xml_file)
-    parser = ViaComParser(xml_file)
-    answer = ViaComDataProcessor(parser=parser).shortest_itinerary()
-    response = await get_pydantic_model_from_xml(answer)
-    return response
+    processor = await upload_processor(xml_file)
+    return await list_response(processor, ViaComDataProcessor.longest_itinerary)
+
+
+@router.post("/itineraries/shortest", response_model=ListItineraries)
+async def shortest_itinerary(xml_file: UploadFile) -> PydanticJSONResponse:
+    await xml_file_validator(xml_file)
+    processor = await upload_processor(xml_file)
+    return await list_response(processor, ViaComDataProcessor.shortest_itinerary)
+
+
+@router.post("/itineraries/summary", response_model=ItinerariesSummary)
+async def itineraries_summary(xml_file: UploadFile) -> PydanticJSONResponse:
+    await xml_file_validator(xml_file)
+    processor = await upload_processor(xml_file)
+    return await summary_response(processor)
 
 
 @router.post("/itineraries/difference")
@@ -105,6 +328,126 @@ async def itineraries_difference(
 ):
     await xml_file_validator(first_xml_file)
     await xml_file_validator(second_xml_file)
-    compared = ViaComComparator(first_xml_file, second_xml_file, itineraries=itineraries)()
+    compared = await threads.run(
+        timed("compare", lambda: ViaComComparator(first_xml_file, second_xml_file, itineraries=itineraries)())
+    )
+    response = ListItinerariesDiff().model_validate(compared)
+    return response
+
+
+@router.post("/itineraries/difference/prices")
+async def itineraries_price_difference(old_xml_file: UploadFile, new_xml_file: UploadFile) -> ItinerariesPriceDiff:
+    await xml_file_validator(old_xml_file)
+    await xml_file_validator(new_xml_file)
+    compared = await threads.run(timed("compare", ViaComPriceComparator(old_xml_file, new_xml_file)))
+    response = ItinerariesPriceDiff.model_validate(compared)
+    return response
+
+
+@router.post("/snapshots/{search_key}", status_code=201)
+async def push_snapshot(search_key: str, xml_file: UploadFile) -> SnapshotDiff:
+    await xml_file_validator(xml_file)
+    previous, current = await threads.run(timed("store", store_snapshot), search_key, xml_file)
+    compared = await threads.run(timed("compare", ViaComSnapshotComparator(previous, current)))
+    response = SnapshotDiff.model_validate(compared)
+    return response
+
+
+@router.delete("/snapshots/{search_key}", status_code=204)
+async def delete_snapshots(search_key: str) -> None:
+    if not await threads.run(snapshots.delete, search_key):
+        raise HTTPException(status_code=404, detail="No snapshots for this search.")
+
+
+@router.post("/responses", status_code=201)
+async def upload_response(xml_file: UploadFile) -> ResponseHandle:
+    await xml_file_validator(xml_file)
+    stored = await threads.run(timed("parse", store_response), xml_file)
+    if stored is None:
+        raise HTTPException(status_code=413, detail="Response is too large to be stored.")
+    return get_response_handle(stored)
+
+
+@router.get("/responses/{response_id}")
+async def response_info(response_id: str) -> ResponseHandle:
+    stored = get_stored_response(response_id)
+    return get_response_handle(stored)
+
+
+@router.delete("/responses/{response_id}", status_code=204)
+async def delete_response(response_id: str) -> None:
+    if responses.pop(response_id) is None:
+        raise HTTPException(status_code=404, detail="Response not found or expired.")
+
+
+@router.get("/responses/{response_id}/all", response_model=ListItineraries)
+async def stored_all_itineraries(
+    processor: StoredProcessor, pagination: Annotated[Pagination, Depends()]
+) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.all_itineraries, pagination=pagination)
+
+
+@router.get("/responses/{response_id}/specified", response_model=ListItineraries)
+async def stored_specified_itineraries(
+    processor: StoredProcessor,
+    source: str,
+    destination: str,
+    pagination: Annotated[Pagination, Depends()],
+    direct: bool = False,
+    transit: bool = False,
+) -> PydanticJSONResponse:
+    query = ViaComDataProcessor.specified_itineraries
+    arguments = {"source": source, "destination": destination, "direct": direct, "transit": transit}
+    return await list_response(processor, query, **arguments, pagination=pagination)
+
+
+@router.get("/responses/{response_id}/optimal", response_model=ListItineraries)
+async def stored_optimal_itinerary(
+    processor: StoredProcessor, scoring: Annotated[Scoring, Depends()]
+) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.optimal_itinerary, **asdict(scoring))
+
+
+@router.get("/responses/{response_id}/most_expensive", response_model=ListItineraries)
+async def stored_most_expensive_itinerary(processor: StoredProcessor) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.most_expensive_itinerary)
+
+
+@router.get("/responses/{response_id}/cheapest", response_model=ListItineraries)
+async def stored_cheapest_itinerary(processor: StoredProcessor) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.cheapest_itinerary)
+
+
+@router.get("/responses/{response_id}/longest", response_model=ListItineraries)
+async def stored_longest_itinerary(processor: StoredProcessor) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.longest_itinerary)
+
+
+@router.get("/responses/{response_id}/shortest", response_model=ListItineraries)
+async def stored_shortest_itinerary(processor: StoredProcessor) -> PydanticJSONResponse:
+    return await list_response(processor, ViaComDataProcessor.shortest_itinerary)
+
+
+@router.get("/responses/{response_id}/summary", response_model=ItinerariesSummary)
+async def stored_itineraries_summary(processor: StoredProcessor) -> PydanticJSONResponse:
+    return await summary_response(processor)
+
+
+@router.get("/responses/{response_id}/difference/{other_id}")
+async def stored_itineraries_difference(
+    response_id: str, other_id: str, itineraries: Literal["all", "diff"] = "diff"
+) -> ListItinerariesDiff:
+    first = get_stored_response(response_id)
+    second = get_stored_response(other_id)
+    compared = await threads.run(timed("compare", lambda: ViaComComparator(first, second, itineraries=itineraries)()))
     response = ListItinerariesDiff().model_validate(compared)
     return response
+
+
+@router.get("/responses/{response_id}/difference/{other_id}/prices")
+async def stored_itineraries_price_difference(response_id: str, other_id: str) -> ItinerariesPriceDiff:
+    old = get_stored_response(response_id)
+    new = get_stored_response(other_id)
+    compared = await threads.run(timed("compare", ViaComPriceComparator(old, new)))
+    response = ItinerariesPriceDiff.model_validate(compared)
+    return response
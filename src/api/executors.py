@@ -0,0 +1,60 @@
+import importlib
+import multiprocessing
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from core.executors import BoundedExecutor
+from core.metrics import registry
+from core.settings import settings
+
+
+# lxml releases the GIL while parsing, so threads are enough for the request pipeline
+threads = BoundedExecutor(
+    ThreadPoolExecutor(max_workers=settings.executor_workers, thread_name_prefix="via")
+    if settings.executor_workers
+    else None,
+    max_concurrency=settings.executor_max_concurrency or settings.executor_workers or 1,
+)
+
+# Comparing files is mostly Python code holding the GIL, it only runs in parallel in processes.
+# Workers are spawned rather than forked, the parent process already runs threads. They are opt-in:
+# every uvicorn worker gets its own pool and every call pickles both uploads, which only pays off
+# with spare CPUs and large files.
+processes = (
+    ProcessPoolExecutor(max_workers=settings.executor_processes, mp_context=multiprocessing.get_context("spawn"))
+    if settings.executor_processes > 1
+    else None
+)
+
+
+def _import(module: str) -> None:
+    importlib.import_module(module)
+
+
+def start_processes(modules: Sequence[str] = ("api.processors",)) -> None:
+    """
+    Spawns every worker process and imports `modules` in it, so the first
+    comparison does not wait for them. The pool starts workers lazily,
+    one per job submitted while the others are busy.
+    """
+    if processes is None:
+        return
+    jobs = [processes.submit(_import, module) for _ in range(settings.executor_processes) for module in modules]
+    for job in jobs:
+        job.result()
+
+
+def shutdown_processes() -> None:
+    if processes is not None:
+        processes.shutdown(cancel_futures=True)
+
+
+executor_jobs = registry.gauge("aviasales_executor_jobs", "Jobs of the request thread pool, queued or running.")
+executor_completed = registry.counter("aviasales_executor_jobs_completed_total", "Jobs completed by the thread pool.")
+
+
+@registry.on_collect
+def collect_executor_stats() -> None:
+    executor_jobs.set(threads.queued, state="queued")
+    executor_jobs.set(threads.running, state="running")
+    executor_completed.set(threads.completed)
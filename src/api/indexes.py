@@ -0,0 +1,257 @@
+from array import array
+from collections import defaultdict
+from collections.abc import Hashable
+from datetime import datetime
+from decimal import Decimal
+from typing import Generic, NamedTuple, Self, TypeVar
+
+import lxml.etree as ET
+
+from core.types import parse_timestamp
+from core.uploads import InvalidXMLError
+
+
+PRICE_DIGITS = 2  # prices are stored in minor currency units
+PRICE_SCALE = 10**PRICE_DIGITS
+NO_AIRPORT = -1  # placeholder code for a missing return leg
+NO_ROUTE = -1  # placeholder route for a missing or empty leg
+EPOCH = datetime(1970, 1, 1)  # timestamps have no timezone, they are stored as seconds since this moment
+
+T = TypeVar("T", bound=Hashable)
+
+
+class InternTable(Generic[T]):
+    """Maps repeated values (airport codes, routes) to small ints and back."""
+
+    def __init__(self) -> None:
+        self.values: list[T] = []
+        self._ids: dict[T, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, id_: int) -> T:
+        return self.values[id_]
+
+    def get(self, value: T) -> int | None:
+        return self._ids.get(value)
+
+    def intern(self, value: T) -> int:
+        id_ = self._ids.get(value)
+        if id_ is None:
+            id_ = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return id_
+
+
+class ItineraryFacts(NamedTuple):
+    price: int
+    departure: int
+    onward_segments: int
+    onward_duration: int
+    onward_source: int
+    onward_destination: int
+    return_segments: int
+    return_duration: int
+    return_source: int
+    return_destination: int
+
+    @property
+    def duration(self) -> int:
+        return self.onward_duration + self.return_duration
+
+
+def read_itinerary(itinerary: ET._Element, airports: InternTable[str]) -> ItineraryFacts:
+    departure, *onward = _read_leg(itinerary.find("OnwardPricedItinerary/Flights"), airports)
+    _, *return_ = _read_leg(itinerary.find("ReturnPricedItinerary/Flights"), airports)
+    return ItineraryFacts(_read_price(itinerary), departure, *onward, *return_)
+
+
+def _read_price(itinerary: ET._Element) -> int:
+    """The total in minor units; finer amounts are refused rather than rounded, so ordering stays exact."""
+    total = sum(
+        (
+            Decimal(charge.text)  # type: ignore
+            for charge in itinerary.iterfind('Pricing/ServiceCharges[@ChargeType="TotalAmount"]')
+        ),
+        Decimal(0),
+    )
+    price = total * PRICE_SCALE
+    if price != price.to_integral_value():
+        raise InvalidXMLError(f"TotalAmount {total} has more decimals than the minor currency unit")
+    return int(price)
+
+
+def _read_leg(flights: ET._Element | None, airports: InternTable[str]) -> tuple[int, int, int, int, int]:
+    if flights is None or not len(flights):
+        return 0, 0, 0, NO_AIRPORT, NO_AIRPORT
+
+    first_flight = flights[0]
+    last_flight = flights[-1]
+
+    start_datetime = parse_timestamp(first_flight.findtext("DepartureTimeStamp"))  # type: ignore
+    end_datetime = parse_timestamp(last_flight.findtext("ArrivalTimeStamp"))  # type: ignore
+
+    return (
+        int((start_datetime - EPOCH).total_seconds()),
+        len(flights),
+        int((end_datetime - start_datetime).total_seconds()),
+        airports.intern(first_flight.findtext("Source")),  # type: ignore
+        airports.intern(last_flight.findtext("Destination")),  # type: ignore
+    )
+
+
+Signature = tuple[tuple[str, ...], ...]  # one string per flight, one tuple per leg
+
+
+def read_signature(itinerary: ET._Element) -> Signature:
+    """Identifies an itinerary across responses by its carriers, flight numbers and times."""
+    return tuple(
+        tuple(_read_flight_signature(flight) for flight in flights) for flights in itinerary.iterfind("*/Flights")
+    )
+
+
+def _read_flight_signature(flight: ET._Element) -> str:
+    nodes = {node.tag: node for node in flight}
+    return "{carrier}{number} {source}-{destination} {departure} {arrival}".format(
+        carrier=nodes["Carrier"].get("id"),
+        number=nodes["FlightNumber"].text,
+        source=nodes["Source"].text,
+        destination=nodes["Destination"].text,
+        departure=nodes["DepartureTimeStamp"].text,
+        arrival=nodes["ArrivalTimeStamp"].text,
+    )
+
+
+class ViaComItineraryIndex:
+    """
+    Column-oriented view of the `PricedItineraries/Flights` nodes.
+    It is built in a single pass right after parsing, so processors
+    can answer queries from plain arrays instead of walking the tree
+    and re-parsing prices and timestamps for every request.
+    Row `i` of every column describes `elements[i]`.
+
+    Routes are inverted: airport code -> positions of the itineraries
+    that start a leg there, end a leg there or pass through it, so
+    route queries are set intersections instead of XPath scans.
+    Every leg also gets an interned route signature, the airport ids
+    of its flights, so itineraries flying the same route share an id.
+    """
+
+    def __init__(self) -> None:
+        self.elements: list[ET._Element] = []
+        self.prices: array[int] = array("q")
+        self.departures: array[int] = array("q")  # seconds since EPOCH
+        self.onward_durations: array[int] = array("q")  # seconds
+        self.return_durations: array[int] = array("q")  # seconds
+        self.onward_segments: array[int] = array("H")
+        self.return_segments: array[int] = array("H")
+        self.onward_sources: array[int] = array("l")
+        self.onward_destinations: array[int] = array("l")
+        self.return_sources: array[int] = array("l")
+        self.return_destinations: array[int] = array("l")
+        self.onward_routes: array[int] = array("l")
+        self.return_routes: array[int] = array("l")
+        self.roundtrip: bool = False
+
+        self.airports: InternTable[str] = InternTable()
+        self.routes: InternTable[tuple[int, ...]] = InternTable()  # source, destination of every flight
+        self.leg_sources: defaultdict[int, set[int]] = defaultdict(set)  # first Source of any leg
+        self.leg_destinations: defaultdict[int, set[int]] = defaultdict(set)  # last Destination of any leg
+        self.sources: defaultdict[int, set[int]] = defaultdict(set)  # Source of any flight
+        self.destinations: defaultdict[int, set[int]] = defaultdict(set)  # Destination of any flight
+
+        self._positions: dict[ET._Element, int] | None = None
+        self._signatures: list[Signature] | None = None
+
+    @classmethod
+    def from_xml(cls, root: ET._Element) -> Self:
+        index = cls()
+        for itinerary in root.iterfind("PricedItineraries/Flights"):
+            index.append(itinerary)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def append(self, itinerary: ET._Element) -> None:
+        facts = read_itinerary(itinerary, self.airports)
+        position = len(self.elements)
+
+        self.elements.append(itinerary)
+        self.prices.append(facts.price)
+        self.departures.append(facts.departure)
+        self.onward_segments.append(facts.onward_segments)
+        self.onward_durations.append(facts.onward_duration)
+        self.onward_sources.append(facts.onward_source)
+        self.onward_destinations.append(facts.onward_destination)
+        self.return_segments.append(facts.return_segments)
+        self.return_durations.append(facts.return_duration)
+        self.return_sources.append(facts.return_source)
+        self.return_destinations.append(facts.return_destination)
+
+        self.roundtrip = self.roundtrip or facts.return_segments > 0
+
+        for leg, routes in (
+            ("OnwardPricedItinerary", self.onward_routes),
+            ("ReturnPricedItinerary", self.return_routes),
+        ):
+            flights = itinerary.find(f"{leg}/Flights")
+            # Document order: Source and Destination of the first flight, then of the next one
+            nodes = () if flights is None else flights.iter("Source", "Destination")
+            route = tuple(self.airports.intern(node.text) for node in nodes)  # type: ignore
+            if not route:
+                routes.append(NO_ROUTE)
+                continue
+            routes.append(self.routes.intern(route))
+
+            sources, destinations = route[::2], route[1::2]
+            self.leg_sources[sources[0]].add(position)
+            self.leg_destinations[destinations[-1]].add(position)
+            for airport in sources:
+                self.sources[airport].add(position)
+            for airport in destinations:
+                self.destinations[airport].add(position)
+
+    def search(self, source: str, destination: str, direct: bool = False, transit: bool = False) -> list[int]:
+        """
+        Positions of the itineraries with a leg from `source` and a leg to
+        `destination`, or, with `transit`, passing through both airports.
+        `direct` keeps one-segment onward legs only.
+        """
+        source_id = self.airports.get(source)
+        destination_id = self.airports.get(destination)
+        if source_id is None or destination_id is None:
+            return []
+
+        sources, destinations = (
+            (self.sources, self.destinations) if transit else (self.leg_sources, self.leg_destinations)
+        )
+        positions = sources.get(source_id, set()) & destinations.get(destination_id, set())
+        if direct:
+            positions = {position for position in positions if self.onward_segments[position] == 1}
+        return sorted(positions)
+
+    def route(self, route_id: int) -> tuple[str, ...]:
+        """The route as `"SRC-DST"` strings, one per flight."""
+        airports = [self.airports[airport] for airport in self.routes[route_id]]
+        return tuple(
+            f"{source}-{destination}" for source, destination in zip(airports[::2], airports[1::2], strict=True)
+        )
+
+    def positions(self, itineraries: list[ET._Element]) -> list[int]:
+        if self._positions is None:
+            self._positions = {element: position for position, element in enumerate(self.elements)}
+        return [self._positions[itinerary] for itinerary in itineraries]
+
+    def signatures(self) -> list[Signature]:
+        """Signatures of all itineraries, read on first use: only price diffs need them."""
+        if self._signatures is None:
+            self._signatures = [read_signature(itinerary) for itinerary in self.elements]
+        return self._signatures
+
+    def price(self, position: int) -> Decimal:
+        return Decimal(self.prices[position]).scaleb(-PRICE_DIGITS)
+
+    def duration(self, position: int) -> int:
+        return self.onward_durations[position] + self.return_durations[position]
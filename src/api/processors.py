@@ -1,25 +1,163 @@
-from collections.abc import Callable
-from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import Any, BinaryIO
+import heapq
+from collections.abc import Callable, Iterator, Sequence
+from copy import deepcopy
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, BinaryIO, Generic, TypeVar
 
 import lxml.etree as ET
+import numpy as np
+import numpy.typing as npt
+from fastapi import UploadFile
 
-from core.interfaces import XMLDataProcessor, XMLDiffProcessor, XMLParser
-from core.normalizers import ExponentialMovingAverage
+from api.indexes import NO_ROUTE, InternTable, ItineraryFacts, ViaComItineraryIndex, read_itinerary
+from core.interfaces import XMLDataProcessor, XMLDiffProcessor, XMLParser, XMLStreamParser
+from core.normalizers import NORMALIZATIONS, RUNNING_NORMALIZATIONS
+from core.schemas.itineraries import ItineraryQuery
+from core.types import Normalization, SortKey, SortOrder
+from core.uploads import PARSER_OPTIONS, InvalidXMLError, check_well_formed, xml_parser
+
+
+T = TypeVar("T")
 
 
 class ViaComParser(XMLParser):
+    ROOT = "AirFareSearchResponse"
+
+    def __init__(self, xml_file: UploadFile) -> None:
+        super().__init__(xml_file)
+        self.index: ViaComItineraryIndex = ViaComItineraryIndex.from_xml(self.XML)
+
     def parse(self, xml: BinaryIO) -> ET._Element:
-        return ET.parse(xml).getroot()
+        try:
+            return ET.parse(xml, parser=xml_parser()).getroot()
+        except ET.XMLSyntaxError as error:
+            raise InvalidXMLError(str(error)) from None
+
+
+class ViaComStreamParser(XMLStreamParser):
+    def iterparse(self, xml: BinaryIO) -> Iterator[ET._Element]:
+        xml.seek(0)
+        for _, itinerary in ET.iterparse(xml, events=("end",), tag="Flights", **PARSER_OPTIONS):
+            parent = itinerary.getparent()
+            if parent is None or parent.tag != "PricedItineraries":
+                continue  # segment lists inside an itinerary
+
+            yield itinerary
+
+            # Drop the processed itinerary and everything parsed before it
+            itinerary.clear(keep_tail=True)
+            while itinerary.getprevious() is not None:
+                del parent[0]
+
+
+class BestValueSelector(Generic[T]):
+    """Keeps every item sharing the best value seen so far."""
+
+    def __init__(self, comparator: Callable[[Any, Any], bool], keep: Callable[[T], T] = lambda item: item) -> None:
+        self.comparator = comparator
+        self.keep = keep
+        self.best_value: Any = None
+        self.selected: list[T] = []
+
+    def offer(self, value: Any, item: T) -> None:
+        if self.best_value is None or self.comparator(value, self.best_value):
+            self.selected = [self.keep(item)]
+            self.best_value = value
+        elif value == self.best_value:
+            self.selected.append(self.keep(item))
+
+
+class OptimalSelector(Generic[T]):
+    """
+    Finds the optimal items in one pass without holding every value.
+    Normalizations only shift and scale, so an item beaten on both price
+    and duration by another one can never score better: only the rest
+    is kept, and scored once the running normalizers have seen it all.
+    Items repeating the price and duration of a kept one are only
+    counted by their order, `selected` returns `None` in their place.
+    """
+
+    def __init__(
+        self,
+        price_weight: float = 0.7,
+        duration_weight: float = 0.3,
+        normalization: Normalization = "min_max",
+        keep: Callable[[T], T] = lambda item: item,
+    ) -> None:
+        self.price_weight = price_weight
+        self.duration_weight = duration_weight
+        self.keep = keep
+        self.price_normalizer = RUNNING_NORMALIZATIONS[normalization]()
+        self.duration_normalizer = RUNNING_NORMALIZATIONS[normalization]()
+        self.candidates: dict[tuple[int, int], tuple[T, list[int]]] = {}  # (price, duration) -> (first item, orders)
+        self._offered: int = 0
+
+    def offer(self, price: int, duration: int, item: T) -> None:
+        self.price_normalizer.update(price)
+        self.duration_normalizer.update(duration)
+        order, self._offered = self._offered, self._offered + 1
+
+        if (price, duration) in self.candidates:
+            self.candidates[price, duration][1].append(order)
+            return
+
+        if self.price_weight or self.duration_weight:  # without weights every item ties
+            if any(best_price < price and best_duration < duration for best_price, best_duration in self.candidates):
+                return
+            for beaten in [key for key in self.candidates if price < key[0] and duration < key[1]]:
+                del self.candidates[beaten]
+        self.candidates[price, duration] = (self.keep(item), [order])
+
+    @property
+    def selected(self) -> list[tuple[int, T | None]]:
+        if not self.candidates:
+            return []
+        prices, durations = zip(*self.candidates, strict=True)
+        price = self.price_normalizer.normalize(prices)
+        duration = self.duration_normalizer.normalize(durations)
+        scores = self.price_weight * price + self.duration_weight * duration
+
+        keys = list(self.candidates)
+        selected: list[tuple[int, T | None]] = []
+        for position in np.flatnonzero(scores == scores.min()):
+            item, orders = self.candidates[keys[position]]
+            selected.extend([(orders[0], item), *((order, None) for order in orders[1:])])
+        return sorted(selected, key=lambda ordered: ordered[0])
 
 
 class ViaComRoundtripMixin:
     def roundtrip(self, parser: ViaComParser) -> bool:
-        return True if parser.XML.find("PricedItineraries/Flights/ReturnPricedItinerary") else False  # noqa: SIM210
+        return parser.index.roundtrip
 
 
-class ViaComDataProcessor(XMLDataProcessor, ViaComRoundtripMixin):
+class ViaComOptimalMixin:
+    def _optimal_scores(
+        self,
+        prices: npt.ArrayLike,
+        durations: npt.ArrayLike,
+        *,
+        price_weight: float = 0.7,
+        duration_weight: float = 0.3,
+        normalization: Normalization = "min_max",
+    ) -> npt.NDArray[np.float64]:
+        """
+        Both columns are normalized over the whole response first, so a
+        score does not depend on the order itineraries are read in.
+        The lower the score, the better the itinerary.
+        """
+        normalize = NORMALIZATIONS[normalization]
+        price = normalize(np.asarray(prices, dtype=np.float64))
+        duration = normalize(np.asarray(durations, dtype=np.float64))
+        return price_weight * price + duration_weight * duration  # Weighted sum model
+
+    def _lowest_scores(self, scores: npt.NDArray[np.float64]) -> list[int]:
+        if not len(scores):
+            return []
+        return np.flatnonzero(scores == scores.min()).tolist()
+
+
+class ViaComDataProcessor(XMLDataProcessor, ViaComRoundtripMixin, ViaComOptimalMixin):
     parser: ViaComParser
 
     def all_itineraries(self) -> list[ET._Element]:
@@ -30,10 +168,32 @@ class ViaComDataProcessor(XMLDataProcessor, ViaComRoundtripMixin):
     ) -> list[ET._Element]:
         return self._specified_itineraries(source, destination, direct, transit)
 
-    def optimal_itinerary(self) -> ET._Element | list[ET._Element]:
-        return self._find_best_value_ininerary(
-            finder=self._optimal_itinerary, comparator=lambda current_optimal, best: current_optimal <= best
+    def batch_specified_itineraries(self, queries: Sequence[ItineraryQuery]) -> list[list[ET._Element]]:
+        """
+        The paginated answer of every query, in order. Queries repeating
+        the airports and flags of an earlier one share its search.
+        """
+        searches: dict[tuple[str, str, bool, bool], list[ET._Element]] = {}
+        answers = []
+        for query in queries:
+            search = (query.source, query.destination, query.direct, query.transit)
+            if search not in searches:
+                searches[search] = self._specified_itineraries(*search)
+            answers.append(
+                self.paginate(
+                    searches[search], sort_by=query.sort_by, order=query.order, limit=query.limit, offset=query.offset
+                )
+            )
+        return answers
+
+    def optimal_itinerary(
+        self, *, price_weight: float = 0.7, duration_weight: float = 0.3, normalization: Normalization = "min_max"
+    ) -> ET._Element | list[ET._Element]:
+        scores = self._index_optimal_scores(
+            price_weight=price_weight, duration_weight=duration_weight, normalization=normalization
         )
+        selected_itinerary = [self.parser.index.elements[position] for position in self._lowest_scores(scores)]
+        return selected_itinerary if len(selected_itinerary) > 1 else selected_itinerary[0]
 
     def most_expensive_itinerary(self) -> ET._Element | list[ET._Element]:
         return self._find_best_value_ininerary(
@@ -55,145 +215,328 @@ class ViaComDataProcessor(XMLDataProcessor, ViaComRoundtripMixin):
             finder=self._interary_duration, comparator=lambda current_time, best: current_time < best
         )
 
+    def summary(self) -> dict[str, list[ET._Element]]:
+        optimal = self._lowest_scores(self._index_optimal_scores())
+        return {
+            "optimal": [self.parser.index.elements[position] for position in optimal],
+            **self._find_best_values(
+                {
+                    "most_expensive": (self._itinerary_price, lambda current_price, best: current_price > best),
+                    "cheapest": (self._itinerary_price, lambda current_price, best: current_price < best),
+                    "longest": (self._interary_duration, lambda current_time, best: current_time > best),
+                    "shortest": (self._interary_duration, lambda current_time, best: current_time < best),
+                }
+            ),
+        }
+
+    def paginate(
+        self,
+        itineraries: list[ET._Element],
+        *,
+        sort_by: SortKey | None = None,
+        order: SortOrder = "asc",
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[ET._Element]:
+        positions = self.parser.index.positions(itineraries)
+        end = None if limit is None else offset + limit
+
+        if sort_by is not None:
+            key = self._sort_key(sort_by)
+            if end is None:
+                positions = sorted(positions, key=key, reverse=order == "desc")
+            else:
+                # Only the requested page is ordered, in O(n log k) instead of a full sort
+                select = heapq.nlargest if order == "desc" else heapq.nsmallest
+                positions = select(end, positions, key=key)
+
+        return [self.parser.index.elements[position] for position in positions[offset:end]]
+
+    def _sort_key(self, sort_by: SortKey) -> Callable[[int], Any]:
+        match sort_by:
+            case "price":
+                return self._itinerary_price
+            case "duration":
+                return self._interary_duration
+            case "departure":
+                return self._itinerary_departure
+            case "optimal":
+                return self._index_optimal_scores().tolist().__getitem__
+
     def _find_best_value_ininerary(
         self,
         finder: Callable[[Any], Any],
         comparator: Callable[[Any, Any], bool],
     ) -> Any | list[Any]:
-        selected_itinerary = []
-        best_value = None
+        selected_itinerary = self._find_best_values({"best": (finder, comparator)})["best"]
+        return selected_itinerary if len(selected_itinerary) > 1 else selected_itinerary[0]
 
-        for itinerary in self._all_itineraries():
-            current_value = finder(itinerary)
+    def _find_best_values(
+        self, metrics: dict[str, tuple[Callable[[int], Any], Callable[[Any, Any], bool]]]
+    ) -> dict[str, list[ET._Element]]:
+        selectors = {name: BestValueSelector[int](comparator) for name, (_, comparator) in metrics.items()}
 
-            if best_value is None or comparator(current_value, best_value):
-                selected_itinerary = [itinerary]
-                best_value = current_value
-            elif current_value == best_value:
-                selected_itinerary.append(itinerary)
+        for position in range(len(self.parser.index)):
+            for name, (finder, _) in metrics.items():
+                selectors[name].offer(finder(position), position)
 
-        return selected_itinerary if len(selected_itinerary) > 1 else selected_itinerary[0]
+        elements = self.parser.index.elements
+        return {name: [elements[position] for position in selector.selected] for name, selector in selectors.items()}
 
     def _all_itineraries(self) -> list[ET._Element]:
-        return self.parser.XML.xpath("PricedItineraries/Flights")
+        return list(self.parser.index.elements)
 
     def _specified_itineraries(self, source: str, destination: str, direct: bool, transit: bool) -> list[ET._Element]:
-        if transit:
-            request = 'PricedItineraries/Flights[.//Source="{0}" and .//Destination="{1}" {2}]'
-        else:
-            request = 'PricedItineraries/Flights[.//Flight[1]/Source="{0}" and .//Flight[last()]/Destination="{1}" {2}]'
-
-        direct_flights_filter = """
-        and
-        (
-            (
-                ./ReturnPricedItinerary
-                and
-                count(./OnwardPricedItinerary/Flights/Flight) = 1
-                and
-                count(./ReturnPricedItinerary/Flights/Flight) = 1
-            )
-            or
-            (
-                count(./OnwardPricedItinerary/Flights/Flight) = 1
-            )
-        )
-        """
+        elements = self.parser.index.elements
+        return [elements[position] for position in self.parser.index.search(source, destination, direct, transit)]
 
-        filter_condition = direct_flights_filter if direct else ""
-        return self.parser.XML.xpath(request.format(source, destination, filter_condition))
+    def _index_optimal_scores(self, **scoring: Any) -> npt.NDArray[np.float64]:
+        index = self.parser.index
+        durations = np.add(index.onward_durations, index.return_durations, dtype=np.int64)
+        return self._optimal_scores(index.prices, durations, **scoring)
 
-    def _optimal_itinerary(
-        self,
-        itinerary: ET._Element,
-        *,
-        price_weight: Decimal = Decimal("0.7"),
-        duration_weight: Decimal = Decimal("0.3"),
-        ema_alpha: Decimal = Decimal("0.1"),
-    ) -> Decimal:
-        price = self._itinerary_price(itinerary)
-        delta = self._interary_duration(itinerary)
-        duration = Decimal(str(round(delta.total_seconds() / 3600, 2)))
+    def _itinerary_price(self, itinerary: int) -> int:
+        return self.parser.index.prices[itinerary]
 
-        self.price_normalizer = getattr(self, "price_normalizer", ExponentialMovingAverage(alpha=ema_alpha))
-        self.duration_normalizer = getattr(self, "duration_normalizer", ExponentialMovingAverage(alpha=ema_alpha))
+    def _interary_duration(self, itinerary: int) -> int:
+        return self.parser.index.duration(itinerary)
 
-        self.price_normalizer.update(price)
-        price = self.price_normalizer.normalize(price)
+    def _itinerary_departure(self, itinerary: int) -> int:
+        return self.parser.index.departures[itinerary]
 
-        self.duration_normalizer.update(duration)
-        price = self.duration_normalizer.normalize(duration)
 
-        return price_weight * price + duration_weight * duration  # Weighted sum model
+class ViaComStreamDataProcessor(XMLDataProcessor):
+    """
+    The same queries as `ViaComDataProcessor`, answered in a single pass
+    over `ViaComStreamParser`, so memory stays at one itinerary (plus the
+    selected ones) regardless of the file size.
+    """
 
-    def _itinerary_price(self, itinerary: ET._Element) -> Decimal:
-        return sum(  # type: ignore
-            [
-                Decimal(price.text)  # type: ignore
-                for price in itinerary.find("Pricing").iterfind('ServiceCharges[@ChargeType="TotalAmount"]')  # type: ignore
-            ]
+    parser: ViaComStreamParser
+
+    def __init__(self, parser: ViaComStreamParser) -> None:
+        super().__init__(parser)
+        self.airports: InternTable[str] = InternTable()
+
+    def all_itineraries(self) -> Iterator[ET._Element]:
+        return iter(self.parser)
+
+    def specified_itineraries(
+        self, source: str, destination: str, *, direct: bool = False, transit: bool = False
+    ) -> Iterator[ET._Element]:
+        for itinerary in self.parser:
+            if direct:
+                onward = itinerary.find("OnwardPricedItinerary/Flights")
+                if onward is None or len(onward) != 1:
+                    continue
+
+            if transit:
+                sources = {flight.text for flight in itinerary.iter("Source")}
+                destinations = {flight.text for flight in itinerary.iter("Destination")}
+            else:
+                legs = [leg for leg in itinerary.iterfind("*/Flights") if len(leg)]
+                sources = {leg[0].findtext("Source") for leg in legs}
+                destinations = {leg[-1].findtext("Destination") for leg in legs}
+
+            if source in sources and destination in destinations:
+                yield itinerary
+
+    def optimal_itinerary(
+        self, *, price_weight: float = 0.7, duration_weight: float = 0.3, normalization: Normalization = "min_max"
+    ) -> ET._Element | list[ET._Element]:
+        optimal = OptimalSelector[ET._Element](price_weight, duration_weight, normalization, keep=deepcopy)
+        selected_itinerary = self._find_best_values({}, optimal=optimal)["optimal"]
+        return selected_itinerary if len(selected_itinerary) > 1 else selected_itinerary[0]
+
+    def most_expensive_itinerary(self) -> ET._Element | list[ET._Element]:
+        return self._find_best_value_ininerary(
+            finder=lambda facts: facts.price, comparator=lambda current_price, best: current_price > best
         )
 
-    def _get_itinerary_duration(self, flights: list[ET._Element]) -> timedelta:
-        first_flight = flights[0]
-        last_flight = flights[-1]
+    def cheapest_itinerary(self) -> ET._Element | list[ET._Element]:
+        return self._find_best_value_ininerary(
+            finder=lambda facts: facts.price, comparator=lambda current_price, best: current_price < best
+        )
 
-        start_datetime = datetime.strptime(first_flight.find("DepartureTimeStamp").text, r"%Y-%m-%dT%H%M")  # type: ignore
-        end_datetime = datetime.strptime(last_flight.find("ArrivalTimeStamp").text, r"%Y-%m-%dT%H%M")  # type: ignore
+    def longest_itinerary(self) -> ET._Element | list[ET._Element]:
+        return self._find_best_value_ininerary(
+            finder=lambda facts: facts.duration, comparator=lambda current_time, best: current_time > best
+        )
 
-        return end_datetime - start_datetime
+    def shortest_itinerary(self) -> ET._Element | list[ET._Element]:
+        return self._find_best_value_ininerary(
+            finder=lambda facts: facts.duration, comparator=lambda current_time, best: current_time < best
+        )
 
-    def _onward_itinerary_duration(self, itinerary: ET._Element) -> timedelta:
-        flights = itinerary.find("OnwardPricedItinerary/Flights").getchildren()  # type: ignore
-        return self._get_itinerary_duration(flights)
+    def summary(self) -> dict[str, list[ET._Element]]:
+        return self._find_best_values(
+            {
+                "most_expensive": (lambda facts: facts.price, lambda current_price, best: current_price > best),
+                "cheapest": (lambda facts: facts.price, lambda current_price, best: current_price < best),
+                "longest": (lambda facts: facts.duration, lambda current_time, best: current_time > best),
+                "shortest": (lambda facts: facts.duration, lambda current_time, best: current_time < best),
+            },
+            optimal=OptimalSelector[ET._Element](keep=deepcopy),
+        )
 
-    def _return_itinerary_duration(self, itinerary: ET._Element) -> timedelta:
-        flights = itinerary.find("ReturnPricedItinerary/Flights").getchildren()  # type: ignore
-        return self._get_itinerary_duration(flights)
+    def _find_best_value_ininerary(
+        self,
+        finder: Callable[[ItineraryFacts], Any],
+        comparator: Callable[[Any, Any], bool],
+    ) -> ET._Element | list[ET._Element]:
+        selected_itinerary = self._find_best_values({"best": (finder, comparator)})["best"]
+        return selected_itinerary if len(selected_itinerary) > 1 else selected_itinerary[0]
 
-    def _interary_duration(self, itinerary: ET._Element) -> timedelta:
-        onward_delta = self._onward_itinerary_duration(itinerary)
-        if self.roundtrip(self.parser):
-            return_delta = self._return_itinerary_duration(itinerary)
-            return return_delta + onward_delta
-        return onward_delta
+    def _find_best_values(
+        self,
+        metrics: dict[str, tuple[Callable[[ItineraryFacts], Any], Callable[[Any, Any], bool]]],
+        optimal: OptimalSelector[ET._Element] | None = None,
+    ) -> dict[str, list[ET._Element]]:
+        # Selected itineraries are copied, the parser frees the originals
+        selectors = {
+            name: BestValueSelector[ET._Element](comparator, keep=deepcopy) for name, (_, comparator) in metrics.items()
+        }
+
+        for itinerary in self.parser:
+            facts = read_itinerary(itinerary, self.airports)
+            for name, (finder, _) in metrics.items():
+                selectors[name].offer(finder(facts), itinerary)
+            if optimal is not None:
+                optimal.offer(facts.price, facts.duration, itinerary)
+
+        best_values = {name: selector.selected for name, selector in selectors.items()}
+        return best_values if optimal is None else {"optimal": self._fill_ties(optimal.selected), **best_values}
+
+    def _fill_ties(self, selected: list[tuple[int, ET._Element | None]]) -> list[ET._Element]:
+        # Repeated optimal values are rare, they are read again instead of being copied just in case
+        missing = {position for position, itinerary in selected if itinerary is None}
+        found: dict[int, ET._Element] = {}
+        if missing:
+            for position, itinerary in enumerate(self.parser):
+                if position in missing:
+                    found[position] = deepcopy(itinerary)
+                    if len(found) == len(missing):
+                        break
+        return [found[position] if itinerary is None else itinerary for position, itinerary in selected]
+
+
+@dataclass(frozen=True, slots=True)
+class DiffFacts:
+    """Everything a comparison needs from one file, small and picklable."""
+
+    roundtrip: bool
+    ticket_types: frozenset[str]
+    onward_routes: frozenset[tuple[str, ...]]
+    routes: frozenset[tuple[str, ...]]  # onward and return
+
+    @property
+    def size(self) -> int:
+        """Rough number of bytes held, for caches."""
+        return sum(len(flight) for route in self.routes for flight in route) + 64 * len(self.routes)
+
+    def unique_itineraries(self, return_itineraries: bool) -> frozenset[tuple[str, ...]]:
+        return self.routes if return_itineraries else self.onward_routes
+
+
+def stream_diff_facts(xml: BinaryIO) -> DiffFacts:
+    """Facts of a file read in one streamed pass, its tree is never held. The file is rewound."""
+    try:
+        return ViaComStreamDiffProcessor(ViaComStreamParser(UploadFile(file=xml))).facts()
+    except ET.XMLSyntaxError as error:
+        check_well_formed(xml)  # iterparse reports truncated files as extra content, this names the error
+        raise InvalidXMLError(str(error)) from None
+    finally:
+        xml.seek(0)
+
+
+def read_diff_facts(content: bytes) -> DiffFacts:
+    """Runs in worker processes: the file comes in as bytes, only the facts go back."""
+    return stream_diff_facts(BytesIO(content))
 
 
 class ViaComDiffProcessor(XMLDiffProcessor, ViaComRoundtripMixin):
     parser: ViaComParser
 
+    def facts(self) -> DiffFacts:
+        roundtrip = self.is_roundtrip()
+        onward, return_ = self._routes(return_itineraries=roundtrip)
+        return DiffFacts(
+            roundtrip=roundtrip,
+            ticket_types=frozenset(self.ticket_types()),
+            onward_routes=frozenset(onward),
+            routes=frozenset(onward | return_),
+        )
+
     def is_roundtrip(self) -> bool:
         return self.roundtrip(self.parser)
 
     def ticket_types(self) -> set[str]:
-        pricing = self.parser.XML.xpath(
-            ".//PricedItineraries/Flights[1]/Pricing/ServiceCharges[@ChargeType='TotalAmount']"
+        for itinerary in self.parser.index.elements[:1]:
+            pricing = itinerary.iterfind("Pricing/ServiceCharges[@ChargeType='TotalAmount']")
+            return set(price.get("type") for price in pricing)  # type: ignore
+        return set()
+
+    def unique_itineraries(self, return_itineraries: bool) -> set[tuple[str, ...]]:
+        onward, return_ = self._routes(return_itineraries)
+        return onward | return_
+
+    def _routes(self, return_itineraries: bool) -> tuple[set[tuple[str, ...]], set[tuple[str, ...]]]:
+        # Itineraries flying the same route share its interned id, so only
+        # the distinct ids are turned back into "SRC-DST" strings
+        index = self.parser.index
+        onward_routes = set(index.onward_routes)
+        return_routes = set(index.return_routes) if return_itineraries else set()
+        onward_routes.discard(NO_ROUTE)
+        return_routes.discard(NO_ROUTE)
+        return {index.route(route) for route in onward_routes}, {index.route(route) for route in return_routes}
+
+
+class ViaComStreamDiffProcessor(XMLDiffProcessor):
+    parser: ViaComStreamParser
+
+    def facts(self) -> DiffFacts:
+        """The facts `ViaComDiffProcessor.facts` reads, in a single pass."""
+        ticket_types: set[str] | None = None
+        onward: set[tuple[str, ...]] = set()
+        return_: set[tuple[str, ...]] = set()
+
+        for itinerary in self.parser:
+            if ticket_types is None:
+                pricing = itinerary.iterfind("Pricing/ServiceCharges[@ChargeType='TotalAmount']")
+                ticket_types = set(price.get("type") for price in pricing)  # type: ignore
+            onward.add(self._route(itinerary.find("OnwardPricedItinerary/Flights")))
+            return_.add(self._route(itinerary.find("ReturnPricedItinerary/Flights")))
+
+        onward.discard(tuple())
+        return_.discard(tuple())
+        return DiffFacts(
+            roundtrip=bool(return_),
+            ticket_types=frozenset(ticket_types or ()),
+            onward_routes=frozenset(onward),
+            routes=frozenset(onward | return_),
         )
-        return set(price.get("type") for price in pricing)
+
+    def is_roundtrip(self) -> bool:
+        return any(itinerary.find("ReturnPricedItinerary/Flights/Flight") is not None for itinerary in self.parser)
+
+    def ticket_types(self) -> set[str]:
+        for itinerary in self.parser:
+            pricing = itinerary.iterfind("Pricing/ServiceCharges[@ChargeType='TotalAmount']")
+            return set(price.get("type") for price in pricing)  # type: ignore
+        return set()
 
     def unique_itineraries(self, return_itineraries: bool) -> set[tuple[str, ...]]:
         unique = set()
 
-        for itinerary in self.parser.XML.xpath("//Flights"):
-            onward_sources = itinerary.xpath(".//OnwardPricedItinerary/Flights/Flight/Source/text()")
-            onward_destinations = itinerary.xpath(".//OnwardPricedItinerary/Flights/Flight/Destination/text()")
-            onward_result = tuple(
-                f"{source}-{destination}"
-                for source, destination in zip(onward_sources, onward_destinations, strict=True)
-            )
-            unique.add(onward_result)
-
+        for itinerary in self.parser:
+            unique.add(self._route(itinerary.find("OnwardPricedItinerary/Flights")))
             if return_itineraries:
-                return_sources = itinerary.xpath(".//ReturnPricedItinerary/Flights/Flight/Source/text()")
-                return_destinations = itinerary.xpath(".//ReturnPricedItinerary/Flights/Flight/Destination/text()")
-                return_result = tuple(
-                    f"{source}-{destination}"
-                    for source, destination in zip(return_sources, return_destinations, strict=True)
-                )
-                unique.add(return_result)
+                unique.add(self._route(itinerary.find("ReturnPricedItinerary/Flights")))
 
         unique.discard(tuple())
         return unique
 
-
-# breakpoint()
+    def _route(self, flights: ET._Element | None) -> tuple[str, ...]:
+        if flights is None:
+            return tuple()
+        return tuple(f"{flight.findtext('Source')}-{flight.findtext('Destination')}" for flight in flights)
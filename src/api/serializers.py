@@ -0,0 +1,104 @@
+from collections.abc import Generator, Iterable, Mapping
+from decimal import Decimal
+
+import lxml.etree as ET
+from fastapi import Response
+from pydantic import BaseModel
+
+from core.metrics import timer
+from core.records import FlightRecord, ItineraryRecord, ServiceChargeRecord
+from core.schemas.itineraries import BatchItineraries, Itinerary, ListItineraries
+from core.types import parse_timestamp
+
+
+NDJSON = "application/x-ndjson"
+
+
+def flight_to_record(flight: ET._Element) -> FlightRecord:
+    nodes = {node.tag: node.text for node in flight}
+    carrier = flight.find("Carrier")
+    return FlightRecord(
+        carrier_id=carrier.get("id"),  # type: ignore
+        carrier=carrier.text,  # type: ignore
+        flight_number=int(nodes["FlightNumber"]),  # type: ignore
+        source=nodes["Source"],  # type: ignore
+        destination=nodes["Destination"],  # type: ignore
+        departure_time_stamp=parse_timestamp(nodes["DepartureTimeStamp"]),  # type: ignore
+        arrival_time_stamp=parse_timestamp(nodes["ArrivalTimeStamp"]),  # type: ignore
+        class_=nodes["Class"],  # type: ignore
+        number_of_stops=int(nodes["NumberOfStops"]),  # type: ignore
+        fare_basis=nodes["FareBasis"].strip(),  # type: ignore
+        warning_text=nodes.get("WarningText") or None,
+        ticket_type=nodes["TicketType"],  # type: ignore
+    )
+
+
+def service_charge_to_record(charge: ET._Element) -> ServiceChargeRecord:
+    return ServiceChargeRecord(
+        type_=charge.get("type"),  # type: ignore
+        charge_type=charge.get("ChargeType"),  # type: ignore
+        amount=Decimal(charge.text),  # type: ignore
+    )
+
+
+def itinerary_to_record(itinerary: ET._Element) -> ItineraryRecord:
+    """
+    Values of a parsed `PricedItineraries/Flights` element, read the way
+    `core.schemas.itineraries.Itinerary` would validate them, so building
+    a response neither re-parses XML nor runs pydantic validators.
+    """
+    onward = itinerary.find("OnwardPricedItinerary/Flights")
+    return_ = itinerary.find("ReturnPricedItinerary/Flights")
+    pricing = itinerary.find("Pricing")
+
+    return ItineraryRecord(
+        onward=tuple(flight_to_record(flight) for flight in onward),  # type: ignore
+        return_=tuple(flight_to_record(flight) for flight in return_) if return_ is not None else None,
+        currency=pricing.get("currency"),  # type: ignore
+        service_charges=tuple(service_charge_to_record(charge) for charge in pricing.iterfind("ServiceCharges")),  # type: ignore
+    )
+
+
+def itineraries_to_schema(itineraries: Iterable[ET._Element]) -> ListItineraries:
+    return ListItineraries.model_construct(
+        priced_itineraries=[itinerary_to_record(itinerary).to_schema() for itinerary in itineraries] or None
+    )
+
+
+def batch_to_schema(answers: Mapping[str, Iterable[ET._Element]]) -> BatchItineraries:
+    """Itineraries returned by several queries are read and built once."""
+    built: dict[ET._Element, Itinerary] = {}
+
+    def build(itinerary: ET._Element) -> Itinerary:
+        model = built.get(itinerary)
+        if model is None:
+            model = built[itinerary] = itinerary_to_record(itinerary).to_schema()
+        return model
+
+    return BatchItineraries.model_construct(
+        results={
+            key: ListItineraries.model_construct(
+                priced_itineraries=[build(itinerary) for itinerary in itineraries] or None
+            )
+            for key, itineraries in answers.items()
+        }
+    )
+
+
+def ndjson_lines(itineraries: Iterable[ET._Element]) -> Generator[bytes, None, None]:
+    for itinerary in itineraries:
+        model = itinerary_to_record(itinerary).to_schema()
+        yield Itinerary.__pydantic_serializer__.to_json(model, by_alias=True) + b"\n"
+
+
+class PydanticJSONResponse(Response):
+    """
+    Serializes an already validated model once, instead of letting
+    FastAPI dump, re-validate and encode it against `response_model`.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: BaseModel) -> bytes:
+        with timer("encode"):
+            return content.__pydantic_serializer__.to_json(content, by_alias=True)
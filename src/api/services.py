@@ -1,13 +1,17 @@
-from collections import deque
+from collections import Counter, defaultdict, deque
 from collections.abc import Generator
 from dataclasses import dataclass
-from itertools import islice
+from decimal import Decimal
+from functools import cached_property
 from typing import Literal, TypeAlias, TypedDict
 from uuid import uuid4
 
 from fastapi import UploadFile
 
-from api.processors import ViaComDiffProcessor, ViaComParser
+from api.caches import StoredResponse, cached_diff_facts, cached_parser
+from api.indexes import PRICE_DIGITS, Signature, ViaComItineraryIndex
+from api.processors import DiffFacts
+from api.snapshots import Snapshot, SnapshotItineraries
 from core.services import BaseService
 
 
@@ -26,13 +30,14 @@ filename: TypeAlias = dict[str, FileDiff]  # noqa: UP040
 
 @dataclass(init=False)
 class ViaComComparator(BaseService):
-    files: tuple[UploadFile, ...]
+    files: tuple[UploadFile | StoredResponse | Snapshot, ...]
     itineraries: Literal["all", "diff"] = "diff"
 
-    def __init__(self, *files: UploadFile, itineraries: Literal["all", "diff"] = "diff") -> None:
-        self.files: tuple[UploadFile, ...] = files
-        self.parsers: tuple[ViaComParser, ...] = tuple(ViaComParser(file) for file in files)
-        self.processors: tuple[ViaComDiffProcessor, ...] = tuple(ViaComDiffProcessor(parser) for parser in self.parsers)
+    def __init__(
+        self, *files: UploadFile | StoredResponse | Snapshot, itineraries: Literal["all", "diff"] = "diff"
+    ) -> None:
+        self.files: tuple[UploadFile | StoredResponse | Snapshot, ...] = files
+        self.facts: tuple[DiffFacts, ...] = tuple(cached_diff_facts(files))
         self.itineraries = itineraries
 
     def act(self) -> dict[str, filename]:
@@ -47,35 +52,152 @@ class ViaComComparator(BaseService):
     def show_all(self) -> dict[str, filename]:
         response: filename = dict()
 
-        for index, processor in enumerate(self.processors):
+        for index, facts in enumerate(self.facts):
             diff: FileDiff = {
-                "roundtrip": processor.is_roundtrip(),
-                "ticket_types": processor.ticket_types(),
-                "routes": processor.unique_itineraries(self.return_itineraries),
+                "roundtrip": facts.roundtrip,
+                "ticket_types": set(facts.ticket_types),
+                "routes": set(facts.unique_itineraries(self.return_itineraries)),
             }
-            response[self.files[index].filename or str(uuid4())] = diff
+            response[self._name(self.files[index])] = diff
 
         return {"files": response}
 
     def show_diff(self) -> dict[str, filename]:
         response: filename = dict()
 
-        for index, (processor, itinerary) in enumerate(zip(self.processors, self._get_diff_itineraries(), strict=True)):
+        for index, (facts, itinerary) in enumerate(zip(self.facts, self._get_diff_itineraries(), strict=True)):
             diff: FileDiff = {
-                "roundtrip": processor.is_roundtrip(),
-                "ticket_types": processor.ticket_types(),
+                "roundtrip": facts.roundtrip,
+                "ticket_types": set(facts.ticket_types),
                 "routes": itinerary,
             }
-            response[self.files[index].filename or str(uuid4())] = diff
+            response[self._name(self.files[index])] = diff
 
         return {"files": response}
 
     def _get_diff_itineraries(self) -> Generator[set[tuple[str, ...]], None, None]:
-        itineraries = deque([processor.unique_itineraries(self.return_itineraries) for processor in self.processors])
-        for _ in range(len(itineraries)):
-            yield itineraries[0].difference(*list(islice(itineraries, 1, None)))
-            itineraries.rotate(-1)
+        itineraries = [facts.unique_itineraries(self.return_itineraries) for facts in self.facts]
+        # A route counted once belongs to a single file
+        counts = Counter(route for routes in itineraries for route in routes)
+        for routes in itineraries:
+            yield {route for route in routes if counts[route] == 1}
 
-    @property
+    @cached_property
     def return_itineraries(self) -> bool:
-        return all(processor.is_roundtrip() is not False for processor in self.processors)
+        return all(facts.roundtrip for facts in self.facts)
+
+    @staticmethod
+    def _name(file: UploadFile | StoredResponse | Snapshot) -> str:
+        # Snapshots of one search usually share a filename
+        if isinstance(file, Snapshot):
+            return str(file.id_)
+        return file.filename or str(uuid4())
+
+
+class PricedItinerary(TypedDict):
+    flights: Signature
+    price: Decimal
+
+
+class PriceChange(TypedDict):
+    flights: Signature
+    old_price: Decimal
+    new_price: Decimal
+    delta: Decimal
+
+
+class PriceDiff(TypedDict):
+    added: list[PricedItinerary]
+    removed: list[PricedItinerary]
+    repriced: list[PriceChange]
+    unchanged: int
+
+
+@dataclass(init=False)
+class ViaComPriceComparator(BaseService):
+    """
+    Matches the itineraries of two snapshots by signature (carriers,
+    flight numbers and times) with a hash join: the old snapshot is
+    bucketed by signature, the new one probes the buckets. Repeated
+    signatures are paired in document order.
+    """
+
+    old: UploadFile | StoredResponse | Snapshot
+    new: UploadFile | StoredResponse | Snapshot
+
+    def __init__(
+        self, old: UploadFile | StoredResponse | Snapshot, new: UploadFile | StoredResponse | Snapshot
+    ) -> None:
+        self.old = old
+        self.new = new
+
+    def act(self) -> PriceDiff:
+        old, new = self._index(self.old), self._index(self.new)
+
+        buckets: defaultdict[Signature, deque[int]] = defaultdict(deque)
+        for position, signature in enumerate(old.signatures()):
+            buckets[signature].append(position)
+
+        added: list[PricedItinerary] = []
+        repriced: list[PriceChange] = []
+        unchanged = 0
+        for position, signature in enumerate(new.signatures()):
+            bucket = buckets.get(signature)
+            if not bucket:
+                added.append({"flights": signature, "price": new.price(position)})
+                continue
+
+            old_position = bucket.popleft()
+            if old.prices[old_position] == new.prices[position]:
+                unchanged += 1
+                continue
+            delta = Decimal(new.prices[position] - old.prices[old_position]).scaleb(-PRICE_DIGITS)
+            repriced.append(
+                {
+                    "flights": signature,
+                    "old_price": old.price(old_position),
+                    "new_price": new.price(position),
+                    "delta": delta,
+                }
+            )
+
+        removed: list[PricedItinerary] = [
+            {"flights": old.signatures()[position], "price": old.price(position)}
+            for position in sorted(position for bucket in buckets.values() for position in bucket)
+        ]
+        return {"added": added, "removed": removed, "repriced": repriced, "unchanged": unchanged}
+
+    @staticmethod
+    def _index(file: UploadFile | StoredResponse | Snapshot) -> ViaComItineraryIndex | SnapshotItineraries:
+        if isinstance(file, Snapshot):
+            return file.itineraries
+        return file.parser.index if isinstance(file, StoredResponse) else cached_parser(file).index
+
+
+class SnapshotDiff(TypedDict):
+    id: int
+    previous_id: int | None
+    routes: dict[str, filename] | None
+    prices: PriceDiff | None
+
+
+@dataclass(init=False)
+class ViaComSnapshotComparator(BaseService):
+    """Compares a new snapshot with the previous one of the same search, if any."""
+
+    previous: Snapshot | None
+    current: Snapshot
+
+    def __init__(self, previous: Snapshot | None, current: Snapshot) -> None:
+        self.previous = previous
+        self.current = current
+
+    def act(self) -> SnapshotDiff:
+        if self.previous is None:
+            return {"id": self.current.id_, "previous_id": None, "routes": None, "prices": None}
+        return {
+            "id": self.current.id_,
+            "previous_id": self.previous.id_,
+            "routes": ViaComComparator(self.previous, self.current)(),
+            "prices": ViaComPriceComparator(self.previous, self.current)(),
+        }
@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import time
+from array import array
+from dataclasses import dataclass
+from decimal import Decimal
+from threading import Lock
+
+from api.indexes import PRICE_DIGITS, Signature, ViaComItineraryIndex
+from api.processors import DiffFacts
+from core.settings import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    search_key TEXT NOT NULL,
+    filename TEXT,
+    digest TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    roundtrip INTEGER NOT NULL,
+    ticket_types TEXT NOT NULL,
+    onward_routes TEXT NOT NULL,
+    routes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_search_key ON snapshots (search_key, id);
+CREATE TABLE IF NOT EXISTS itineraries (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    signature TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class SnapshotItineraries:
+    """Signatures and prices of a stored snapshot, all a price diff reads from an index."""
+
+    def __init__(self, signatures: list[Signature], prices: array[int]) -> None:
+        self._signatures = signatures
+        self.prices = prices
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def signatures(self) -> list[Signature]:
+        return self._signatures
+
+    def price(self, position: int) -> Decimal:
+        return Decimal(self.prices[position]).scaleb(-PRICE_DIGITS)
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    id_: int
+    search_key: str
+    filename: str | None
+    digest: str
+    created_at: float  # seconds since the epoch
+    facts: DiffFacts
+    itineraries: ViaComItineraryIndex | SnapshotItineraries
+
+
+class SnapshotStore:
+    """
+    Indexed form of the responses received for a search, kept in SQLite
+    so a new response is compared with the previous one without sending
+    or parsing it again. Only the last `keep` snapshots of every search
+    key are kept. The database is opened on first use.
+    """
+
+    def __init__(self, path: str, keep: int = 2) -> None:
+        self.path = path
+        self.keep = keep
+        self._connection: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)  # guarded by `_lock`
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def latest(self, search_key: str) -> Snapshot | None:
+        with self._lock:
+            return self._latest(search_key)
+
+    def push(
+        self, search_key: str, filename: str | None, digest: str, facts: DiffFacts, index: ViaComItineraryIndex
+    ) -> tuple[Snapshot | None, Snapshot]:
+        """Stores a new snapshot, returns the previous one of the same search and the new one."""
+        with self._lock, self.connection as connection:
+            previous = self._latest(search_key)
+            created_at = time.time()
+            cursor = connection.execute(
+                "INSERT INTO snapshots (search_key, filename, digest, created_at, roundtrip, ticket_types,"
+                " onward_routes, routes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    search_key,
+                    filename,
+                    digest,
+                    created_at,
+                    facts.roundtrip,
+                    json.dumps(sorted(facts.ticket_types)),
+                    json.dumps(sorted(facts.onward_routes)),
+                    json.dumps(sorted(facts.routes)),
+                ),
+            )
+            id_ = cursor.lastrowid
+            assert id_ is not None
+            connection.executemany(
+                "INSERT INTO itineraries (snapshot_id, position, signature, price) VALUES (?, ?, ?, ?)",
+                (
+                    (id_, position, json.dumps(signature), price)
+                    for position, (signature, price) in enumerate(zip(index.signatures(), index.prices, strict=True))
+                ),
+            )
+            connection.execute(
+                "DELETE FROM snapshots WHERE search_key = ? AND id NOT IN"
+                " (SELECT id FROM snapshots WHERE search_key = ? ORDER BY id DESC LIMIT ?)",
+                (search_key, search_key, max(self.keep, 1)),
+            )
+
+        return previous, Snapshot(id_, search_key, filename, digest, created_at, facts, index)
+
+    def delete(self, search_key: str) -> int:
+        with self._lock, self.connection as connection:
+            return connection.execute("DELETE FROM snapshots WHERE search_key = ?", (search_key,)).rowcount
+
+    def _latest(self, search_key: str) -> Snapshot | None:
+        row = self.connection.execute(
+            "SELECT id, filename, digest, created_at, roundtrip, ticket_types, onward_routes, routes"
+            " FROM snapshots WHERE search_key = ? ORDER BY id DESC LIMIT 1",
+            (search_key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        id_, filename, digest, created_at, roundtrip, ticket_types, onward_routes, routes = row
+        facts = DiffFacts(
+            roundtrip=bool(roundtrip),
+            ticket_types=frozenset(json.loads(ticket_types)),
+            onward_routes=frozenset(map(tuple, json.loads(onward_routes))),
+            routes=frozenset(map(tuple, json.loads(routes))),
+        )
+
+        signatures: list[Signature] = []
+        prices: array[int] = array("q")
+        for signature, price in self.connection.execute(
+            "SELECT signature, price FROM itineraries WHERE snapshot_id = ? ORDER BY position", (id_,)
+        ):
+            signatures.append(tuple(map(tuple, json.loads(signature))))
+            prices.append(price)
+
+        return Snapshot(id_, search_key, filename, digest, created_at, facts, SnapshotItineraries(signatures, prices))
+
+
+snapshots = SnapshotStore(settings.snapshot_store_path, keep=settings.snapshot_store_keep)
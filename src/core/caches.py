@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from threading import Lock
+from typing import Generic, NamedTuple, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Entry(NamedTuple, Generic[V]):
+    value: V
+    size: int
+    expires_at: float
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Least recently used entries are evicted once the total size of
+    the stored values goes over `max_bytes`; entries older than `ttl`
+    seconds are treated as missing. Sizes are provided by the caller.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.current_bytes: int = 0
+
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry.expires_at <= self.clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key: K, value: V, size: int) -> bool:
+        """Stores the value unless it is larger than the whole cache, returns whether it did."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return False  # would evict everything and still not fit
+
+            self._entries[key] = _Entry(value, size, self.clock() + self.ttl)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            return entry.value if entry.expires_at > self.clock() else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key: K) -> None:
+        self.current_bytes -= self._entries.pop(key).size
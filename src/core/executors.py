@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+from collections.abc import Callable
+from concurrent.futures import Executor
+from functools import partial
+from typing import ParamSpec, TypeVar
+
+from core.profiling import current_profile
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+class BoundedExecutor:
+    """
+    Runs blocking callables in `executor` so they do not stall the
+    event loop. At most `max_concurrency` jobs are submitted at once,
+    the others wait in a queue; `queued`, `running` and `completed`
+    describe the load. Jobs see the context variables of their caller,
+    as with `asyncio.to_thread`, so executors must be thread pools;
+    jobs of a profiled request are profiled.
+    Without an executor jobs run inline, which is only useful for
+    debugging. The semaphore is made on first use, in the running loop:
+    instances are built at import time, outside any loop.
+    """
+
+    def __init__(self, executor: Executor | None, max_concurrency: int) -> None:
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+
+        self.queued: int = 0
+        self.running: int = 0
+        self.completed: int = 0
+
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        return await self.run_on(self.executor, func, *args, **kwargs)
+
+    async def run_on(self, executor: Executor | None, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        """
+        Same as `run`, but in another executor, e.g. a single thread
+        that owns some state, still counting towards `max_concurrency`.
+        """
+        job = partial(func, *args, **kwargs)
+        if (profile := current_profile()) is not None:
+            job = partial(profile.run, job)
+
+        if executor is None:
+            return job()
+
+        slots = self._loop_slots()
+        self.queued += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(executor, partial(context.run, job))
+        finally:
+            self.running -= 1
+            self.completed += 1
+            slots.release()
+
+    def _loop_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots, self._loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._slots
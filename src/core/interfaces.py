@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from collections.abc import Iterable, Iterator
 from typing import Any, BinaryIO
 
 import lxml.etree as ET
@@ -14,18 +15,36 @@ class XMLParser(metaclass=ABCMeta):
         ...
 
 
+class XMLStreamParser(metaclass=ABCMeta):
+    """
+    Unlike `XMLParser` it never holds the whole document: every
+    iteration re-reads the file and yields one itinerary element at
+    a time, which is valid only until the next one is requested.
+    """
+
+    def __init__(self, xml_file: UploadFile) -> None:
+        self.file: BinaryIO = xml_file.file
+
+    def __iter__(self) -> Iterator[ET._Element]:
+        return self.iterparse(self.file)
+
+    @abstractmethod
+    def iterparse(self, xml: BinaryIO) -> Iterator[ET._Element]:
+        ...
+
+
 class XMLDataProcessor(metaclass=ABCMeta):
-    def __init__(self, parser: XMLParser) -> None:
-        self.parser: XMLParser = parser
+    def __init__(self, parser: XMLParser | XMLStreamParser) -> None:
+        self.parser: XMLParser | XMLStreamParser = parser
 
     @abstractmethod
-    def all_itineraries(self) -> list[ET._Element]:
+    def all_itineraries(self) -> Iterable[ET._Element]:
         ...
 
     @abstractmethod
     def specified_itineraries(
         self, source: str, destination: str, *, direct: bool = False, transit: bool = False
-    ) -> list[ET._Element]:
+    ) -> Iterable[ET._Element]:
         ...
 
     @abstractmethod
@@ -48,10 +67,14 @@ class XMLDataProcessor(metaclass=ABCMeta):
     def shortest_itinerary(self) -> ET._Element | list[ET._Element]:
         ...
 
+    @abstractmethod
+    def summary(self) -> dict[str, list[ET._Element]]:
+        ...
+
 
 class XMLDiffProcessor(metaclass=ABCMeta):
-    def __init__(self, parser: XMLParser) -> None:
-        self.parser: XMLParser = parser
+    def __init__(self, parser: XMLParser | XMLStreamParser) -> None:
+        self.parser: XMLParser | XMLStreamParser = parser
 
     @abstractmethod
     def is_roundtrip(self) -> bool:
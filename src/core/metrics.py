@@ -0,0 +1,248 @@
+"""
+Counters, gauges and histograms rendered in the Prometheus text format,
+and timings of the stages of a request: every stage is observed in
+`stage_seconds` and summed per request into its `Server-Timing` header
+by `TimingMiddleware`.
+"""
+
+import math
+import time
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Iterator, MutableMapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from typing import Any, ParamSpec, TypeVar
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+M = TypeVar("M", bound="Metric")
+
+Labels = tuple[tuple[str, str], ...]
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+PROMETHEUS = "text/plain; version=0.0.4"  # starlette appends the charset
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped, strict=True)) + "}"
+
+
+class Metric:
+    type_: str
+
+    def __init__(self, name: str, help_: str) -> None:
+        self.name = name
+        self.help_ = help_
+        self._values: dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, labels, value
+
+
+class Counter(Metric):
+    """Only goes up; `set` is for mirroring a count kept elsewhere."""
+
+    type_ = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type_ = "gauge"
+
+
+class Histogram(Metric):
+    type_ = "histogram"
+
+    def __init__(self, name: str, help_: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[Labels, list[int]] = {}  # per bucket, the last one is +Inf
+
+    def set(self, value: float, **labels: str) -> None:
+        raise TypeError("Histograms are only observed.")
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(tuple(sorted(labels.items())), ()))
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        with self._lock:
+            observed = [(labels, list(counts), self._values[labels]) for labels, counts in self._counts.items()]
+        for labels, counts, total in observed:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                yield f"{self.name}_bucket", (*labels, ("le", format_value(bound))), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """
+    Metrics of the process. Callbacks registered with `on_collect` run
+    before every render, to copy values kept elsewhere, e.g. cache stats.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def counter(self, name: str, help_: str) -> Counter:
+        return self._register(name, Counter, lambda: Counter(name, help_))
+
+    def gauge(self, name: str, help_: str) -> Gauge:
+        return self._register(name, Gauge, lambda: Gauge(name, help_))
+
+    def histogram(self, name: str, help_: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, Histogram, lambda: Histogram(name, help_, buckets))
+
+    def on_collect(self, collect: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_}")
+            lines.append(f"# TYPE {metric.name} {metric.type_}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, name: str, type_: type[M], create: Callable[[], M]) -> M:
+        # A module imported twice, e.g. as `api.caches` and `src.api.caches`, shares its metrics
+        if name not in self.metrics:
+            self.metrics[name] = create()
+        metric = self.metrics[name]
+        if not isinstance(metric, type_):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type_}.")
+        return metric
+
+
+class RequestTimings:
+    """Seconds spent in every stage of one request, summed by stage name."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        stages = (*self.stages.items(), ("total", time.perf_counter() - self.started))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram("aviasales_stage_seconds", "Time spent in a stage of the request pipeline.")
+request_seconds = registry.histogram("aviasales_request_seconds", "Time from receiving a request to its response.")
+
+_timings: ContextVar[RequestTimings | None] = ContextVar("timings", default=None)
+
+
+def current_timings() -> RequestTimings | None:
+    return _timings.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timed(stage: str, func: Callable[P, R]) -> Callable[P, R]:
+    @wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with timer(stage):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class TimingMiddleware:
+    """
+    Collects the stage timings of every HTTP request, returns them in a
+    `Server-Timing` header and observes the whole request by endpoint.
+    Streamed bodies only report the stages before their first chunk.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        status = 500
+
+        async def send_with_timings(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"server-timing", timings.header().encode())]
+            await send(message)
+
+        token = _timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _timings.reset(token)
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")  # set by the router once matched
+            request_seconds.observe(
+                time.perf_counter() - timings.started, endpoint=endpoint, method=scope["method"], status=str(status)
+            )
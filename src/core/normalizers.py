@@ -1,4 +1,13 @@
+from bisect import bisect_left, insort
+from collections import deque
+from collections.abc import Callable
 from decimal import Decimal
+from typing import Protocol
+
+import numpy as np
+import numpy.typing as npt
+
+from core.types import Normalization
 
 
 class ExponentialMovingAverage:
@@ -26,3 +35,172 @@ class ExponentialMovingAverage:
         else:
             normalized_value = (value - self.mean) / self.mean
             return normalized_value
+
+
+def min_max(values: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Scales `values` to [0, 1]. A constant column carries no preference, it becomes zeros."""
+    if not len(values):
+        return values
+    low = values.min()
+    span = values.max() - low
+    return (values - low) / span if span else np.zeros_like(values)
+
+
+def z_score(values: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Centers `values` on their mean, in standard deviations."""
+    if not len(values):
+        return values
+    deviation = values.std()
+    return (values - values.mean()) / deviation if deviation else np.zeros_like(values)
+
+
+NORMALIZATIONS: dict[Normalization, Callable[[npt.NDArray[np.float64]], npt.NDArray[np.float64]]] = {
+    "min_max": min_max,
+    "z_score": z_score,
+}
+
+
+class RunningNormalizer(Protocol):
+    def update(self, value: float) -> None:
+        ...
+
+    def update_many(self, values: npt.ArrayLike) -> None:
+        ...
+
+    def normalize(self, values: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        ...
+
+
+class RunningMinMax:
+    """`min_max` over every value seen so far, in constant memory."""
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.min: float = np.inf
+        self.max: float = -np.inf
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def update_many(self, values: npt.ArrayLike) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def normalize(self, values: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        values = np.asarray(values, dtype=np.float64)
+        span = self.max - self.min
+        return (values - self.min) / span if self.count and span else np.zeros_like(values)
+
+
+class RunningMeanVariance:
+    """
+    `z_score` over every value seen so far, in constant memory. Uses
+    Welford's algorithm, batches are merged with Chan's formula, so
+    the result does not lose precision on long streams.
+    """
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.mean: float = 0.0
+        self._squares: float = 0.0  # sum of squared deviations from the mean
+
+    @property
+    def variance(self) -> float:
+        return self._squares / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._squares += delta * (value - self.mean)
+
+    def update_many(self, values: npt.ArrayLike) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        count = self.count + len(values)
+        mean = values.mean()
+        delta = mean - self.mean
+        self._squares += ((values - mean) ** 2).sum() + delta**2 * self.count * len(values) / count
+        self.mean += delta * len(values) / count
+        self.count = count
+
+    def normalize(self, values: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        values = np.asarray(values, dtype=np.float64)
+        deviation = self.std
+        return (values - self.mean) / deviation if deviation else np.zeros_like(values)
+
+
+class SlidingWindowQuantile:
+    """
+    A quantile of the last `window` values, e.g. the median price of
+    recent itineraries. Values are normalized like
+    `ExponentialMovingAverage` does, as a relative deviation, but from
+    the quantile, which outliers do not drag around.
+    """
+
+    def __init__(self, window: int, quantile: float = 0.5) -> None:
+        assert window > 0, "Window must be a positive int."
+        assert 0 <= quantile <= 1, "Quantile must be a float between 0 and 1."
+        self.window = window
+        self.quantile = quantile
+        self._values: deque[float] = deque()
+        self._sorted: list[float] = []
+
+    @property
+    def value(self) -> float:
+        if not self._sorted:
+            return 0.0
+        # Linear interpolation between the closest ranks, as `numpy.quantile` does by default
+        rank = self.quantile * (len(self._sorted) - 1)
+        low = int(rank)
+        high = min(low + 1, len(self._sorted) - 1)
+        return self._sorted[low] + (self._sorted[high] - self._sorted[low]) * (rank - low)
+
+    def update(self, value: float) -> None:
+        self._values.append(value)
+        insort(self._sorted, value)
+        if len(self._values) > self.window:
+            del self._sorted[bisect_left(self._sorted, self._values.popleft())]
+
+    def update_many(self, values: npt.ArrayLike) -> None:
+        values = np.asarray(values, dtype=np.float64)[-self.window :]
+        if len(values) * 32 < self.window:
+            # Merging copies the whole window, small batches are cheaper to insert one by one
+            for value in values.tolist():
+                self.update(value)
+            return
+
+        window = np.asarray(self._sorted, dtype=np.float64)
+
+        expired = len(self._values) + len(values) - self.window
+        if expired > 0:
+            leaving = np.sort([self._values.popleft() for _ in range(expired)])
+            # Equal values leave from consecutive slots
+            ranks = np.arange(len(leaving)) - np.searchsorted(leaving, leaving)
+            window = np.delete(window, np.searchsorted(window, leaving) + ranks)
+
+        arriving = np.sort(values)
+        self._sorted = np.insert(window, np.searchsorted(window, arriving), arriving).tolist()
+        self._values.extend(values.tolist())
+
+    def normalize(self, values: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        values = np.asarray(values, dtype=np.float64)
+        quantile = self.value
+        return (values - quantile) / quantile if quantile else np.zeros_like(values)
+
+
+RUNNING_NORMALIZATIONS: dict[Normalization, Callable[[], RunningNormalizer]] = {
+    "min_max": RunningMinMax,
+    "z_score": RunningMeanVariance,
+}
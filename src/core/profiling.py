@@ -0,0 +1,243 @@
+"""
+Profiles of single requests, taken on demand or for a sample of them.
+
+A profiled request records the stacks of the threads running its jobs,
+sampled every few milliseconds by a background thread, so concurrent
+requests do not mix. Requested profiles also run cProfile: since
+Python 3.12 it records every thread of the process and only one can
+be active, so at most one request holds it and the pstats include
+whatever else ran meanwhile.
+
+Every profile is written to a directory as `<id>.collapsed` (one
+`frame;frame;frame count` line per stack, the input of flamegraph.pl
+and speedscope), `<id>.pstats` when cProfile ran and `<id>.txt`, the
+hottest functions overall and in the processors.
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Container, Iterable
+from contextvars import ContextVar
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import ParamSpec, TypeVar
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+from anyio import CancelScope, to_thread
+
+from core.metrics import ASGIApp, Message, Receive, Scope, Send
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+Frame = tuple[str, str]  # file name and qualified name of the function
+Stack = tuple[Frame, ...]  # outermost frame first
+
+logger = logging.getLogger(__name__)
+
+HOT_FILES = ("api/processors.py", "api/indexes.py")  # reported on their own, where regressions show first
+
+
+def read_stack(frame: FrameType | None, stop: Container[CodeType] = ()) -> Stack:
+    """Frames from the outermost to `frame`, or from below the innermost one running a `stop` code."""
+    stack = []
+    while frame is not None and frame.f_code not in stop:
+        stack.append((frame.f_code.co_filename, frame.f_code.co_qualname))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def frame_label(frame: Frame) -> str:
+    return f"{Path(frame[0]).name}:{frame[1]}"
+
+
+class RequestProfile:
+    _cprofile_lock = threading.Lock()
+
+    def __init__(self, id_: str, deterministic: bool = False) -> None:
+        self.id_ = id_
+        self.stacks: Counter[Stack] = Counter()
+        self.threads: set[int] = set()
+        self.finished = False
+
+        self.cprofile: cProfile.Profile | None = None
+        if deterministic and self._cprofile_lock.acquire(blocking=False):
+            self.cprofile = cProfile.Profile()
+
+    def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        thread = threading.get_ident()
+        self.threads.add(thread)
+        try:
+            if self.cprofile is None or self.finished:  # cProfile may already be another request's
+                return func(*args, **kwargs)
+            return self.cprofile.runcall(func, *args, **kwargs)
+        finally:
+            self.threads.discard(thread)
+
+    def sample(self, frames: dict[int, FrameType]) -> None:
+        for thread in list(self.threads):
+            if (frame := frames.get(thread)) is not None:
+                self.stacks[read_stack(frame, stop=JOB_CODES)] += 1
+
+    def finish(self) -> None:
+        self.finished = True
+        if self.cprofile is not None:
+            self.cprofile.create_stats()
+            self._cprofile_lock.release()
+
+    def hot_functions(self, files: Iterable[str] = (), limit: int = 10) -> list[tuple[str, int, int]]:
+        """
+        Functions with the most samples, as (label, own samples, samples
+        anywhere in the stack), optionally only those defined in `files`.
+        """
+        own: Counter[Frame] = Counter()
+        total: Counter[Frame] = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+
+        files = tuple(files)
+        frames = [frame for frame in total if not files or frame[0].endswith(files)]
+        frames.sort(key=lambda frame: (own[frame], total[frame]), reverse=True)
+        return [(frame_label(frame), own[frame], total[frame]) for frame in frames[:limit]]
+
+    def dump(self, directory: str | os.PathLike[str]) -> None:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+
+        with open(path / f"{self.id_}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(map(frame_label, stack))} {count}\n")
+
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(path / f"{self.id_}.pstats")
+
+        samples = sum(self.stacks.values())
+        with open(path / f"{self.id_}.txt", "w") as f:
+            for title, files in (
+                ("Hottest functions", ()),
+                (f"Hottest functions in {', '.join(HOT_FILES)}", HOT_FILES),
+            ):
+                f.write(f"{title}, of {samples} samples:\n{'own':>8} {'total':>8}  function\n")
+                for label, own, total in self.hot_functions(files):
+                    f.write(f"{own:>8} {total:>8}  {label}\n")
+                f.write("\n")
+
+
+class Sampler:
+    """Samples the stacks of the running profiles from a daemon thread, started on first use."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.profiles: set[RequestProfile] = set()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self.profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="via-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self.profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self.profiles)
+            if profiles:
+                frames = sys._current_frames()
+                for profile in profiles:
+                    profile.sample(frames)
+
+
+# frames of the executor and of the profile itself are left out of the stacks
+JOB_CODES = frozenset((RequestProfile.run.__code__, cProfile.Profile.runcall.__code__))
+
+_profile: ContextVar[RequestProfile | None] = ContextVar("profile", default=None)
+
+
+def current_profile() -> RequestProfile | None:
+    return _profile.get()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it asks for it with `?profile=1` or a
+    `X-Profile: 1` header and an `X-Admin-Token` equal to `token`, and
+    a random `sample_rate` share of the others. Jobs run through a
+    `BoundedExecutor` are profiled; the response of a profiled request
+    names its files in a `X-Profile` header.
+    """
+
+    def __init__(
+        self, app: ASGIApp, directory: str, sample_rate: float = 0.0, token: str | None = None, interval: float = 0.005
+    ) -> None:
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.sampler = Sampler(interval)
+
+    def requested(self, scope: Scope) -> bool:
+        if self.token is None:
+            return False
+        headers = dict(scope.get("headers", ()))
+        query = parse_qs(scope.get("query_string", b"").decode())
+        asked = headers.get(b"x-profile") == b"1" or query.get("profile") == ["1"]
+        return asked and hmac.compare_digest(headers.get(b"x-admin-token", b""), self.token.encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = self.requested(scope)
+        if not requested and random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(uuid4().hex, deterministic=requested)
+
+        def finish() -> bool:
+            if profile.finished:
+                return False
+            self.sampler.stop(profile)
+            profile.finish()
+            try:
+                profile.dump(self.directory)
+            except OSError:
+                logger.exception("Cannot write profile %s to %s", profile.id_, self.directory)
+                return False
+            return True
+
+        # Writing the profile blocks for a while, it is done in a worker thread
+        async def send_with_profile(message: Message) -> None:
+            # the jobs of a response are done once it starts, except for streamed ones
+            if message["type"] == "http.response.start" and await to_thread.run_sync(finish):
+                message["headers"] = [*message.get("headers", ()), (b"x-profile", profile.id_.encode())]
+            await send(message)
+
+        token = _profile.set(profile)
+        self.sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _profile.reset(token)
+            if not profile.finished:
+                with CancelScope(shield=True):  # cProfile must be released even for cancelled requests
+                    await to_thread.run_sync(finish)
@@ -0,0 +1,88 @@
+"""
+Plain records of the itineraries a response returns. They hold values
+already read and converted from the XML, so turning them into the
+schemas of `core.schemas.itineraries` skips pydantic validation:
+records are built for returned items only, right before serializing.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from core.schemas.itineraries import (
+    Carrier,
+    Flight,
+    Flights,
+    Itinerary,
+    OnwardPricedItinerary,
+    Pricing,
+    ReturnPricedItinerary,
+    ServiceCharges,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class FlightRecord:
+    carrier_id: str
+    carrier: str
+    flight_number: int
+    source: str
+    destination: str
+    departure_time_stamp: datetime
+    arrival_time_stamp: datetime
+    class_: str
+    number_of_stops: int
+    fare_basis: str
+    warning_text: str | None
+    ticket_type: str
+
+    def to_schema(self) -> Flight:
+        return Flight.model_construct(
+            carrier=Carrier.model_construct(id_=self.carrier_id, carrier=self.carrier),
+            flight_number=self.flight_number,
+            source=self.source,
+            destination=self.destination,
+            departure_time_stamp=self.departure_time_stamp,
+            arrival_time_stamp=self.arrival_time_stamp,
+            class_=self.class_,
+            number_of_stops=self.number_of_stops,
+            fare_basis=self.fare_basis,
+            warning_text=self.warning_text,
+            ticket_type=self.ticket_type,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ServiceChargeRecord:
+    type_: str
+    charge_type: str
+    amount: Decimal
+
+    def to_schema(self) -> ServiceCharges:
+        return ServiceCharges.model_construct(
+            type_=self.type_, charge_type=self.charge_type, service_charges=self.amount
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ItineraryRecord:
+    onward: tuple[FlightRecord, ...]
+    return_: tuple[FlightRecord, ...] | None
+    currency: str
+    service_charges: tuple[ServiceChargeRecord, ...]
+
+    def to_schema(self) -> Itinerary:
+        onward = OnwardPricedItinerary.model_construct(
+            onward_priced_itinerary=Flights.model_construct(flights=[flight.to_schema() for flight in self.onward])
+        )
+        return_ = (
+            ReturnPricedItinerary.model_construct(
+                return_priced_itinerary=Flights.model_construct(flights=[flight.to_schema() for flight in self.return_])
+            )
+            if self.return_ is not None
+            else None
+        )
+        pricing = Pricing.model_construct(
+            currency=self.currency, service_charges=[charge.to_schema() for charge in self.service_charges]
+        )
+        return Itinerary.model_construct(flights=(onward, return_), pricing=pricing)
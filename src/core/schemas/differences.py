@@ -1,3 +1,4 @@
+from decimal import Decimal
 from typing import TypeAlias
 
 from pydantic import BaseModel
@@ -14,3 +15,29 @@ class Diff(BaseModel):
 
 class ListItinerariesDiff(BaseModel):
     files: dict[filename, Diff] | None = None
+
+
+class PricedItinerary(BaseModel):
+    flights: list[list[str]]
+    price: Decimal
+
+
+class PriceChange(BaseModel):
+    flights: list[list[str]]
+    old_price: Decimal
+    new_price: Decimal
+    delta: Decimal
+
+
+class ItinerariesPriceDiff(BaseModel):
+    added: list[PricedItinerary]
+    removed: list[PricedItinerary]
+    repriced: list[PriceChange]
+    unchanged: int
+
+
+class SnapshotDiff(BaseModel):
+    id: int
+    previous_id: int | None = None
+    routes: ListItinerariesDiff | None = None
+    prices: ItinerariesPriceDiff | None = None
@@ -1,10 +1,10 @@
 from decimal import Decimal
 from typing import TypeAlias
 
-from pydantic import ConfigDict, Field, field_serializer, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, field_validator
 from pydantic_xml import BaseXmlModel, attr, element
 
-from core.types import datetime
+from core.types import SortKey, SortOrder, datetime, parse_timestamp
 
 
 currency: TypeAlias = str  # noqa: UP040
@@ -32,7 +32,7 @@ class Flight(BaseXmlModel, tag="Flight"):
 
     @field_validator("departure_time_stamp", "arrival_time_stamp", mode="before")
     def datetime_converter(cls, v: str) -> datetime:
-        return datetime.strptime(v, r"%Y-%m-%dT%H%M")
+        return parse_timestamp(v)
 
     @field_validator("fare_basis", mode="before")
     def fare_basis_stripper(cls, v: str) -> str:
@@ -75,3 +75,31 @@ class Itinerary(BaseXmlModel, tag="Flights"):
 
 class ListItineraries(BaseXmlModel, tag="PricedItineraries"):
     priced_itineraries: list[Itinerary] | None = Field(default=None)
+
+
+class ItinerariesSummary(BaseModel):
+    optimal: ListItineraries
+    most_expensive: ListItineraries
+    cheapest: ListItineraries
+    longest: ListItineraries
+    shortest: ListItineraries
+
+
+class ItineraryQuery(BaseModel):
+    """One lookup of a batch, with the parameters of `/itineraries/specified`."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    id: str | None = None  # key of the results, the position of the query by default
+    source: str
+    destination: str
+    direct: bool = False
+    transit: bool = False
+    sort_by: SortKey | None = None
+    order: SortOrder = "asc"
+    limit: int | None = Field(default=None, ge=1)
+    offset: int = Field(default=0, ge=0)
+
+
+class BatchItineraries(BaseModel):
+    results: dict[str, ListItineraries]
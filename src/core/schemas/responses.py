@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class ResponseHandle(BaseModel):
+    id: str
+    filename: str | None = None
+    size: int
+    itineraries: int
+    roundtrip: bool
@@ -0,0 +1,49 @@
+import os
+from typing import Self
+
+from pydantic import BaseModel, ConfigDict
+
+
+class Settings(BaseModel):
+    """
+    Every field can be overridden with an environment variable
+    named after it, e.g. `AVIASALES_PARSE_CACHE_TTL=60`.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    max_upload_bytes: int = 256 * 2**20  # of a request body, 0 disables the limit
+    gzip_min_bytes: int = 2**14  # responses at least this large are gzipped for clients accepting it, 0 never
+    gzip_level: int = 5
+    xml_huge_tree: bool = False  # lifts the limits of libxml2 on depth and text size, for trusted suppliers only
+    batch_max_queries: int = 200  # of a request to /itineraries/specified/batch
+    # memory of a parsed upload, its tree and index, per byte of XML: measured 6.3 for RS_Via-3 and 9.8 for RS_ViaOW
+    parsed_size_factor: float = 10.0
+    parse_cache_max_bytes: int = 2**30  # of parsed uploads, estimated with `parsed_size_factor`
+    parse_cache_ttl: float = 300.0  # seconds
+    response_store_max_bytes: int = 2**30  # of parsed responses, estimated with `parsed_size_factor`
+    response_store_ttl: float = 1800.0  # seconds
+    executor_workers: int = 4  # 0 runs parsing and processing on the event loop
+    executor_max_concurrency: int | None = None  # defaults to the number of workers
+    executor_processes: int = 0  # worker processes reading compared files, 0 or 1 read them in the calling thread
+    diff_cache_max_bytes: int = 32 * 2**20  # of routes read from compared files
+    diff_cache_ttl: float = 1800.0  # seconds
+    snapshot_store_path: str = "snapshots.sqlite3"  # SQLite database, ":memory:" keeps snapshots until restart
+    snapshot_store_keep: int = 2  # snapshots kept per search key
+    profile_dir: str = "profiles"  # where request profiles are written
+    profile_sample_rate: float = 0.0  # share of requests profiled without asking
+    profile_token: str | None = None  # admin token of `?profile=1` requests, unset disables them
+    profile_interval: float = 0.005  # seconds between stack samples
+
+    @classmethod
+    def from_env(cls, prefix: str = "AVIASALES_") -> Self:
+        return cls.model_validate(
+            {
+                name: os.environ[prefix + name.upper()]
+                for name in cls.model_fields
+                if prefix + name.upper() in os.environ
+            }
+        )
+
+
+settings = Settings.from_env()
@@ -1,10 +1,33 @@
 from datetime import datetime as _datetime
-from typing import Annotated
+from functools import lru_cache
+from typing import Annotated, Literal
 
 from pydantic import PlainSerializer
 
 
+TIMESTAMP_FORMAT = r"%Y-%m-%dT%H%M"  # DepartureTimeStamp and ArrivalTimeStamp, e.g. 2018-10-22T0005
+
 datetime = Annotated[
     _datetime,
-    PlainSerializer(lambda dt: dt.strftime(r"%Y-%m-%dT%H%M"), return_type=str),
+    PlainSerializer(lambda dt: dt.strftime(TIMESTAMP_FORMAT), return_type=str),
 ]
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> _datetime:
+    """
+    Same as `datetime.strptime(value, TIMESTAMP_FORMAT)`, with a fast path
+    for the fixed-width form suppliers send. A response repeats the same
+    few departure and arrival times many times, so results are memoized;
+    datetimes are immutable and safe to share.
+    """
+    if len(value) == 15 and value[4] == value[7] == "-" and value[10] == "T":
+        digits = value[:4] + value[5:7] + value[8:10] + value[11:]
+        if digits.isascii() and digits.isdigit():
+            return _datetime(int(value[:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[13:]))
+    return _datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+SortKey = Literal["price", "duration", "optimal", "departure"]
+SortOrder = Literal["asc", "desc"]
+Normalization = Literal["min_max", "z_score"]
@@ -0,0 +1,269 @@
+"""
+Cheap checks of uploaded XML before it is parsed, and the options every
+parser of uploads uses: entities are not expanded, nothing is loaded
+from a DTD or the network, and libxml2 keeps its limits on depth and
+text size unless `settings.xml_huge_tree` lifts them. Request bodies
+may be compressed with gzip or deflate, or zstd when `zstandard` is
+installed.
+"""
+
+import threading
+import zlib
+from collections.abc import Callable, Iterator
+from functools import partial
+from typing import Any, BinaryIO, Protocol
+
+import lxml.etree as ET
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from core.metrics import ASGIApp, Message, Receive, Scope, Send
+from core.settings import settings
+
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+
+PARSER_OPTIONS: dict[str, Any] = {
+    "resolve_entities": False,
+    "load_dtd": False,
+    "no_network": True,
+    "huge_tree": settings.xml_huge_tree,
+}
+
+_local = threading.local()
+
+
+def xml_parser() -> ET.XMLParser:
+    """A parser with `PARSER_OPTIONS` per thread, lxml serializes threads sharing one."""
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = ET.XMLParser(**PARSER_OPTIONS)
+    return parser
+
+
+class InvalidXMLError(ValueError):
+    """Upload that is not well-formed XML or goes over the limits of libxml2. Unlike lxml's errors, it pickles."""
+
+
+class _Discard:
+    """Parser target without event callbacks: libxml2 never calls back into Python and no tree is built."""
+
+    def close(self) -> None:
+        return None
+
+
+def check_well_formed(file: BinaryIO) -> None:
+    """
+    Reads the whole file through libxml2 without building a tree, for
+    uploads parsed lazily once the response has started. Raises
+    `InvalidXMLError`; the file is rewound.
+    """
+    file.seek(0)
+    try:
+        ET.parse(file, parser=ET.XMLParser(target=_Discard(), **PARSER_OPTIONS))  # type: ignore[arg-type]
+    except ET.XMLSyntaxError as error:
+        raise InvalidXMLError(str(error)) from None
+    finally:
+        file.seek(0)
+
+
+def sniff_root(file: BinaryIO, max_bytes: int = 2**16, chunk_size: int = 2**12) -> str | None:
+    """
+    Tag of the root element, read from the first `max_bytes` of the
+    file at most; `None` when they are not well-formed XML or do not
+    get to the root element. The file is rewound.
+    """
+    parser = ET.XMLPullParser(events=("start",), **PARSER_OPTIONS)
+    file.seek(0)
+    try:
+        read = 0
+        while read < max_bytes and (chunk := file.read(min(chunk_size, max_bytes - read))):
+            read += len(chunk)
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                return element.tag
+    except ET.XMLSyntaxError:
+        return None
+    finally:
+        file.seek(0)
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies over `max_bytes` with 413: at once when
+    their Content-Length says so, otherwise as soon as the streamed
+    body goes over, before the rest is spooled.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than {self.max_bytes} bytes."
+        length = dict(scope.get("headers", ())).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+class Decoder(Protocol):
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        ...
+
+    def finish(self) -> None:
+        """Raises `ValueError` if the body ended in the middle of compressed data."""
+
+
+class ZlibDecoder:
+    """
+    Inflates gzip members (or zlib streams with `wbits=zlib.MAX_WBITS`)
+    one after another, `chunk_size` bytes of output at a time.
+    """
+
+    def __init__(self, wbits: int = 16 + zlib.MAX_WBITS, chunk_size: int = 2**16) -> None:
+        self.wbits = wbits
+        self.chunk_size = chunk_size
+        self._inflate = zlib.decompressobj(wbits=wbits)
+        self._pending = False  # in the middle of a member
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while data:
+                self._pending = True
+                yield self._inflate.decompress(data, self.chunk_size)
+                data = self._inflate.unconsumed_tail
+                if self._inflate.eof:  # another member may follow
+                    data, self._inflate = self._inflate.unused_data, zlib.decompressobj(wbits=self.wbits)
+                    self._pending = False
+        except zlib.error as error:
+            raise ValueError(f"Invalid compressed data: {error}") from error
+
+    def finish(self) -> None:
+        if self._pending:
+            raise ValueError("Truncated compressed data.")
+
+
+class ZstdDecoder:
+    """
+    zstandard decompresses a whole input at once, so inputs are fed
+    `slice_size` bytes at a time: the output of one call stays bounded
+    whatever the compression ratio.
+    """
+
+    def __init__(self, slice_size: int = 2**9) -> None:
+        if zstandard is None:
+            raise RuntimeError("zstd needs the zstandard package.")
+        self.slice_size = slice_size
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._decompress = self._decompressor.decompressobj()
+        self._pending = False  # in the middle of a frame
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        view = memoryview(data)
+        try:
+            for start in range(0, len(view), self.slice_size):
+                piece: bytes | memoryview = view[start : start + self.slice_size]
+                while piece:
+                    self._pending = True
+                    yield self._decompress.decompress(piece)
+                    piece = b""
+                    if self._decompress.eof:  # another frame may follow
+                        piece, self._decompress = self._decompress.unused_data, self._decompressor.decompressobj()
+                        self._pending = False
+        except zstandard.ZstdError as error:
+            raise ValueError(f"Invalid zstd data: {error}") from error
+
+    def finish(self) -> None:
+        if self._pending:
+            raise ValueError("Truncated zstd data.")
+
+
+DECODERS: dict[str, Callable[[], Decoder]] = {
+    "gzip": ZlibDecoder,
+    "x-gzip": ZlibDecoder,
+    "deflate": partial(ZlibDecoder, wbits=zlib.MAX_WBITS),  # zlib streams, as HTTP defines it
+}
+if zstandard is not None:
+    DECODERS["zstd"] = ZstdDecoder
+
+# the length and the encoding of the body an application reads from a decompressing receive are not known
+DROPPED_HEADERS = frozenset((b"content-encoding", b"content-length"))
+
+
+class DecompressionMiddleware:
+    """
+    Decompresses request bodies sent with a `Content-Encoding` of
+    `DECODERS` while they are received, so the multipart parser and
+    the upload limit only see decompressed bytes. Other encodings get
+    415, corrupted bodies 400.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = dict(scope.get("headers", ()))
+        encoding = headers.get(b"content-encoding", b"identity").decode("latin-1").strip().lower()
+        if scope["type"] != "http" or encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        if encoding not in DECODERS:
+            detail = f"Content-Encoding {encoding} is not supported, use one of {', '.join(DECODERS)}."
+            await JSONResponse({"detail": detail}, status_code=415)(scope, receive, send)
+            return
+
+        decoder = DECODERS[encoding]()
+        decoded: Iterator[bytes] = iter(())
+        more_body = True
+
+        async def receive_decompressed() -> Message:
+            nonlocal decoded, more_body
+            while True:
+                for chunk in decoded:
+                    if chunk:
+                        return {"type": "http.request", "body": chunk, "more_body": True}
+                if not more_body:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                more_body = message.get("more_body", False)
+                decoded = self._decode(decoder, message.get("body", b""), finish=not more_body)
+
+        # The scope is changed in place: outer middlewares read what the router writes into it
+        scope["headers"] = [(name, value) for name, value in scope["headers"] if name not in DROPPED_HEADERS]
+        await self.app(scope, receive_decompressed, send)
+
+    @staticmethod
+    def _decode(decoder: Decoder, data: bytes, finish: bool) -> Iterator[bytes]:
+        try:
+            yield from decoder.decode(data)
+            if finish:
+                decoder.finish()
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
@@ -1,8 +1,48 @@
 #!/usr/bin/python -u
-from fastapi import FastAPI
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
+from anyio import to_thread
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from api.executors import shutdown_processes, start_processes
 from api.routers import router
+from core.metrics import PROMETHEUS, TimingMiddleware, registry
+from core.profiling import ProfilingMiddleware
+from core.settings import settings
+from core.uploads import DecompressionMiddleware, InvalidXMLError, UploadLimitMiddleware
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await to_thread.run_sync(start_processes)
+    yield
+    shutdown_processes()
 
-app = FastAPI(title="Авиасейлс - Поиск дешёвых авиабилетов")
+
+app = FastAPI(title="Авиасейлс - Поиск дешёвых авиабилетов", lifespan=lifespan)
+if settings.gzip_min_bytes:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_min_bytes, compresslevel=settings.gzip_level)
+app.add_middleware(UploadLimitMiddleware, max_bytes=settings.max_upload_bytes)
+app.add_middleware(DecompressionMiddleware)
+app.add_middleware(
+    ProfilingMiddleware,
+    directory=settings.profile_dir,
+    sample_rate=settings.profile_sample_rate,
+    token=settings.profile_token,
+    interval=settings.profile_interval,
+)
+app.add_middleware(TimingMiddleware)
 app.include_router(router)
+
+
+@app.exception_handler(InvalidXMLError)
+async def invalid_xml(request: Request, error: InvalidXMLError) -> JSONResponse:
+    return JSONResponse({"detail": f"Invalid XML: {error}"}, status_code=400)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS)
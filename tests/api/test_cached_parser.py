@@ -0,0 +1,18 @@
+from src.api.caches import cached_parser, parsed_size, parsers
+
+
+def test_same_upload_is_parsed_once(rsvia3xml, uploadfile):
+    parsers.clear()
+    first = cached_parser(uploadfile(rsvia3xml))
+    second = cached_parser(uploadfile(rsvia3xml))
+    assert first is second
+
+
+def test_different_uploads_are_parsed_separately(rsvia3xml, rsviaowxml, uploadfile):
+    assert cached_parser(uploadfile(rsvia3xml)) is not cached_parser(uploadfile(rsviaowxml))
+
+
+def test_parsed_upload_is_charged_its_parsed_size(rsvia3xml, uploadfile):
+    parsers.clear()
+    cached_parser(uploadfile(rsvia3xml))
+    assert parsers.current_bytes == parsed_size(len(rsvia3xml[1])) > len(rsvia3xml[1])
@@ -1,5 +1,12 @@
+import gzip
+import json
+import re
+
+import httpx
 import pytest
 
+from api.caches import responses  # the instances the app uses, not `src.api.*`
+from api.snapshots import snapshots
 from tests.client import client
 
 
@@ -10,6 +17,80 @@ def test_invalid_file_response(faviconico):
     assert response.status_code == 400
 
 
+@pytest.mark.slow
+def test_unexpected_root_response(rsvia3xml):
+    xml = ("RS_Via-3.xml", rsvia3xml[1].replace(b"AirFareSearchResponse", b"AirFareSearchRequest"), rsvia3xml[2])
+    response = client.post("/api/v1/via/itineraries/all", files={"xml_file": xml})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Only AirFareSearchResponse documents are allowed."}
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize(
+    "url, fields",
+    [
+        ("/itineraries/all", ["xml_file"]),
+        ("/itineraries/all?stream=true", ["xml_file"]),
+        ("/itineraries/specified?source=DXB&destination=BKK&stream=true", ["xml_file"]),
+        ("/responses", ["xml_file"]),
+        ("/snapshots/truncated", ["xml_file"]),
+        ("/itineraries/difference", ["first_xml_file", "second_xml_file"]),
+        ("/itineraries/difference/prices", ["old_xml_file", "new_xml_file"]),
+    ],
+)
+def test_truncated_upload_response(url, fields, rsvia3xml, rsviaowxml):
+    truncated = ("RS_Via-3.xml", rsvia3xml[1][: len(rsvia3xml[1]) // 2], rsvia3xml[2])
+    files = dict(zip(fields, [truncated, rsviaowxml], strict=False))
+    response = client.post(f"/api/v1/via{url}", files=files)
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid XML: Premature end of data")
+
+
+@pytest.mark.slow
+def test_compressed_upload(rsvia3xml):
+    request = httpx.Request("POST", "/", files={"xml_file": rsvia3xml})
+    body, content_type = request.read(), request.headers["content-type"]
+    response = client.post(
+        "/api/v1/via/itineraries/summary",
+        content=gzip.compress(body),
+        headers={"content-type": content_type, "content-encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.json() == client.post("/api/v1/via/itineraries/summary", files={"xml_file": rsvia3xml}).json()
+
+
+def request_count(endpoint):
+    pattern = rf'aviasales_request_seconds_count{{endpoint="{endpoint}",method="POST",status="200"}} (\S+)'
+    match = re.search(pattern, client.get("/metrics").text)
+    return 0 if match is None else float(match.group(1))
+
+
+@pytest.mark.slow
+def test_compressed_upload_counted_under_its_endpoint(rsvia3xml):
+    request = httpx.Request("POST", "/", files={"xml_file": rsvia3xml})
+    body, content_type = request.read(), request.headers["content-type"]
+    counted, unmatched = request_count("cheapest_itinerary"), request_count("unmatched")
+    response = client.post(
+        "/api/v1/via/itineraries/cheapest",
+        content=gzip.compress(body),
+        headers={"content-type": content_type, "content-encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert (request_count("cheapest_itinerary"), request_count("unmatched")) == (counted + 1, unmatched)
+
+
+@pytest.mark.slow
+def test_compressed_response(rsvia3xml):
+    compressed = client.post("/api/v1/via/itineraries/all", files={"xml_file": rsvia3xml})
+    assert compressed.headers["content-encoding"] == "gzip"
+
+    raw = client.post(
+        "/api/v1/via/itineraries/all", files={"xml_file": rsvia3xml}, headers={"accept-encoding": "identity"}
+    )
+    assert "content-encoding" not in raw.headers
+    assert compressed.json() == raw.json()
+
+
 @pytest.mark.slow
 def test_all_response(rsvia3xml):
     response = client.post("/api/v1/via/itineraries/all", files={"xml_file": rsvia3xml})
@@ -68,6 +149,52 @@ def test_specified_itinerary_direct_and_transit_response(rsvia3xml):
     assert response.status_code == 200
 
 
+@pytest.mark.slow
+def test_batch_specified_response(rsvia3xml):
+    queries = [
+        {"source": "DXB", "destination": "BKK", "sort_by": "price", "limit": 2},
+        {"id": "back", "source": "BKK", "destination": "DXB", "direct": True},
+        {"source": "DXB", "destination": "BKK", "sort_by": "price", "limit": 2},
+    ]
+    response = client.post(
+        "/api/v1/via/itineraries/specified/batch", files={"xml_file": rsvia3xml}, data={"queries": json.dumps(queries)}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert list(results) == ["0", "back", "2"]
+
+    single = client.post(
+        "/api/v1/via/itineraries/specified?source=DXB&destination=BKK&sort_by=price&limit=2",
+        files={"xml_file": rsvia3xml},
+    )
+    assert results["0"] == results["2"] == single.json()
+    single = client.post(
+        "/api/v1/via/itineraries/specified?source=BKK&destination=DXB&direct=True", files={"xml_file": rsvia3xml}
+    )
+    assert results["back"] == single.json()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize(
+    "queries",
+    [
+        "not json",
+        "[]",
+        json.dumps([{"source": "DXB"}]),
+        json.dumps([{"source": "DXB", "destination": "BKK", "limit": 0}]),
+        json.dumps([{"source": "DXB", "destination": "BKK", "unknown": 1}]),
+        json.dumps([{"id": "1", "source": "DXB", "destination": "BKK"}, {"source": "DXB", "destination": "BKK"}]),
+        json.dumps([{"source": "DXB", "destination": "BKK"}] * 201),
+    ],
+)
+def test_batch_specified_invalid_queries_response(queries, rsvia3xml):
+    response = client.post(
+        "/api/v1/via/itineraries/specified/batch", files={"xml_file": rsvia3xml}, data={"queries": queries}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", "queries"]
+
+
 @pytest.mark.slow
 def test_optimal_response(rsvia3xml):
     response = client.post("/api/v1/via/itineraries/optimal", files={"xml_file": rsvia3xml})
@@ -96,7 +223,7 @@ def test_longest_two_side_response(rsvia3xml):
 def test_shortest_two_side_response(rsvia3xml):
     response = client.post("/api/v1/via/itineraries/shortest", files={"xml_file": rsvia3xml})
     assert response.status_code == 200
-    
+
 
 @pytest.mark.slow
 def test_longest_one_side_response(rsviaowxml):
@@ -110,6 +237,13 @@ def test_shortest_one_side_response(rsviaowxml):
     assert response.status_code == 200
 
 
+@pytest.mark.slow
+def test_summary_response(rsvia3xml):
+    response = client.post("/api/v1/via/itineraries/summary", files={"xml_file": rsvia3xml})
+    assert response.status_code == 200
+    assert set(response.json()) == {"optimal", "most_expensive", "cheapest", "longest", "shortest"}
+
+
 @pytest.mark.slow
 def test_difference_empty_response(rsvia3xml, rsviaowxml):
     response = client.post(
@@ -134,3 +268,181 @@ def test_difference_all_response(rsvia3xml, rsviaowxml):
         files={"first_xml_file": rsvia3xml, "second_xml_file": rsviaowxml},
     )
     assert response.status_code == 200
+
+
+@pytest.fixture
+def stored_response_id(rsvia3xml):
+    response = client.post("/api/v1/via/responses", files={"xml_file": rsvia3xml})
+    return response.json()["id"]
+
+
+@pytest.mark.slow
+def test_upload_response(rsvia3xml):
+    response = client.post("/api/v1/via/responses", files={"xml_file": rsvia3xml})
+    assert response.status_code == 201
+    assert response.json()["itineraries"] == 200
+
+
+@pytest.mark.slow
+def test_upload_response_larger_than_store(rsvia3xml, monkeypatch):
+    monkeypatch.setattr(responses, "max_bytes", len(rsvia3xml[1]))
+    stored = len(responses)
+    response = client.post("/api/v1/via/responses", files={"xml_file": rsvia3xml})
+    assert response.status_code == 413
+    assert len(responses) == stored
+
+
+@pytest.mark.slow
+def test_unknown_stored_response():
+    response = client.get("/api/v1/via/responses/unknown/cheapest")
+    assert response.status_code == 404
+
+
+@pytest.mark.slow
+def test_stored_response_matches_upload(stored_response_id, rsvia3xml):
+    stored = client.get(f"/api/v1/via/responses/{stored_response_id}/cheapest")
+    uploaded = client.post("/api/v1/via/itineraries/cheapest", files={"xml_file": rsvia3xml})
+    assert stored.status_code == 200
+    assert stored.json() == uploaded.json()
+
+
+@pytest.mark.slow
+def test_stored_specified_response(stored_response_id):
+    response = client.get(f"/api/v1/via/responses/{stored_response_id}/specified?source=DXB&destination=BKK")
+    assert response.status_code == 200
+
+
+@pytest.mark.slow
+def test_stored_difference_response(stored_response_id, rsviaowxml):
+    other_id = client.post("/api/v1/via/responses", files={"xml_file": rsviaowxml}).json()["id"]
+    response = client.get(f"/api/v1/via/responses/{stored_response_id}/difference/{other_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.slow
+def test_delete_stored_response(stored_response_id):
+    assert client.delete(f"/api/v1/via/responses/{stored_response_id}").status_code == 204
+    assert client.get(f"/api/v1/via/responses/{stored_response_id}").status_code == 404
+
+
+@pytest.mark.slow
+def test_all_ndjson_response(rsvia3xml):
+    response = client.post("/api/v1/via/itineraries/all?stream=true", files={"xml_file": rsvia3xml})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    expected = client.post("/api/v1/via/itineraries/all", files={"xml_file": rsvia3xml}).json()
+    assert lines == expected["priced_itineraries"]
+
+
+@pytest.mark.slow
+def test_specified_ndjson_accept_header(rsvia3xml):
+    url = "/api/v1/via/itineraries/specified?source=DXB&destination=BKK&direct=True"
+    response = client.post(url, files={"xml_file": rsvia3xml}, headers={"Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == client.post(url, files={"xml_file": rsvia3xml}).json()["priced_itineraries"]
+
+
+@pytest.mark.slow
+def test_all_itineraries_pagination(rsvia3xml):
+    url = "/api/v1/via/itineraries/all?sort_by=price&order=desc&limit=3&offset=1"
+    response = client.post(url, files={"xml_file": rsvia3xml})
+    assert response.status_code == 200
+    assert len(response.json()["priced_itineraries"]) == 3
+
+
+@pytest.mark.slow
+def test_all_ndjson_pagination(rsvia3xml):
+    url = "/api/v1/via/itineraries/all?stream=true&limit=2&offset=1"
+    lines = [json.loads(line) for line in client.post(url, files={"xml_file": rsvia3xml}).text.splitlines()]
+    assert (
+        lines
+        == client.post("/api/v1/via/itineraries/all", files={"xml_file": rsvia3xml}).json()["priced_itineraries"][1:3]
+    )
+
+
+@pytest.mark.slow
+def test_all_itineraries_invalid_limit(rsvia3xml):
+    response = client.post("/api/v1/via/itineraries/all?limit=0", files={"xml_file": rsvia3xml})
+    assert response.status_code == 422
+
+
+@pytest.mark.slow
+def test_optimal_weights_response(rsvia3xml):
+    url = "/api/v1/via/itineraries/optimal?price_weight=1&duration_weight=0&normalization=z_score"
+    response = client.post(url, files={"xml_file": rsvia3xml})
+    assert response.status_code == 200
+    cheapest = client.post("/api/v1/via/itineraries/cheapest", files={"xml_file": rsvia3xml})
+    assert response.json() == cheapest.json()
+
+
+@pytest.mark.slow
+def test_optimal_negative_weight(rsvia3xml):
+    response = client.post("/api/v1/via/itineraries/optimal?price_weight=-1", files={"xml_file": rsvia3xml})
+    assert response.status_code == 422
+
+
+@pytest.mark.slow
+def test_price_difference_response(rsvia3xml):
+    response = client.post(
+        "/api/v1/via/itineraries/difference/prices", files={"old_xml_file": rsvia3xml, "new_xml_file": rsvia3xml}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"added": [], "removed": [], "repriced": [], "unchanged": 200}
+
+
+@pytest.mark.slow
+def test_stored_price_difference_response(stored_response_id, rsviaowxml):
+    other_id = client.post("/api/v1/via/responses", files={"xml_file": rsviaowxml}).json()["id"]
+    response = client.get(f"/api/v1/via/responses/{stored_response_id}/difference/{other_id}/prices")
+    assert response.status_code == 200
+    body = response.json()
+    assert (len(body["removed"]), len(body["added"]), body["unchanged"]) == (200, 172, 0)
+    assert body["removed"][0]["flights"][0][0] == "AI996 DXB-DEL 2018-10-22T0005 2018-10-22T0445"
+
+
+@pytest.fixture
+def snapshot_store(tmp_path, monkeypatch):
+    snapshots.close()
+    monkeypatch.setattr(snapshots, "path", str(tmp_path / "snapshots.sqlite3"))
+    yield snapshots
+    snapshots.close()
+
+
+@pytest.mark.slow
+def test_push_snapshots(snapshot_store, rsvia3xml):
+    first = client.post("/api/v1/via/snapshots/DXB-BKK", files={"xml_file": rsvia3xml})
+    assert first.status_code == 201
+    assert first.json() == {"id": first.json()["id"], "previous_id": None, "routes": None, "prices": None}
+
+    second = client.post("/api/v1/via/snapshots/DXB-BKK", files={"xml_file": rsvia3xml}).json()
+    assert second["previous_id"] == first.json()["id"]
+    assert second["prices"] == {"added": [], "removed": [], "repriced": [], "unchanged": 200}
+    assert set(second["routes"]["files"]) == {str(second["previous_id"]), str(second["id"])}
+
+
+@pytest.mark.slow
+def test_delete_snapshots(snapshot_store, rsviaowxml):
+    client.post("/api/v1/via/snapshots/DXB-BKK", files={"xml_file": rsviaowxml})
+    assert client.delete("/api/v1/via/snapshots/DXB-BKK").status_code == 204
+    assert client.delete("/api/v1/via/snapshots/DXB-BKK").status_code == 404
+
+
+@pytest.mark.slow
+def test_server_timing_header(rsvia3xml):
+    response = client.post("/api/v1/via/itineraries/optimal", files={"xml_file": rsvia3xml})
+    assert response.status_code == 200
+    stages = [stage.split(";")[0] for stage in response.headers["server-timing"].split(", ")]
+    assert stages == ["upload", "parse", "query", "serialize", "encode", "total"]
+
+
+@pytest.mark.slow
+def test_metrics(rsvia3xml):
+    client.post("/api/v1/via/itineraries/cheapest", files={"xml_file": rsvia3xml})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'aviasales_stage_seconds_count{stage="parse"}' in response.text
+    assert 'aviasales_request_seconds_count{endpoint="cheapest_itinerary",method="POST",status="200"}' in response.text
+    assert "aviasales_parsed_itineraries 200" in response.text
+    assert 'aviasales_cache_entries{cache="parsers"}' in response.text
@@ -0,0 +1,111 @@
+from itertools import product
+
+import pytest
+
+from core.uploads import InvalidXMLError  # the class `api.indexes` raises, not `src.core.uploads`
+from src.api.indexes import NO_ROUTE, InternTable
+from src.api.processors import ViaComParser
+
+
+def test_index_covers_all_itineraries(rsvia3xml, uploadfile):
+    parser = ViaComParser(uploadfile(rsvia3xml))
+    assert len(parser.index) == len(parser.XML.xpath("PricedItineraries/Flights"))
+
+
+def test_index_columns(rsvia3xml, uploadfile):
+    index = ViaComParser(uploadfile(rsvia3xml)).index
+    assert index.prices[0] == 54680
+    assert index.onward_segments[0] == 2
+    assert index.airports[index.onward_sources[0]] == "DXB"
+    assert index.airports[index.onward_destinations[0]] == "BKK"
+    assert index.roundtrip is True
+
+
+@pytest.mark.parametrize("total, price", [("546.800", 54680), ("546", 54600)])
+def test_index_prices_in_minor_units(rsvia3xml, uploadfile, total, price):
+    name, content, content_type = rsvia3xml
+    content = content.replace(b">546.80<", f">{total}<".encode(), 1)
+    assert ViaComParser(uploadfile((name, content, content_type))).index.prices[0] == price
+
+
+def test_index_refuses_prices_finer_than_minor_units(rsvia3xml, uploadfile):
+    name, content, content_type = rsvia3xml
+    content = content.replace(b">546.80<", b">546.805<", 1)
+    with pytest.raises(InvalidXMLError, match="546.805"):
+        ViaComParser(uploadfile((name, content, content_type)))
+
+
+def test_index_one_way(rsviaowxml, uploadfile):
+    index = ViaComParser(uploadfile(rsviaowxml)).index
+    assert index.roundtrip is False
+    assert set(index.return_segments) == {0}
+
+
+def test_intern_table():
+    airports: InternTable[str] = InternTable()
+    assert airports.intern("DXB") == airports.intern("DXB") == 0
+    assert airports.intern("BKK") == 1
+    assert airports[1] == "BKK"
+    assert airports.get("KUL") is None
+
+
+def xpath_search(root, source, destination, direct, transit):
+    """The query `specified_itineraries` ran before the route index."""
+    if transit:
+        request = 'PricedItineraries/Flights[.//Source="{0}" and .//Destination="{1}" {2}]'
+    else:
+        request = 'PricedItineraries/Flights[.//Flight[1]/Source="{0}" and .//Flight[last()]/Destination="{1}" {2}]'
+    direct_filter = """
+        and ((./ReturnPricedItinerary and count(./OnwardPricedItinerary/Flights/Flight) = 1
+              and count(./ReturnPricedItinerary/Flights/Flight) = 1)
+             or count(./OnwardPricedItinerary/Flights/Flight) = 1)
+    """
+    return root.xpath(request.format(source, destination, direct_filter if direct else ""))
+
+
+@pytest.mark.parametrize("xml", ["rsvia3xml", "rsviaowxml"])
+def test_search_matches_xpath(xml, request, uploadfile):
+    parser = ViaComParser(uploadfile(request.getfixturevalue(xml)))
+    index = parser.index
+    airports = index.airports.values
+    for source, destination, direct, transit in product(airports, airports, (False, True), (False, True)):
+        expected = xpath_search(parser.XML, source, destination, direct, transit)
+        found = [index.elements[position] for position in index.search(source, destination, direct, transit)]
+        assert found == expected, (source, destination, direct, transit)
+
+
+def test_search_unknown_airport(rsvia3xml, uploadfile):
+    index = ViaComParser(uploadfile(rsvia3xml)).index
+    assert index.search("XXX", "BKK") == []
+    assert index.search('DXB"] | //*[@x="', "BKK") == []
+
+
+def xpath_routes(root, leg):
+    """The routes `unique_itineraries` read before the route signatures."""
+    routes = set()
+    for itinerary in root.xpath("//Flights"):
+        sources = itinerary.xpath(f".//{leg}/Flights/Flight/Source/text()")
+        destinations = itinerary.xpath(f".//{leg}/Flights/Flight/Destination/text()")
+        routes.add(tuple(f"{source}-{destination}" for source, destination in zip(sources, destinations, strict=True)))
+    routes.discard(tuple())
+    return routes
+
+
+@pytest.mark.parametrize("xml", ["rsvia3xml", "rsviaowxml"])
+def test_routes_match_xpath(xml, request, uploadfile):
+    parser = ViaComParser(uploadfile(request.getfixturevalue(xml)))
+    index = parser.index
+    for leg, routes in (("OnwardPricedItinerary", index.onward_routes), ("ReturnPricedItinerary", index.return_routes)):
+        assert {index.route(route) for route in routes if route != NO_ROUTE} == xpath_routes(parser.XML, leg)
+
+
+def test_route_signature(rsvia3xml, uploadfile):
+    index = ViaComParser(uploadfile(rsvia3xml)).index
+    assert index.route(index.onward_routes[0]) == ("DXB-DEL", "DEL-BKK")
+    assert [index.airports[airport] for airport in index.routes[index.onward_routes[0]]] == ["DXB", "DEL", "DEL", "BKK"]
+    assert len(index.routes) < len(index)  # itineraries flying the same route share it
+
+
+def test_one_way_has_no_return_routes(rsviaowxml, uploadfile):
+    index = ViaComParser(uploadfile(rsviaowxml)).index
+    assert set(index.return_routes) == {NO_ROUTE}
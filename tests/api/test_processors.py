@@ -1,4 +1,22 @@
-from src.api.processors import ViaComDiffProcessor, ViaComParser
+import lxml.etree as ET
+import numpy as np
+import pytest
+
+from src.api.processors import (
+    OptimalSelector,
+    ViaComDataProcessor,
+    ViaComDiffProcessor,
+    ViaComOptimalMixin,
+    ViaComParser,
+    ViaComStreamDataProcessor,
+    ViaComStreamDiffProcessor,
+    ViaComStreamParser,
+)
+from src.core.schemas.itineraries import ItineraryQuery
+
+
+def serialize(answer):
+    return [ET.tostring(itinerary) for itinerary in (answer if isinstance(answer, list) else [answer])]
 
 
 def test_unique_itineraries_with_return_itineraries(rsvia3xml, uploadfile):
@@ -6,3 +24,172 @@ def test_unique_itineraries_with_return_itineraries(rsvia3xml, uploadfile):
     processor = ViaComDiffProcessor(parser)
     response = processor.unique_itineraries(return_itineraries=True)
     assert isinstance(response, set)
+
+
+@pytest.mark.parametrize(
+    "method",
+    ["optimal_itinerary", "most_expensive_itinerary", "cheapest_itinerary", "longest_itinerary", "shortest_itinerary"],
+)
+def test_stream_processor_matches_tree_processor(method, rsvia3xml, uploadfile):
+    tree = getattr(ViaComDataProcessor(ViaComParser(uploadfile(rsvia3xml))), method)()
+    stream = getattr(ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(rsvia3xml))), method)()
+    assert serialize(stream) == serialize(tree)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"source": "DXB", "destination": "BKK"},
+        {"source": "DXB", "destination": "BKK", "direct": True},
+        {"source": "DEL", "destination": "BKK", "transit": True},
+    ],
+)
+def test_stream_specified_itineraries(query, rsviaowxml, uploadfile):
+    tree = ViaComDataProcessor(ViaComParser(uploadfile(rsviaowxml))).specified_itineraries(**query)
+    stream = ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(rsviaowxml))).specified_itineraries(**query)
+    assert [ET.tostring(itinerary) for itinerary in stream] == serialize(tree)
+
+
+def test_stream_direct_without_onward_flights(rsviaowxml, uploadfile):
+    name, content, content_type = rsviaowxml
+    root = ET.fromstring(content)
+    for itinerary in list(root.find("PricedItineraries"))[:2]:
+        onward = itinerary.find("OnwardPricedItinerary")
+        onward.remove(onward.find("Flights"))
+    broken = (name, ET.tostring(root), content_type)
+
+    query = {"source": "DXB", "destination": "BKK", "direct": True}
+    tree = ViaComDataProcessor(ViaComParser(uploadfile(broken))).specified_itineraries(**query)
+    stream = ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(broken))).specified_itineraries(**query)
+    assert [ET.tostring(itinerary) for itinerary in stream] == serialize(tree)
+
+
+@pytest.mark.parametrize("xml", ["rsvia3xml", "rsviaowxml"])
+def test_stream_diff_facts(xml, request, uploadfile):
+    xml = request.getfixturevalue(xml)
+    tree = ViaComDiffProcessor(ViaComParser(uploadfile(xml))).facts()
+    assert ViaComStreamDiffProcessor(ViaComStreamParser(uploadfile(xml))).facts() == tree
+
+
+def test_stream_unique_itineraries(rsvia3xml, uploadfile):
+    tree = ViaComDiffProcessor(ViaComParser(uploadfile(rsvia3xml)))
+    stream = ViaComStreamDiffProcessor(ViaComStreamParser(uploadfile(rsvia3xml)))
+    assert stream.is_roundtrip() is tree.is_roundtrip()
+    assert stream.ticket_types() == tree.ticket_types()
+    assert stream.unique_itineraries(return_itineraries=True) == tree.unique_itineraries(return_itineraries=True)
+
+
+@pytest.mark.parametrize("processor", ["tree", "stream"])
+def test_summary_matches_single_metrics(processor, rsviaowxml, uploadfile):
+    def make():
+        if processor == "tree":
+            return ViaComDataProcessor(ViaComParser(uploadfile(rsviaowxml)))
+        return ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(rsviaowxml)))
+
+    summary = make().summary()
+    for metric in ("optimal", "most_expensive", "cheapest", "longest", "shortest"):
+        assert serialize(summary[metric]) == serialize(getattr(make(), f"{metric}_itinerary")())
+
+
+@pytest.mark.parametrize("sort_by", ["price", "duration", "departure", "optimal"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("limit, offset", [(None, 0), (5, 0), (5, 3), (None, 7)])
+def test_paginate_matches_full_sort(sort_by, order, limit, offset, rsvia3xml, uploadfile):
+    processor = ViaComDataProcessor(ViaComParser(uploadfile(rsvia3xml)))
+    itineraries = processor.all_itineraries()
+    page = processor.paginate(itineraries, sort_by=sort_by, order=order, limit=limit, offset=offset)
+
+    key = processor._sort_key(sort_by)
+    positions = sorted(range(len(itineraries)), key=key, reverse=order == "desc")
+    end = None if limit is None else offset + limit
+    assert [key(position) for position in processor.parser.index.positions(page)] == [
+        key(position) for position in positions[offset:end]
+    ]
+
+
+def test_paginate_keeps_document_order(rsviaowxml, uploadfile):
+    processor = ViaComDataProcessor(ViaComParser(uploadfile(rsviaowxml)))
+    itineraries = processor.specified_itineraries("DXB", "BKK")
+    assert processor.paginate(itineraries, limit=3, offset=2) == itineraries[2:5]
+
+
+def test_batch_specified_matches_single_queries(rsvia3xml, uploadfile):
+    processor = ViaComDataProcessor(ViaComParser(uploadfile(rsvia3xml)))
+    queries = [
+        ItineraryQuery(source="DXB", destination="BKK"),
+        ItineraryQuery(source="DXB", destination="BKK", sort_by="price", limit=3),
+        ItineraryQuery(source="DXB", destination="BKK", direct=True),
+        ItineraryQuery(source="BKK", destination="DXB", transit=True, offset=1),
+        ItineraryQuery(source="DXB", destination="XXX"),
+    ]
+    answers = processor.batch_specified_itineraries(queries)
+
+    assert len(answers) == len(queries)
+    for query, answer in zip(queries, answers, strict=True):
+        itineraries = processor.specified_itineraries(
+            query.source, query.destination, direct=query.direct, transit=query.transit
+        )
+        page = processor.paginate(
+            itineraries, sort_by=query.sort_by, order=query.order, limit=query.limit, offset=query.offset
+        )
+        assert answer == page
+    assert answers[-1] == []
+
+
+@pytest.mark.parametrize("processor", ["tree", "stream"])
+def test_optimal_weights(processor, rsvia3xml, uploadfile):
+    def make():
+        if processor == "tree":
+            return ViaComDataProcessor(ViaComParser(uploadfile(rsvia3xml)))
+        return ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(rsvia3xml)))
+
+    by_price = make().optimal_itinerary(price_weight=1, duration_weight=0)
+    assert serialize(by_price) == serialize(make().cheapest_itinerary())
+    by_duration = make().optimal_itinerary(price_weight=0, duration_weight=1, normalization="z_score")
+    assert serialize(by_duration) == serialize(make().shortest_itinerary())
+
+
+def test_optimal_does_not_depend_on_order(rsvia3xml, uploadfile):
+    processor = ViaComDataProcessor(ViaComParser(uploadfile(rsvia3xml)))
+    index = processor.parser.index
+    durations = [index.duration(position) for position in range(len(index))]
+    scores = processor._optimal_scores(index.prices, durations)
+    reversed_scores = processor._optimal_scores(index.prices[::-1], durations[::-1])
+    assert scores.tolist() == reversed_scores[::-1].tolist()
+
+
+@pytest.mark.parametrize(
+    "scoring",
+    [
+        {},
+        {"price_weight": 0.2, "duration_weight": 0.8},
+        {"price_weight": 1, "duration_weight": 0},
+        {"price_weight": 0, "duration_weight": 0},
+        {"normalization": "z_score"},
+    ],
+)
+def test_optimal_selector_matches_two_pass(scoring):
+    rng = np.random.default_rng(0)
+    prices = rng.integers(100, 110, size=300)
+    durations = rng.integers(10, 20, size=300)
+
+    selector = OptimalSelector[int](**scoring)
+    for position, (price, duration) in enumerate(zip(prices, durations, strict=True)):
+        selector.offer(int(price), int(duration), position)
+
+    scores = ViaComOptimalMixin()._optimal_scores(prices, durations, **scoring)
+    assert [position for position, _ in selector.selected] == ViaComOptimalMixin()._lowest_scores(scores)
+
+
+def test_stream_optimal_with_repeated_itineraries(rsvia3xml, uploadfile):
+    name, content, content_type = rsvia3xml
+    root = ET.fromstring(content)
+    priced_itineraries = root.find("PricedItineraries")
+    for itinerary in list(priced_itineraries):
+        priced_itineraries.append(ET.fromstring(ET.tostring(itinerary)))
+    doubled = (name, ET.tostring(root), content_type)
+
+    tree = ViaComDataProcessor(ViaComParser(uploadfile(doubled))).optimal_itinerary()
+    stream = ViaComStreamDataProcessor(ViaComStreamParser(uploadfile(doubled))).optimal_itinerary()
+    assert len(tree) == 2
+    assert serialize(stream) == serialize(tree)
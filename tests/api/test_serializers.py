@@ -0,0 +1,14 @@
+import lxml.etree as ET
+
+from src.api.processors import ViaComDataProcessor, ViaComParser
+from src.api.serializers import itinerary_to_record
+from src.core.schemas.itineraries import Itinerary
+
+
+def test_itinerary_record_matches_xml_model(rsvia3xml, rsviaowxml, uploadfile):
+    for xml in (rsvia3xml, rsviaowxml):
+        for itinerary in ViaComDataProcessor(ViaComParser(uploadfile(xml))).all_itineraries()[:20]:
+            expected = Itinerary.from_xml(ET.tostring(itinerary))
+            model = itinerary_to_record(itinerary).to_schema()
+            assert model.model_dump() == expected.model_dump()
+            assert model.model_dump_json(by_alias=True) == expected.model_dump_json(by_alias=True)
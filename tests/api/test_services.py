@@ -1,8 +1,140 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple
+from decimal import Decimal
+
+import lxml.etree as ET
 import pytest
 
-from src.api.services import ViaComComparator, InvalidValueError
+from core.uploads import InvalidXMLError  # the class worker processes raise, not `src.core.uploads`
+from src.api import caches, executors
+from src.api.caches import cached_diff_facts, diff_facts
+from src.api.processors import ViaComDiffProcessor, ViaComParser
+from src.api.services import InvalidValueError, ViaComComparator, ViaComPriceComparator
+from src.core.schemas.differences import ItinerariesPriceDiff
+from src.core.settings import Settings
 
 
 def test_invalid_interaries_flag(rsvia3xml, rsviaowxml, uploadfile):
     with pytest.raises(InvalidValueError):
         ViaComComparator(uploadfile(rsvia3xml), uploadfile(rsviaowxml), itineraries="Я летал меня катали")()
+
+
+@pytest.mark.parametrize("itineraries", ["all", "diff"])
+def test_comparator_matches_pairwise_difference(itineraries, rsvia3xml, rsviaowxml, uploadfile):
+    xmls = [rsvia3xml, rsviaowxml, rsvia3xml]
+    compared = ViaComComparator(*(uploadfile(xml) for xml in xmls), itineraries=itineraries)()
+
+    processors = [ViaComDiffProcessor(ViaComParser(uploadfile(xml))) for xml in xmls]
+    return_itineraries = all(processor.is_roundtrip() for processor in processors)
+    routes = [processor.unique_itineraries(return_itineraries) for processor in processors]
+    if itineraries == "diff":
+        routes = [own.difference(*routes[:index], *routes[index + 1 :]) for index, own in enumerate(routes)]
+
+    # Files sharing a name share a key, the last one wins
+    assert compared["files"]["RS_Via-3.xml"]["routes"] == routes[2]
+    assert compared["files"]["RS_ViaOW.xml"]["routes"] == routes[1]
+    assert compared["files"]["RS_ViaOW.xml"]["ticket_types"] == processors[1].ticket_types()
+
+
+def test_diff_facts_are_read_once(rsvia3xml, rsviaowxml, uploadfile):
+    diff_facts.clear()
+    misses = diff_facts.misses
+    first = cached_diff_facts([uploadfile(rsvia3xml), uploadfile(rsviaowxml), uploadfile(rsvia3xml)])
+    assert first[0] is first[2]
+    assert diff_facts.misses == misses + 2
+
+    second = cached_diff_facts([uploadfile(rsviaowxml), uploadfile(rsvia3xml)])
+    assert second[0] is first[1] and second[1] is first[0]
+    assert diff_facts.misses == misses + 2
+
+
+def test_diff_facts_without_worker_processes_are_streamed(monkeypatch, rsvia3xml, rsviaowxml, uploadfile):
+    diff_facts.clear()
+    caches.parsers.clear()
+    monkeypatch.setattr(caches, "processes", None)
+    files = [uploadfile(rsvia3xml), uploadfile(rsviaowxml)]
+    facts = cached_diff_facts(files)
+
+    expected = [ViaComDiffProcessor(ViaComParser(uploadfile(xml))).facts() for xml in (rsvia3xml, rsviaowxml)]
+    assert list(map(astuple, facts)) == list(map(astuple, expected))
+    assert len(caches.parsers) == 0
+    assert all(file.file.tell() == 0 for file in files)
+
+
+def test_diff_facts_in_worker_processes(monkeypatch, rsvia3xml, rsviaowxml, uploadfile):
+    diff_facts.clear()
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        monkeypatch.setattr(caches, "processes", pool)
+        facts = cached_diff_facts([uploadfile(rsvia3xml), uploadfile(rsviaowxml)])
+    expected = [ViaComDiffProcessor(ViaComParser(uploadfile(xml))).facts() for xml in (rsvia3xml, rsviaowxml)]
+    assert list(map(astuple, facts)) == list(map(astuple, expected))
+
+
+def test_invalid_xml_in_worker_processes(monkeypatch, rsvia3xml, rsviaowxml, uploadfile):
+    diff_facts.clear()
+    truncated = ("RS_Via-3.xml", rsvia3xml[1][: len(rsvia3xml[1]) // 2], rsvia3xml[2])
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        monkeypatch.setattr(caches, "processes", pool)
+        with pytest.raises(InvalidXMLError):
+            cached_diff_facts([uploadfile(truncated), uploadfile(rsviaowxml)])
+
+
+def test_worker_processes_start_up_front(monkeypatch):
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        monkeypatch.setattr(executors, "processes", pool)
+        monkeypatch.setattr(executors, "settings", Settings(executor_processes=2))
+        executors.start_processes()
+        assert len(pool._processes) == 2
+
+
+def drift(xml):
+    """RS_Via-3 one snapshot later: first itinerary repriced, second one gone, one new."""
+    root = ET.fromstring(xml[1])
+    itineraries = root.find("PricedItineraries")
+    total = itineraries[0].find("Pricing/ServiceCharges[@ChargeType='TotalAmount']")
+    total.text = str(Decimal(total.text) - Decimal("10.50"))
+    itineraries.remove(itineraries[1])
+    new = ET.fromstring(ET.tostring(itineraries[2]))
+    new.find("OnwardPricedItinerary/Flights/Flight/FlightNumber").text = "1"
+    itineraries.append(new)
+    return ("RS_Via-3-drift.xml", ET.tostring(root), xml[2])
+
+
+def test_price_comparator(rsvia3xml, uploadfile):
+    old = ViaComParser(uploadfile(rsvia3xml))
+    compared = ViaComPriceComparator(uploadfile(rsvia3xml), uploadfile(drift(rsvia3xml)))()
+
+    assert [change["delta"] for change in compared["repriced"]] == [Decimal("-10.50")]
+    assert compared["repriced"][0]["old_price"] == old.index.price(0)
+    assert [itinerary["flights"] for itinerary in compared["removed"]] == [old.index.signatures()[1]]
+    assert len(compared["added"]) == 1
+    assert compared["added"][0]["flights"][0][0].startswith("MH1 ")
+    assert compared["unchanged"] == len(old.index) - 2
+
+
+def test_price_comparator_keeps_cents(rsvia3xml, uploadfile):
+    repriced = drift(rsvia3xml)[1].replace(b">536.30<", b">500.00<", 1)
+    compared = ViaComPriceComparator(uploadfile(rsvia3xml), uploadfile(("RS_Via-3-drift.xml", repriced, "text/xml")))()
+
+    change = ItinerariesPriceDiff.model_validate(compared).model_dump(mode="json")["repriced"][0]
+    assert (change["old_price"], change["new_price"], change["delta"]) == ("546.80", "500.00", "-46.80")
+    assert str(compared["removed"][0]["price"]) == "623.80"
+
+
+def test_price_comparator_same_snapshot(rsviaowxml, uploadfile):
+    compared = ViaComPriceComparator(uploadfile(rsviaowxml), uploadfile(rsviaowxml))()
+    assert compared == {"added": [], "removed": [], "repriced": [], "unchanged": 172}
+
+
+def test_price_comparator_pairs_repeated_signatures(rsviaowxml, uploadfile):
+    root = ET.fromstring(rsviaowxml[1])
+    itineraries = root.find("PricedItineraries")
+    itineraries.append(ET.fromstring(ET.tostring(itineraries[0])))
+    repeated = ("RS_ViaOW-repeated.xml", ET.tostring(root), rsviaowxml[2])
+
+    compared = ViaComPriceComparator(uploadfile(rsviaowxml), uploadfile(repeated))()
+    assert compared["unchanged"] == 172
+    assert [itinerary["flights"] for itinerary in compared["added"]] == [
+        ViaComParser(uploadfile(rsviaowxml)).index.signatures()[0]
+    ]
@@ -0,0 +1,60 @@
+from dataclasses import astuple
+
+import pytest
+
+from src.api.processors import ViaComDiffProcessor, ViaComParser
+from src.api.snapshots import SnapshotStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    yield store
+    store.close()
+
+
+def push(store, search_key, parser, digest="digest"):
+    return store.push(search_key, "RS.xml", digest, ViaComDiffProcessor(parser).facts(), parser.index)
+
+
+def test_first_snapshot_has_no_previous(store, rsvia3xml, uploadfile):
+    previous, current = push(store, "DXB-BKK", ViaComParser(uploadfile(rsvia3xml)))
+    assert previous is None
+    assert store.latest("DXB-BKK").id_ == current.id_
+    assert store.latest("DXB-DEL") is None
+
+
+def test_snapshot_round_trip(store, tmp_path, rsvia3xml, uploadfile):
+    parser = ViaComParser(uploadfile(rsvia3xml))
+    _, current = push(store, "DXB-BKK", parser)
+    store.close()
+
+    loaded = SnapshotStore(store.path).latest("DXB-BKK")
+    assert astuple(loaded.facts) == astuple(current.facts)
+    assert loaded.itineraries.signatures() == parser.index.signatures()
+    assert list(loaded.itineraries.prices) == list(parser.index.prices)
+    assert loaded.itineraries.price(0) == parser.index.price(0)
+
+
+def test_push_returns_previous_snapshot(store, rsvia3xml, rsviaowxml, uploadfile):
+    _, first = push(store, "search", ViaComParser(uploadfile(rsvia3xml)))
+    previous, second = push(store, "search", ViaComParser(uploadfile(rsviaowxml)), digest="other")
+    assert previous.id_ == first.id_
+    assert previous.digest == "digest"
+    assert len(previous.itineraries) == 200
+    assert len(second.itineraries) == 172
+
+
+def test_only_last_snapshots_are_kept(store, rsviaowxml, uploadfile):
+    parser = ViaComParser(uploadfile(rsviaowxml))
+    ids = [push(store, "search", parser)[1].id_ for _ in range(4)]
+    rows = store.connection.execute("SELECT id FROM snapshots ORDER BY id").fetchall()
+    assert [id_ for (id_,) in rows] == ids[-store.keep :]
+    assert store.connection.execute("SELECT COUNT(*) FROM itineraries").fetchone()[0] == 172 * store.keep
+
+
+def test_delete_snapshots(store, rsviaowxml, uploadfile):
+    push(store, "search", ViaComParser(uploadfile(rsviaowxml)))
+    assert store.delete("search") == 1
+    assert store.latest("search") is None
+    assert store.delete("search") == 0
@@ -0,0 +1,52 @@
+import pytest
+
+from src.core.caches import LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    return LRUCache(max_bytes=10, ttl=60, clock=clock)
+
+
+def test_hit_and_miss_counters(cache):
+    assert cache.get("a") is None
+    cache.set("a", 1, size=1)
+    assert cache.get("a") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(cache):
+    cache.set("a", 1, size=4)
+    cache.set("b", 2, size=4)
+    cache.get("a")
+    cache.set("c", 3, size=4)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.current_bytes == 8
+    assert cache.evictions == 1
+
+
+def test_oversized_value_is_not_stored(cache):
+    assert cache.set("a", 1, size=11) is False
+    assert len(cache) == 0
+    assert cache.set("a", 1, size=10) is True
+
+
+def test_ttl(cache, clock):
+    cache.set("a", 1, size=1)
+    clock.now = 61
+    assert cache.get("a") is None
+    assert cache.current_bytes == 0
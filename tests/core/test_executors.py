@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.executors import BoundedExecutor
+
+
+def test_runs_in_executor_thread():
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=1), max_concurrency=1)
+    thread = asyncio.run(executor.run(threading.get_ident))
+    assert thread != threading.get_ident()
+    assert executor.completed == 1
+
+
+def test_inline_without_executor():
+    executor = BoundedExecutor(None, max_concurrency=1)
+    assert asyncio.run(executor.run(threading.get_ident)) == threading.get_ident()
+
+
+def test_concurrency_limit():
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=4), max_concurrency=2)
+    release = threading.Event()
+    observed = []
+
+    async def main():
+        jobs = [asyncio.create_task(executor.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        observed.append((executor.running, executor.queued))
+        release.set()
+        await asyncio.gather(*jobs)
+
+    asyncio.run(main())
+    assert observed == [(2, 1)]
+    assert (executor.running, executor.queued, executor.completed) == (0, 0, 3)
+
+
+def test_run_on_other_executor():
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=1), max_concurrency=1)
+    worker = ThreadPoolExecutor(max_workers=1)
+    first = asyncio.run(executor.run_on(worker, threading.get_ident))
+    assert asyncio.run(executor.run_on(worker, threading.get_ident)) == first
+    assert asyncio.run(executor.run(threading.get_ident)) != first
+    assert executor.completed == 3
+
+
+def test_jobs_see_caller_context():
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=1), max_concurrency=1)
+    variable = contextvars.ContextVar("variable", default=None)
+
+    async def main():
+        variable.set("caller")
+        return await executor.run(variable.get)
+
+    assert asyncio.run(main()) == "caller"
+
+
+def test_concurrency_limit_in_each_loop():
+    """Built outside any loop, like the module-level executors, and used by successive loops."""
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=2), max_concurrency=1)
+
+    async def main():
+        await asyncio.gather(*(executor.run(threading.get_ident) for _ in range(3)))
+
+    asyncio.run(main())
+    asyncio.run(main())
+    assert (executor.running, executor.queued, executor.completed) == (0, 0, 6)
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from src.core.metrics import Registry, RequestTimings, TimingMiddleware, _timings, format_value, timed, timer
+
+
+def test_render_counter_and_gauge():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.")
+    temperature = registry.gauge("temperature", "Degrees.")
+    requests.inc(method="GET")
+    requests.inc(2, method="GET")
+    temperature.set(-1.5, room='big "hall"')
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET"} 3',
+        "# HELP temperature Degrees.",
+        "# TYPE temperature gauge",
+        r'temperature{room="big \"hall\""} -1.5',
+    ]
+
+
+def test_render_histogram():
+    registry = Registry()
+    seconds = registry.histogram("seconds", "Seconds.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        seconds.observe(value, stage="parse")
+
+    assert registry.render().splitlines()[2:] == [
+        'seconds_bucket{stage="parse",le="0.1"} 2',
+        'seconds_bucket{stage="parse",le="1"} 3',
+        'seconds_bucket{stage="parse",le="+Inf"} 4',
+        'seconds_sum{stage="parse"} 3.65',
+        'seconds_count{stage="parse"} 4',
+    ]
+    with pytest.raises(TypeError):
+        seconds.set(1.0)
+
+
+def test_collectors_run_before_render():
+    registry = Registry()
+    entries = registry.gauge("entries", "Entries.")
+    registry.on_collect(lambda: entries.set(42))
+    assert "entries 42" in registry.render()
+
+
+def test_duplicate_metric():
+    registry = Registry()
+    entries = registry.gauge("entries", "Entries.")
+    assert registry.gauge("entries", "Entries.") is entries
+    with pytest.raises(ValueError):
+        registry.counter("entries", "Entries.")
+
+
+def test_format_value():
+    assert [format_value(value) for value in (3.0, 0.25, float("inf"), 10**12)] == [
+        "3",
+        "0.25",
+        "+Inf",
+        "1000000000000",
+    ]
+
+
+def test_stages_summed_per_request():
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        with timer("query"):
+            pass
+        timed("query", lambda: None)()
+        timed("parse", lambda: None)()
+    finally:
+        _timings.reset(token)
+
+    assert list(timings.stages) == ["query", "parse"]
+    assert timings.header().startswith("query;dur=0.0, parse;dur=0.0, total;dur=")
+
+
+def test_middleware_adds_server_timing():
+    async def app(scope, receive, send):
+        with timer("parse"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(TimingMiddleware(app)({"type": "http", "method": "GET"}, None, send))
+    headers = dict(sent[0]["headers"])
+    assert headers[b"server-timing"].startswith(b"parse;dur=")
+    assert _timings.get() is None
@@ -1,8 +1,16 @@
 from decimal import Decimal
 
+import numpy as np
 import pytest
 
-from src.core.normalizers import ExponentialMovingAverage
+from src.core.normalizers import (
+    ExponentialMovingAverage,
+    RunningMeanVariance,
+    RunningMinMax,
+    SlidingWindowQuantile,
+    min_max,
+    z_score,
+)
 
 
 @pytest.fixture
@@ -33,3 +41,69 @@ def test_mean_update(EMA):
 def test_mean_normalize(EMA):
     EMA.update(new_value=Decimal("100"))
     assert EMA.normalize(value=Decimal("50")) == Decimal("-0.5")
+
+
+def test_min_max():
+    assert min_max(np.array([10.0, 20.0, 15.0])).tolist() == [0.0, 1.0, 0.5]
+
+
+def test_z_score():
+    normalized = z_score(np.array([1.0, 2.0, 3.0]))
+    assert normalized.mean() == 0
+    assert np.isclose(normalized.std(), 1)
+
+
+def test_constant_column():
+    assert min_max(np.array([5.0, 5.0])).tolist() == [0.0, 0.0]
+    assert z_score(np.array([5.0, 5.0])).tolist() == [0.0, 0.0]
+
+
+def test_empty_column():
+    assert len(min_max(np.array([]))) == len(z_score(np.array([]))) == 0
+
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(0).normal(500, 120, size=1000)
+
+
+@pytest.mark.parametrize("normalizer, normalize", [(RunningMinMax, min_max), (RunningMeanVariance, z_score)])
+def test_running_normalizer_matches_batch(normalizer, normalize, values):
+    one_by_one, in_batches = normalizer(), normalizer()
+    for value in values:
+        one_by_one.update(value)
+    for batch in np.array_split(values, 7):
+        in_batches.update_many(batch)
+    assert np.allclose(one_by_one.normalize(values), normalize(values))
+    assert np.allclose(in_batches.normalize(values), normalize(values))
+
+
+def test_running_mean_variance(values):
+    normalizer = RunningMeanVariance()
+    normalizer.update_many(values)
+    assert np.isclose(normalizer.mean, values.mean())
+    assert np.isclose(normalizer.variance, values.var())
+
+
+def test_running_normalizer_without_values():
+    assert RunningMinMax().normalize([1.0]).tolist() == [0.0]
+    assert RunningMeanVariance().normalize([1.0]).tolist() == [0.0]
+
+
+@pytest.mark.parametrize("batch", [1, 10, 100])
+@pytest.mark.parametrize("rounding", [None, 100])
+def test_sliding_window_quantile(batch, rounding, values):
+    if rounding:
+        values = np.round(values / rounding)  # many equal values enter and leave the window
+    normalizer = SlidingWindowQuantile(window=50, quantile=0.9)
+    for start in range(0, len(values), batch):
+        normalizer.update_many(values[start : start + batch])
+        window = values[max(0, start + batch - 50) : start + batch]
+        assert np.isclose(normalizer.value, np.quantile(window, 0.9))
+
+
+def test_sliding_window_quantile_normalize():
+    normalizer = SlidingWindowQuantile(window=3)
+    normalizer.update_many([100.0, 1.0, 200.0, 300.0])
+    assert normalizer.value == 200
+    assert normalizer.normalize([100.0]).tolist() == [-0.5]
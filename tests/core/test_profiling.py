@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# the executor imports `core.profiling`, the middleware must share its context variable
+from core.executors import BoundedExecutor
+from core.profiling import ProfilingMiddleware, RequestProfile, Sampler
+
+
+def busy(seconds=0.05):
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        sum(range(100))
+
+
+def test_samples_job_stacks():
+    profile = RequestProfile("test")
+    sampler = Sampler(interval=0.001)
+    sampler.start(profile)
+    try:
+        profile.run(busy)
+    finally:
+        sampler.stop(profile)
+        profile.finish()
+
+    assert profile.stacks
+    assert all(stack[0][1] == "busy" for stack in profile.stacks)
+    assert profile.hot_functions(files=["test_profiling.py"])[0][0] == "test_profiling.py:busy"
+    assert profile.hot_functions(files=["api/processors.py"]) == []
+
+
+def test_one_cprofile_at_a_time():
+    first = RequestProfile("first", deterministic=True)
+    second = RequestProfile("second", deterministic=True)
+    assert first.cprofile is not None
+    assert second.cprofile is None
+
+    first.finish()
+    third = RequestProfile("third", deterministic=True)
+    assert third.cprofile is not None
+    third.finish()
+
+
+def test_dump(tmp_path):
+    profile = RequestProfile("test", deterministic=True)
+    profile.run(busy, 0.001)
+    profile.stacks[(("a.py", "outer"), ("b.py", "inner"))] = 3
+    profile.finish()
+    profile.dump(tmp_path / "profiles")
+
+    assert sorted(path.name for path in (tmp_path / "profiles").iterdir()) == [
+        "test.collapsed",
+        "test.pstats",
+        "test.txt",
+    ]
+    assert (tmp_path / "profiles" / "test.collapsed").read_text() == "a.py:outer;b.py:inner 3\n"
+    assert "b.py:inner" in (tmp_path / "profiles" / "test.txt").read_text()
+
+
+def call(middleware, query_string=b"", headers=()):
+    executor = BoundedExecutor(ThreadPoolExecutor(max_workers=1), max_concurrency=1)
+
+    async def app(scope, receive, send):
+        await executor.run(busy, 0.02)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "query_string": query_string, "headers": list(headers)}
+    asyncio.run(ProfilingMiddleware(app, **middleware)(scope, None, send))
+    return dict(sent[0]["headers"]).get(b"x-profile")
+
+
+def test_middleware_requested_with_token(tmp_path):
+    middleware = {"directory": str(tmp_path), "token": "secret", "interval": 0.001}
+    assert call(middleware, b"profile=1") is None
+    assert call(middleware, b"profile=1", [(b"x-admin-token", b"wrong")]) is None
+
+    id_ = call(middleware, b"profile=1", [(b"x-admin-token", b"secret")]).decode()
+    assert (tmp_path / f"{id_}.pstats").exists()
+    assert "busy" in (tmp_path / f"{id_}.collapsed").read_text()
+
+
+def test_middleware_sampled(tmp_path):
+    assert call({"directory": str(tmp_path), "sample_rate": 0.0}) is None
+    id_ = call({"directory": str(tmp_path), "sample_rate": 1.0}).decode()
+    assert not (tmp_path / f"{id_}.pstats").exists()
+    assert (tmp_path / f"{id_}.txt").exists()
+
+
+def test_middleware_writes_profiles_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+    monkeypatch.setattr(RequestProfile, "dump", lambda profile, directory: threads.append(threading.get_ident()))
+    assert call({"directory": str(tmp_path), "sample_rate": 1.0}) is not None
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,15 @@
+import os
+
+from src.core.settings import Settings
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("AVIASALES_PARSE_CACHE_TTL", "1.5")
+    assert Settings.from_env().parse_cache_ttl == 1.5
+
+
+def test_settings_defaults(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith("AVIASALES_"):
+            monkeypatch.delenv(name)
+    assert Settings.from_env() == Settings()
@@ -0,0 +1,31 @@
+import re
+from datetime import datetime
+
+import pytest
+
+from src.core.types import TIMESTAMP_FORMAT, parse_timestamp
+
+
+def test_parse_timestamp_matches_strptime(rsvia3xml, rsviaowxml):
+    for xml in (rsvia3xml, rsviaowxml):
+        for value in set(re.findall(rb"<(?:Departure|Arrival)TimeStamp>(.*?)<", xml[1])):
+            value = value.decode()
+            assert parse_timestamp(value) == datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+@pytest.mark.parametrize("value", ["2018-1-2T0005", "2018-10-22T005"])
+def test_parse_timestamp_falls_back_to_strptime(value):
+    assert parse_timestamp(value) == datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+@pytest.mark.parametrize("value", ["2018-13-22T0005", "2018-10-22T2405", "2018-10-22 0005", ""])
+def test_parse_timestamp_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_parse_timestamp_is_memoized():
+    parse_timestamp("2018-10-22T0005")
+    hits = parse_timestamp.cache_info().hits
+    assert parse_timestamp("2018-10-22T0005") is parse_timestamp("2018-10-22T0005")
+    assert parse_timestamp.cache_info().hits == hits + 2
@@ -0,0 +1,206 @@
+import asyncio
+import gzip
+import pickle
+import zlib
+from io import BytesIO
+
+import lxml.etree as ET
+import pytest
+from fastapi import HTTPException
+
+from src.core.uploads import (
+    DecompressionMiddleware,
+    InvalidXMLError,
+    UploadLimitMiddleware,
+    ZlibDecoder,
+    check_well_formed,
+    sniff_root,
+    xml_parser,
+)
+
+
+@pytest.mark.parametrize(
+    "content, root",
+    [
+        (
+            b'<?xml version="1.0" encoding="utf-8"?>\n<!-- comment -->\n<AirFareSearchResponse><Flights/>',
+            "AirFareSearchResponse",
+        ),
+        (b"\xef\xbb\xbf<Other>", "Other"),
+        (b"\x00\x00\x01\x00 not xml at all", None),
+        (b"<?xml version='1.0'?>", None),
+        (b"", None),
+    ],
+)
+def test_sniff_root(content, root):
+    file = BytesIO(content)
+    assert sniff_root(file) == root
+    assert file.tell() == 0
+
+
+def test_sniff_root_reads_a_prefix():
+    file = BytesIO(b" " * 2**20 + b"<AirFareSearchResponse/>")
+    assert sniff_root(file, max_bytes=2**10) is None
+    assert sniff_root(file, max_bytes=2**21) == "AirFareSearchResponse"
+
+
+def test_check_well_formed(rsvia3xml):
+    file = BytesIO(rsvia3xml[1])
+    check_well_formed(file)
+    assert file.tell() == 0
+
+    file = BytesIO(rsvia3xml[1][: len(rsvia3xml[1]) // 2])
+    with pytest.raises(InvalidXMLError, match="Premature end of data"):
+        check_well_formed(file)
+    assert file.tell() == 0
+
+
+def test_invalid_xml_error_pickles():
+    error = pickle.loads(pickle.dumps(InvalidXMLError("Premature end of data")))
+    assert str(error) == "Premature end of data"
+
+
+def test_entities_are_not_expanded():
+    content = b"""<!DOCTYPE root [<!ENTITY lol "lol"><!ENTITY lol2 "&lol;&lol;&lol;">]><root>&lol2;</root>"""
+    root = ET.fromstring(content, parser=xml_parser())
+    assert root.text is None
+    assert [node.tag for node in root] == [ET.Entity]  # kept as a reference
+
+
+def test_external_entities_are_not_loaded(tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("secret")
+    content = f'<!DOCTYPE root [<!ENTITY secret SYSTEM "file://{secret}">]><root>&secret;</root>'.encode()
+    root = ET.fromstring(content, parser=xml_parser())
+    assert root.text is None
+    assert [node.tag for node in root] == [ET.Entity]
+
+
+def call(max_bytes, chunks, headers=()):
+    read = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            read.append(message["body"])
+            if not message["more_body"]:
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = iter({"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks)
+
+    async def receive():
+        return next(messages, {"type": "http.request", "body": b"", "more_body": False})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "headers": list(headers)}
+    asyncio.run(UploadLimitMiddleware(app, max_bytes)(scope, receive, send))
+    return sent[0]["status"], read
+
+
+def test_limit_content_length():
+    status, read = call(10, [b"x" * 11], headers=[(b"content-length", b"11")])
+    assert status == 413
+    assert read == []
+
+
+def test_limit_streamed_body():
+    assert call(10, [b"x" * 5, b"x" * 5])[0] == 200
+    with pytest.raises(HTTPException) as error:
+        call(10, [b"x" * 5, b"x" * 5, b"x"])
+    assert error.value.status_code == 413
+
+
+def test_no_limit():
+    assert call(0, [b"x" * 100])[0] == 200
+
+
+def test_gzip_decoder():
+    data = b"<AirFareSearchResponse/>" * 10_000
+    compressed = gzip.compress(data) + gzip.compress(b"tail")
+    decoder = ZlibDecoder(chunk_size=1024)
+    chunks = [
+        chunk for start in range(0, len(compressed), 100) for chunk in decoder.decode(compressed[start : start + 100])
+    ]
+    decoder.finish()
+    assert b"".join(chunks) == data + b"tail"
+    assert max(map(len, chunks)) <= 1024
+
+
+def test_deflate_decoder():
+    decoder = ZlibDecoder(wbits=zlib.MAX_WBITS)
+    assert b"".join(decoder.decode(zlib.compress(b"data"))) == b"data"
+    decoder.finish()
+
+
+def test_gzip_decoder_rejects_bad_data():
+    decoder = ZlibDecoder()
+    list(decoder.decode(gzip.compress(b"data")[:-4]))
+    with pytest.raises(ValueError):
+        decoder.finish()
+    with pytest.raises(ValueError):
+        list(ZlibDecoder().decode(b"not gzip"))
+
+
+def test_zstd_decoder():
+    zstandard = pytest.importorskip("zstandard")
+    from src.core.uploads import ZstdDecoder
+
+    data = b"<AirFareSearchResponse/>" * 10_000
+    compressed = zstandard.ZstdCompressor().compress(data) * 2
+    decoder = ZstdDecoder()
+    assert b"".join(decoder.decode(compressed)) == data * 2
+    decoder.finish()
+
+    truncated = ZstdDecoder()
+    list(truncated.decode(compressed[:100]))
+    with pytest.raises(ValueError):
+        truncated.finish()
+
+
+def decompress(chunks, encoding):
+    body = []
+    headers = {}
+
+    async def app(scope, receive, send):
+        headers.update(scope["headers"])
+        while True:
+            message = await receive()
+            body.append(message["body"])
+            if not message["more_body"]:
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = iter([*({"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks[:-1])])
+    last = {"type": "http.request", "body": chunks[-1], "more_body": False}
+
+    async def receive():
+        return next(messages, last)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-encoding", encoding), (b"content-length", b"1")]}
+    asyncio.run(DecompressionMiddleware(app)(scope, receive, send))
+    return sent[0]["status"], b"".join(body), headers
+
+
+def test_decompression_middleware():
+    compressed = gzip.compress(b"x" * 100_000)
+    status, body, headers = decompress([compressed[:10], compressed[10:]], b"gzip")
+    assert (status, body) == (200, b"x" * 100_000)
+    assert headers == {}  # neither the encoding nor the length of the body hold any more
+
+    assert decompress([b"x"], b"identity")[:2] == (200, b"x")
+    assert decompress([b"x"], b"br")[0] == 415
+    with pytest.raises(HTTPException) as error:
+        decompress([compressed[:-10]], b"gzip")
+    assert error.value.status_code == 400